@@ -1,5 +1,8 @@
 import streamlit as st
-from ui_components import home_page, unet_page, deeplabv_page, model_comparison_page, application_and_future_page
+from inference_server import INFERENCE_SERVER
+from instrumentation import METRICS_PORT, start_metrics_server
+from model_registry import PREWARM_MODEL, registry
+from ui_components import home_page, unet_page, deeplabv_page, model_comparison_page, application_and_future_page, diagnostics_panel
 
 # Main function to control the app flow
 def main():
@@ -17,5 +20,13 @@ def main():
     elif page == "Application and Future":
         application_and_future_page()
 
+    diagnostics_panel()
+
 if __name__ == "__main__":
+    # Prometheus metrics on http://127.0.0.1:<port>/metrics when AQUASENSE_METRICS_PORT is set
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT))
+    # Load the default model in the background while the first page renders
+    if PREWARM_MODEL and not INFERENCE_SERVER:
+        registry.prewarm(PREWARM_MODEL)
     main()
\ No newline at end of file
@@ -0,0 +1,245 @@
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+import numpy as np
+import cv2
+from PIL import Image
+from instrumentation import stage
+from masks import PackedMask
+from render import WATER_COLOR
+
+# Encoded downloads kept in memory, so reruns and repeated clicks don't re-encode
+ENCODED_CACHE_MB = float(os.environ.get("AQUASENSE_ENCODED_CACHE_MB", 64))
+# Artifacts too large for the memory tier (full-resolution overlays, ZIP bundles) are kept on disk
+ENCODED_DISK_MB = float(os.environ.get("AQUASENSE_ENCODED_DISK_MB", 2048))
+ENCODED_CACHE_DIR = os.environ.get("AQUASENSE_ENCODED_CACHE_DIR",
+                                   os.path.join(tempfile.gettempdir(), "aquasense_downloads"))
+
+# codec -> (file extension, MIME type)
+IMAGE_CODECS = {
+    "png": (".png", "image/png"),
+    "jpeg": (".jpg", "image/jpeg"),
+    "webp": (".webp", "image/webp")
+}
+# zlib level 1 is several times faster than Pillow's default of 6 at a small size cost
+DEFAULT_PNG_LEVEL = 1
+DEFAULT_QUALITY = 90
+
+
+def encode_image(array, codec="png", level=DEFAULT_PNG_LEVEL, quality=DEFAULT_QUALITY):
+    # RGB uint8 array to file bytes; OpenCV's encoders are faster than Pillow's
+    if codec == "png":
+        params = [cv2.IMWRITE_PNG_COMPRESSION, int(level)]
+    elif codec == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    elif codec == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    else:
+        raise ValueError(f"Unknown codec: {codec}")
+    with stage(f"encode_{codec}"):
+        ok, data = cv2.imencode(IMAGE_CODECS[codec][0], cv2.cvtColor(np.asarray(array), cv2.COLOR_RGB2BGR), params)
+    if not ok:
+        raise RuntimeError(f"Could not encode image as {codec}")
+    return data.tobytes()
+
+
+def encode_mask(mask, level=DEFAULT_PNG_LEVEL, color=WATER_COLOR):
+    # 1-bit palette PNG: renders like the RGB colored mask at a fraction of the size and encode time
+    packed = isinstance(mask, PackedMask)
+    if not packed:
+        mask = np.asarray(mask)
+    height, width = mask.shape
+    with stage("encode_png"):
+        if packed and width % 8 == 0:
+            # Row-major packed bits already are the PNG rows when rows end on a byte boundary
+            bits = mask.bits.reshape(height, width // 8)
+        else:
+            bits = np.packbits((mask.to_array() if packed else mask) > 0, axis=1)
+        image = Image.frombytes("P", (width, height), bits.tobytes(), "raw", "P;1")
+        image.putpalette([0, 0, 0, *(int(c) for c in color)])
+        buffered = io.BytesIO()
+        image.save(buffered, format="PNG", compress_level=int(level))
+    return buffered.getvalue()
+
+
+def _nbytes(data):
+    # Encoded bytes, arrays such as packed masks, or tables as lists of row dicts
+    if hasattr(data, "nbytes"):
+        return data.nbytes
+    if isinstance(data, list):
+        return sys.getsizeof(data) + sum(sys.getsizeof(row) for row in data)
+    return len(data)
+
+
+class EncodedCache:
+    """Byte-bounded LRU of encoded artifacts, keyed by the result and encoding settings.
+
+    Artifacts up to max_memory_mb are kept in memory. Larger encoded bytes go
+    to an on-disk LRU of max_disk_mb, so large scenes aren't re-rendered and
+    re-encoded on every rerun either; disk_dir=None disables that tier.
+    """
+
+    def __init__(self, max_memory_mb=ENCODED_CACHE_MB, disk_dir=ENCODED_CACHE_DIR, max_disk_mb=ENCODED_DISK_MB):
+        self.max_bytes = int(max_memory_mb * 1024 * 1024)
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk = None  # file name -> size, least recently used first; scanned on first use
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+    def get_or_encode(self, key, encode):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+        data = self._read_disk(key)
+        if data is not None:
+            return data
+        data = encode()
+        with self._lock:
+            if key not in self._entries and _nbytes(data) <= self.max_bytes:
+                self._entries[key] = data
+                self._bytes += _nbytes(data)
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= _nbytes(evicted)
+                return data
+        if isinstance(data, bytes):
+            self._write_disk(key, [data])
+        return data
+
+    def get_or_stream(self, key, chunks):
+        """Bytes of a chunked artifact such as stream_zip(...), written to the disk tier chunk by chunk.
+
+        chunks is a callable returning the chunk iterator, only called on a miss.
+        """
+        data = self._read_disk(key)
+        if data is None and self._write_disk(key, chunks()):
+            data = self._read_disk(key)
+        if data is None:
+            # No disk tier, or the artifact is larger than it
+            data = self.get_or_encode(key, lambda: b"".join(chunks()))
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _disk_index(self):
+        # Called with the lock held; files from earlier runs count against the budget, oldest first
+        if self._disk is None:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            found = []
+            for name in os.listdir(self.disk_dir):
+                if not name.endswith(".tmp"):
+                    stat = os.stat(os.path.join(self.disk_dir, name))
+                    found.append((stat.st_mtime, name, stat.st_size))
+            self._disk = OrderedDict((name, size) for _, name, size in sorted(found))
+            self._disk_bytes = sum(self._disk.values())
+        return self._disk
+
+    @staticmethod
+    def _disk_name(key):
+        return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        name = self._disk_name(key)
+        with self._lock:
+            if name not in self._disk_index():
+                return None
+            self._disk.move_to_end(name)
+        try:
+            with open(os.path.join(self.disk_dir, name), "rb") as f:
+                return f.read()
+        except OSError:
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(name, 0)
+            return None
+
+    def _write_disk(self, key, chunks):
+        # Streams chunks to a file; False when there is no disk tier or the artifact doesn't fit it
+        if not self.disk_dir:
+            return False
+        name = self._disk_name(key)
+        path = os.path.join(self.disk_dir, name)
+        with self._lock:
+            self._disk_index()
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+                    if size > self.max_disk_bytes:
+                        break
+            if size > self.max_disk_bytes:
+                os.remove(tmp_path)
+                return False
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        with self._lock:
+            self._disk_bytes += size - self._disk.pop(name, 0)
+            self._disk[name] = size
+            while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+                victim, victim_size = self._disk.popitem(last=False)
+                self._disk_bytes -= victim_size
+                try:
+                    os.remove(os.path.join(self.disk_dir, victim))
+                except OSError:
+                    pass
+        return True
+
+
+encoded_cache = EncodedCache()
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only, non-seekable target: zipfile falls back to data descriptors and never seeks back
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def stream_zip(entries):
+    """Yields a ZIP archive chunk by chunk.
+
+    entries are (name, data) pairs where data is bytes or a callable returning
+    bytes, so each artifact is only encoded when the archive reaches it. Images
+    are already compressed and are stored as-is.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, data in entries:
+            archive.writestr(name, data() if callable(data) else data)
+            yield from sink.drain()
+    yield from sink.drain()
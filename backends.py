@@ -0,0 +1,131 @@
+import os
+import threading
+import numpy as np
+import tensorflow as tf
+
+
+class TFLiteModel:
+    """TFLite interpreter behind the subset of the Keras model API used by the pipeline."""
+
+    def __init__(self, path, num_threads=None):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found, run export_models.py first")
+        self.path = path
+        self.interpreter = tf.lite.Interpreter(model_path=path, num_threads=num_threads or os.cpu_count())
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.input_shape = tuple(None if dim < 0 else int(dim) for dim in self._input["shape_signature"])
+        self.size_bytes = os.path.getsize(path)
+        self.weights = []
+        self._batch = None
+        # An interpreter must not be invoked from several threads at once
+        self._lock = threading.Lock()
+
+    def predict(self, x, batch_size=None, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+        if not len(x):
+            return np.empty((0, *self._output["shape"][1:]), dtype=self._output["dtype"])
+        step = batch_size or len(x)
+        outputs = []
+        with self._lock:
+            for start in range(0, len(x), step):
+                outputs.append(self._invoke(x[start:start + step]))
+        return np.concatenate(outputs, axis=0)
+
+    def __call__(self, x, training=False):
+        return self.predict(x)
+
+    def _invoke(self, batch):
+        if self._batch != len(batch):
+            # Tensors are only reallocated when the batch size changes
+            self.interpreter.resize_tensor_input(self._input["index"], [len(batch), *self._input["shape"][1:]])
+            self.interpreter.allocate_tensors()
+            self._batch = len(batch)
+        self.interpreter.set_tensor(self._input["index"], np.ascontiguousarray(batch))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self._output["index"])
+
+
+# Batch sizes with their own compiled signature; other sizes are padded up to the next one
+COMPILED_BATCH_SIZES = (1, 2, 4, 8, 16)
+PRECISIONS = {"float32": None, "bfloat16": "mixed_bfloat16"}
+_policy_lock = threading.Lock()
+
+
+def with_precision(model, precision):
+    # Rebuilds the model with a mixed precision policy: bfloat16 compute, float32 weights
+    policy = PRECISIONS[precision]
+    if policy is None:
+        return model
+
+    def clone_layer(layer):
+        config = layer.get_config()
+        if not isinstance(layer, tf.keras.layers.InputLayer):
+            config["dtype"] = policy
+        return layer.__class__.from_config(config)
+
+    # Sublayers built inside custom layers pick up the global policy
+    with _policy_lock:
+        previous = tf.keras.mixed_precision.global_policy()
+        tf.keras.mixed_precision.set_global_policy(policy)
+        try:
+            clone = tf.keras.models.clone_model(model, clone_function=clone_layer)
+        finally:
+            tf.keras.mixed_precision.set_global_policy(previous)
+    clone.set_weights(model.get_weights())
+    return clone
+
+
+class CompiledModel:
+    """Keras model behind a tf.function per fixed batch size, bypassing the generic predict loop.
+
+    Inputs are float32 and padded up to the nearest compiled batch size, so
+    the graph is traced once per size instead of on every new batch length.
+    jit_compile runs the graphs through XLA.
+    """
+
+    def __init__(self, model, jit_compile=False, precision="float32", batch_sizes=COMPILED_BATCH_SIZES):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision}")
+        self.model = with_precision(model, precision)
+        self.jit_compile = jit_compile
+        self.precision = precision
+        self.batch_sizes = tuple(sorted(batch_sizes))
+        self.input_shape = model.input_shape
+        self.weights = self.model.weights
+        self._functions = {}
+        self._lock = threading.Lock()
+
+    def _function(self, batch_size):
+        function = self._functions.get(batch_size)
+        if function is None:
+            with self._lock:
+                function = self._functions.get(batch_size)
+                if function is None:
+                    model = self.model
+                    spec = tf.TensorSpec((batch_size, *self.input_shape[1:]), tf.float32)
+                    function = tf.function(lambda x: tf.cast(model(x, training=False), tf.float32),
+                                           input_signature=[spec], jit_compile=self.jit_compile)
+                    self._functions[batch_size] = function
+        return function
+
+    def predict(self, x, batch_size=None, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+        if not len(x):
+            return np.empty((0, *self.model.output_shape[1:]), dtype=np.float32)
+        largest = self.batch_sizes[-1]
+        step = min(batch_size or len(x), largest)
+        outputs = []
+        for start in range(0, len(x), step):
+            batch = x[start:start + step]
+            count = len(batch)
+            size = next(size for size in self.batch_sizes if size >= count)
+            if size != count:
+                padded = np.zeros((size, *batch.shape[1:]), dtype=np.float32)
+                padded[:count] = batch
+                batch = padded
+            outputs.append(self._function(size)(batch).numpy()[:count])
+        return np.concatenate(outputs, axis=0)
+
+    def __call__(self, x, training=False):
+        return self.predict(x)
@@ -0,0 +1,89 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import current_rss_mb
+from export_models import calibration_images
+from utils import IMG_SIZE, MODEL_PATHS, available_backends, load_keras_model, preprocess_batch
+
+
+def iou(a, b):
+    union = np.logical_or(a, b).sum()
+    return 1.0 if union == 0 else float(np.logical_and(a, b).sum() / union)
+
+
+def load_inputs(images_dir, count):
+    if images_dir:
+        images = [Image.open(path).convert("RGB") for path in calibration_images(images_dir, count)]
+        batch, _ = preprocess_batch(images)
+        return batch
+    rng = np.random.default_rng(0)
+    return rng.random((count, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+
+
+def bench_backend(model_name, backend, inputs, batch_size, repeats):
+    gc.collect()
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    model = load_keras_model(model_name, backend)
+    load_time = time.perf_counter() - start
+    model.predict(inputs[:batch_size], verbose=0)  # warm-up
+    rss_after = current_rss_mb()
+
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict(inputs[:batch_size], verbose=0)
+        latencies.append(time.perf_counter() - start)
+    probabilities = model.predict(inputs, batch_size=batch_size, verbose=0)
+    del model
+    return {
+        "model": model_name,
+        "backend": backend,
+        "load_s": load_time,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "rss_mb": None if rss_before is None else rss_after - rss_before,
+    }, probabilities > 0.5
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare exported backends with the Keras baseline.")
+    parser.add_argument("--model", choices=["all", *MODEL_PATHS], default="all")
+    parser.add_argument("--images", help="Evaluation images, random inputs are used when omitted")
+    parser.add_argument("--count", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args(argv)
+
+    inputs = load_inputs(args.images, args.count)
+    models = list(MODEL_PATHS) if args.model == "all" else [args.model]
+    report = []
+    print(f"{'model':<12} {'backend':<12} {'load s':>7} {'p50 ms':>8} {'p99 ms':>8} {'RSS MB':>8} {'IoU':>7}")
+    for model_name in models:
+        baseline = None
+        for backend in available_backends(model_name):
+            row, masks = bench_backend(model_name, backend, inputs, args.batch_size, args.repeats)
+            if baseline is None:
+                baseline = masks  # keras is always listed first
+            row["iou_vs_keras"] = iou(masks, baseline)
+            report.append(row)
+            rss = "n/a" if row["rss_mb"] is None else f"{row['rss_mb']:.1f}"
+            print(f"{model_name:<12} {backend:<12} {row['load_s']:>7.2f} {row['p50_ms']:>8.1f} "
+                  f"{row['p99_ms']:>8.1f} {rss:>8} {row['iou_vs_keras']:>7.4f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import load_model_or_stand_in
+from cascade import UNCERTAINTY_MARGIN, predict_cascade
+from tiling import predict_tiled
+from utils import IMG_SIZE, MODEL_PATHS
+
+
+def scene(size, seed=0):
+    # A few large lakes and a river over textured land, most tiles far from any shore
+    rng = np.random.default_rng(seed)
+    image = np.empty((size, size, 3), dtype=np.uint8)
+    image[:] = (110, 120, 80)
+    image += rng.integers(0, 40, (size, size, 3), dtype=np.uint8)
+    water = np.zeros((size, size), dtype=np.uint8)
+    for _ in range(3):
+        center = tuple(int(c) for c in rng.integers(size // 8, size - size // 8, 2))
+        axes = tuple(int(a) for a in rng.integers(size // 16, size // 6, 2))
+        cv2.ellipse(water, center, axes, float(rng.integers(0, 180)), 0, 360, 1, -1)
+    points = np.stack([np.linspace(0, size, 12), size / 2 + rng.normal(0, size / 10, 12)], axis=1).astype(np.int32)
+    cv2.polylines(water, [points], False, 1, max(3, size // 200))
+    image[water > 0] = (40, 70, 140)
+    return image
+
+
+def colour_stand_in():
+    # Confident colour rule (blue over red) with a little spatial context, for offline runs
+    import tensorflow as tf
+    inputs = tf.keras.Input((IMG_SIZE, IMG_SIZE, 3))
+    x = tf.keras.layers.Conv2D(1, 1, use_bias=True)(inputs)
+    x = tf.keras.layers.AveragePooling2D(3, strides=1, padding="same")(x)
+    outputs = tf.keras.layers.Activation("sigmoid")(x)
+    model = tf.keras.Model(inputs, outputs)
+    model.layers[1].set_weights([np.array([-20.0, 0.0, 20.0], dtype=np.float32).reshape(1, 1, 3, 1),
+                                 np.array([-2.6], dtype=np.float32)])
+    return model
+
+
+def iou(a, b):
+    union = np.logical_or(a, b).sum()
+    return 1.0 if union == 0 else float(np.logical_and(a, b).sum() / union)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Coarse-to-fine cascade against full tiled inference.")
+    parser.add_argument("--model", choices=list(MODEL_PATHS), default="U-Net")
+    parser.add_argument("--stand-in", action="store_true", help="Use a colour-rule stand-in model even if weights exist")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2048, 4096])
+    parser.add_argument("--margin", type=float, default=UNCERTAINTY_MARGIN)
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args(argv)
+
+    if args.stand_in or not os.path.exists(MODEL_PATHS[args.model]):
+        model = colour_stand_in()
+    else:
+        model, _ = load_model_or_stand_in(args.model)
+    model.predict(np.zeros((1, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32), verbose=0)  # warm-up
+
+    report = []
+    print(f"{'size':>6} {'tiles':>6} {'refined':>8} {'full s':>7} {'cascade s':>10} {'speedup':>8} {'est.':>6} {'IoU':>7}")
+    for size in args.sizes:
+        image = scene(size)
+        start = time.perf_counter()
+        full = predict_tiled(model, image)
+        full_seconds = time.perf_counter() - start
+        probabilities, stats = predict_cascade(model, image, margin=args.margin)
+        row = {
+            "size": size,
+            "tiles": stats["tiles"],
+            "refined_fraction": stats["refined_fraction"],
+            "full_s": full_seconds,
+            "cascade_s": stats["seconds"],
+            "speedup": full_seconds / stats["seconds"],
+            "estimated_speedup": stats["estimated_speedup"],
+            "iou_vs_full": iou(probabilities > 0.5, full > 0.5)
+        }
+        report.append(row)
+        print(f"{size:>6} {row['tiles']:>6} {row['refined_fraction']:>8.1%} {row['full_s']:>7.2f} "
+              f"{row['cascade_s']:>10.2f} {row['speedup']:>7.2f}x {row['estimated_speedup']:>5.2f}x "
+              f"{row['iou_vs_full']:>7.4f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
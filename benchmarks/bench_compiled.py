@@ -0,0 +1,53 @@
+import argparse
+import json
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import CompiledModel
+from benchmarks.common import load_model_or_stand_in, p50_ms, synthetic_image
+from utils import COMPILED_BACKENDS, IMG_SIZE, MODEL_PATHS, preprocess_batch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latency of the compiled predict paths against Keras model.predict.")
+    parser.add_argument("--model", choices=list(MODEL_PATHS), default="U-Net")
+    parser.add_argument("--stand-in", action="store_true", help="Use a small stand-in model even if weights exist")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args(argv)
+
+    model, _ = load_model_or_stand_in(args.model, force_stand_in=args.stand_in)
+    paths = {"keras": model}
+    for backend, options in COMPILED_BACKENDS.items():
+        paths[backend] = CompiledModel(model, **options)
+
+    report = []
+    print(f"{'batch':>5} {'path':<14} {'p50 ms':>8} {'speedup':>8} {'max diff':>9}")
+    for batch_size in args.batch_sizes:
+        batch, _ = preprocess_batch([synthetic_image(IMG_SIZE, seed) for seed in range(batch_size)])
+        # The previous single-image path fed float64 straight from img / 255.0
+        legacy = batch.astype(np.float64)
+        reference = np.asarray(model.predict(batch, verbose=0), dtype=np.float32)
+        base = p50_ms(lambda: model.predict(legacy, verbose=0), args.repeats)
+        rows = [("keras-float64", base, 0.0)]
+        for name, path in paths.items():
+            latency = p50_ms(lambda: path.predict(batch, verbose=0), args.repeats)
+            difference = float(np.abs(np.asarray(path.predict(batch, verbose=0), dtype=np.float32) - reference).max())
+            rows.append((name, latency, difference))
+        for name, latency, difference in rows:
+            report.append({"batch_size": batch_size, "path": name, "p50_ms": latency,
+                           "speedup": base / latency, "max_abs_diff": difference})
+            print(f"{batch_size:>5} {name:<14} {latency:>8.1f} {base / latency:>7.2f}x {difference:>9.1e}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
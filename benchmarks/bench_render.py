@@ -0,0 +1,54 @@
+import argparse
+import os
+import sys
+import tracemalloc
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import p50_ms
+from render import RenderBuffers, render_results
+from utils import IMG_SIZE, postprocess_prediction, create_mask_visualization, create_overlay
+
+
+def legacy_render(image, prediction, original_size):
+    mask_image = postprocess_prediction(prediction, original_size)
+    colored_mask = create_mask_visualization(mask_image)
+    overlay_image = create_overlay(image, mask_image)
+    return mask_image, colored_mask, overlay_image
+
+
+def measure(fn, repeats):
+    # Median latency in ms and peak traced allocation of one more call
+    latency = p50_ms(fn, repeats)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latency, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the legacy rendering chain with the fused render_results kernel.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 4096])
+    parser.add_argument("--water", type=float, nargs="+", default=[0.1, 0.6], help="Water fractions to test")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    print(f"{'size':>6} {'water':>6} {'legacy ms':>10} {'fused ms':>9} {'legacy MB':>10} {'fused MB':>9}")
+    for size in args.sizes:
+        image_array = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+        image = Image.fromarray(image_array)
+        for water in args.water:
+            prediction = (rng.random((1, IMG_SIZE, IMG_SIZE, 1)) < water).astype(np.float32)
+            buffers = RenderBuffers()
+            legacy_time, legacy_peak = measure(lambda: legacy_render(image, prediction, (size, size)), args.repeats)
+            fused_time, fused_peak = measure(lambda: render_results(image_array, prediction, buffers=buffers), args.repeats)
+            print(f"{size:>6} {water:>6.2f} {legacy_time:>10.1f} {fused_time:>9.1f} "
+                  f"{legacy_peak / 2**20:>10.1f} {fused_peak / 2**20:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
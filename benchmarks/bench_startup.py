@@ -0,0 +1,122 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils import MODEL_PATHS
+
+# Modules on the page-rendering path; none of them may pull in TensorFlow
+LIGHT_MODULES = ["ui_components", "model_registry", "tiling", "prediction_cache", "segment_cli"]
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+try:
+    import {module}
+    error = None
+except ImportError as e:
+    error = str(e)
+elapsed = time.perf_counter() - start
+from instrumentation import current_rss_mb
+print(json.dumps({{"import_s": elapsed, "rss_mb": current_rss_mb(), "error": error,
+                  "tensorflow_imported": "tensorflow" in sys.modules}}))
+"""
+
+FIRST_INFERENCE_PROBE = """
+import json, time
+start = time.perf_counter()
+from benchmarks.common import stand_in_loader, synthetic_image
+from model_registry import ModelRegistry
+from utils import load_keras_model, predict_probabilities_batch
+from PIL import Image
+registry = ModelRegistry(loader=stand_in_loader if {stand_in} else load_keras_model)
+model = registry.get({model!r}, "keras")
+ready = time.perf_counter() - start
+image = Image.fromarray(synthetic_image(1024))
+t0 = time.perf_counter()
+predict_probabilities_batch(model, [image])
+first_predict = time.perf_counter() - t0
+stats = registry.stats({model!r}, "keras")
+print(json.dumps({{"model_ready_s": ready, "load_s": stats["load_time_s"], "warmup_s": stats["warmup_time_s"],
+                  "first_predict_ms": first_predict * 1000, "total_s": time.perf_counter() - start}}))
+"""
+
+
+def probe(code):
+    # Every probe runs in a fresh interpreter so nothing is already imported or traced
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL="3", PYTHONPATH=ROOT)
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "probe failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def median_of(runs, keys):
+    return {key: float(np.median([run[key] for run in runs])) for key in keys}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import time and time to the first inference.")
+    parser.add_argument("--model", choices=list(MODEL_PATHS), default="U-Net")
+    parser.add_argument("--stand-in", action="store_true", help="Use a small stand-in model even if weights exist")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default="benchmark_startup.json")
+    parser.add_argument("--baseline", help="Compare against this results file and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    stand_in = args.stand_in or not os.path.exists(os.path.join(ROOT, MODEL_PATHS[args.model]))
+    report = {"meta": {"model": "stand-in" if stand_in else args.model}, "imports": {}, "first_inference": None}
+    failures = []
+
+    print(f"{'module':<18} {'import s':>9} {'RSS MB':>8}  tensorflow")
+    for module in LIGHT_MODULES:
+        runs = [probe(IMPORT_PROBE.format(module=module)) for _ in range(args.repeats)]
+        if runs[0]["error"]:
+            print(f"{module:<18} skipped ({runs[0]['error']})")
+            continue
+        result = median_of(runs, ["import_s", "rss_mb"])
+        result["tensorflow_imported"] = any(run["tensorflow_imported"] for run in runs)
+        report["imports"][module] = result
+        print(f"{module:<18} {result['import_s']:>9.3f} {result['rss_mb']:>8.1f}  "
+              f"{'yes' if result['tensorflow_imported'] else 'no'}")
+        if result["tensorflow_imported"]:
+            failures.append(f"{module} imports TensorFlow at module load")
+
+    runs = [probe(FIRST_INFERENCE_PROBE.format(model=args.model, stand_in=stand_in)) for _ in range(args.repeats)]
+    first = report["first_inference"] = median_of(runs, ["model_ready_s", "load_s", "warmup_s", "first_predict_ms", "total_s"])
+    print(f"First inference ({report['meta']['model']}): model ready in {first['model_ready_s']:.2f}s "
+          f"(load {first['load_s']:.2f}s, warm-up {first['warmup_s']:.2f}s), "
+          f"first predict {first['first_predict_ms']:.1f} ms, total {first['total_s']:.2f}s")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("model") != report["meta"]["model"]:
+            print("Warning: baseline was recorded with a different model")
+        for module, result in report["imports"].items():
+            reference = baseline.get("imports", {}).get(module)
+            if reference and result["import_s"] > reference["import_s"] * (1 + args.tolerance):
+                failures.append(f"import {module}: {reference['import_s']:.3f}s -> {result['import_s']:.3f}s")
+        reference = baseline.get("first_inference")
+        if reference and first["total_s"] > reference["total_s"] * (1 + args.tolerance):
+            failures.append(f"first inference: {reference['total_s']:.2f}s -> {first['total_s']:.2f}s")
+
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if failures:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
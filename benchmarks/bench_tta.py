@@ -0,0 +1,46 @@
+import argparse
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import load_model_or_stand_in, p50_ms
+from tta import TTA_MODES, TTAModel, _forward, _inverse
+from utils import IMG_SIZE, MODEL_PATHS
+
+
+def naive_tta(model, x, transforms):
+    # One predict per augmentation, the baseline the batched mode replaces
+    total = 0
+    for turns, flip in transforms:
+        prediction = model.predict(np.ascontiguousarray(_forward(x, turns, flip)), verbose=0)
+        total = total + _inverse(np.asarray(prediction), turns, flip)
+    return total / len(transforms)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latency of batched test-time augmentation against naive repeated predicts.")
+    parser.add_argument("--model", choices=list(MODEL_PATHS), default="U-Net")
+    parser.add_argument("--stand-in", action="store_true", help="Use a small stand-in model even if weights exist")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    model, _ = load_model_or_stand_in(args.model, force_stand_in=args.stand_in)
+    rng = np.random.default_rng(0)
+    print(f"{'batch':>5} {'mode':<6} {'augs':>4} {'batched ms':>11} {'naive ms':>9} {'x off':>6}")
+    for batch_size in args.batch_sizes:
+        x = rng.random((batch_size, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+        base = None
+        for mode, transforms in TTA_MODES.items():
+            tta = TTAModel(model, mode)
+            batched = p50_ms(lambda: tta.predict(x), args.repeats)
+            naive = p50_ms(lambda: naive_tta(model, x, transforms), args.repeats)
+            base = base or batched
+            print(f"{batch_size:>5} {mode:<6} {len(transforms):>4} {batched:>11.1f} {naive:>9.1f} {batched / base:>6.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+import numpy as np
+import cv2
+
+from instrumentation import current_rss_mb
+from utils import IMG_SIZE, MODEL_PATHS, load_keras_model
+
+
+class PeakRSSSampler:
+    """Samples RSS on a background thread; peak_mb is the growth over the starting RSS."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak_mb = None
+
+    def __enter__(self):
+        self._start = current_rss_mb()
+        self._peak = self._start
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = current_rss_mb()
+            if rss is not None and rss > self._peak:
+                self._peak = rss
+            time.sleep(self.interval)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        rss = current_rss_mb()
+        if self._start is not None:
+            self.peak_mb = max(self._peak, rss) - self._start
+
+
+def p50_ms(fn, repeats):
+    # Median latency in ms; the first call is a warm-up, so tracing and compilation are not measured
+    fn()
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return float(np.percentile(latencies, 50) * 1000)
+
+
+def synthetic_image(size, seed=0):
+    # Smooth blobs of water-like blue over textured land, so codecs see realistic content
+    rng = np.random.default_rng(seed)
+    field = cv2.resize(rng.random((16, 16), dtype=np.float32), (size, size), interpolation=cv2.INTER_CUBIC)
+    water = field > 0.55
+    noise = rng.integers(0, 40, (size, size, 3), dtype=np.uint8)
+    image = np.empty((size, size, 3), dtype=np.uint8)
+    image[:] = (110, 120, 80)
+    image += noise
+    image[water] = (40, 70, 140)
+    return image
+
+
+def stand_in_model(seed=0):
+    # Tiny untrained network with the real input/output contract, for offline runs
+    import tensorflow as tf
+    tf.keras.utils.set_random_seed(seed)
+    inputs = tf.keras.Input((IMG_SIZE, IMG_SIZE, 3))
+    x = tf.keras.layers.Conv2D(8, 3, padding="same", activation="relu")(inputs)
+    x = tf.keras.layers.Conv2D(8, 3, padding="same", activation="relu")(x)
+    outputs = tf.keras.layers.Conv2D(1, 1, activation="sigmoid")(x)
+    return tf.keras.Model(inputs, outputs)
+
+
+def load_model_or_stand_in(model_name, backend="keras", force_stand_in=False):
+    if force_stand_in or not os.path.exists(MODEL_PATHS[model_name]):
+        return stand_in_model(), True
+    return load_keras_model(model_name, backend), False
+
+
+def stand_in_loader(model_name, backend="keras"):
+    # Picklable loader for worker processes
+    return stand_in_model()
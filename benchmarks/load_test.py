@@ -0,0 +1,85 @@
+import argparse
+import os
+import sys
+import threading
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import load_model_or_stand_in
+from inference_server import InferenceClient, InferenceServer, ServerBusy, start_server_thread
+from utils import IMG_SIZE, MODEL_PATHS
+
+
+def run_clients(address, model_name, clients, duration):
+    # Each client sends batch-size-1 requests back to back, like one Streamlit session
+    latencies = []
+    busy = [0]
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+    x = np.random.default_rng(0).random((1, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+
+    def client_loop():
+        client = InferenceClient(address)
+        local = []
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            try:
+                client.predict(model_name, x)
+            except ServerBusy:
+                with lock:
+                    busy[0] += 1
+                time.sleep(0.01)
+                continue
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client_loop) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return {
+        "requests_per_s": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+        "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        "rejected": busy[0]
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the inference server with and without micro-batching.")
+    parser.add_argument("--model", choices=list(MODEL_PATHS), default="U-Net")
+    parser.add_argument("--stand-in", action="store_true", help="Use a small stand-in model even if weights exist")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--max-latency-ms", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=8790)
+    args = parser.parse_args(argv)
+
+    model, _ = load_model_or_stand_in(args.model, force_stand_in=args.stand_in)
+    loader = lambda model_name, backend: model
+
+    results = {}
+    for label, max_batch, port in (("unbatched", 1, args.port), ("micro-batched", args.max_batch, args.port + 1)):
+        server = InferenceServer(loader, max_batch=max_batch, max_latency_ms=args.max_latency_ms)
+        start_server_thread(server, port=port)
+        address = f"127.0.0.1:{port}"
+        InferenceClient(address).predict(args.model, np.zeros((1, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32))
+        results[label] = run_clients(address, args.model, args.clients, args.duration)
+        stats = results[label]
+        print(f"{label:<14} {stats['requests_per_s']:>8.1f} req/s  p50 {stats['p50_ms']:>7.1f} ms  "
+              f"p99 {stats['p99_ms']:>7.1f} ms  rejected {stats['rejected']}")
+
+    gain = results["micro-batched"]["requests_per_s"] / max(results["unbatched"]["requests_per_s"], 1e-9)
+    print(f"Throughput gain from micro-batching: {gain:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import PeakRSSSampler, load_model_or_stand_in, synthetic_image
+from render import RenderBuffers, render_results
+from utils import MODEL_PATHS, preprocess_image, postprocess_prediction, create_overlay
+
+DEFAULT_SIZES = [512, 1024, 2048, 4096, 8192]
+STAGES = ["decode", "preprocess", "predict", "postprocess", "overlay", "render", "encode_png"]
+
+
+def time_stage(fn, repeats, min_time=0.0):
+    # Runs fn at least `repeats` times (and for at least min_time seconds), returns the last result
+    latencies = []
+    result = None
+    with PeakRSSSampler() as sampler:
+        start = time.perf_counter()
+        while len(latencies) < repeats or time.perf_counter() - start < min_time:
+            t0 = time.perf_counter()
+            result = fn()
+            latencies.append(time.perf_counter() - t0)
+    latencies = np.array(latencies) * 1000
+    return result, {
+        "runs": len(latencies),
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "throughput_per_s": float(1000 / latencies.mean()),
+        "peak_rss_mb": sampler.peak_mb
+    }
+
+
+def encode_png(image):
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def decode_png(data):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def bench_size(model, size, repeats):
+    image_array = synthetic_image(size, seed=size)
+    png_bytes = encode_png(Image.fromarray(image_array))
+    buffers = RenderBuffers()
+    results = {}
+
+    image, results["decode"] = time_stage(lambda: decode_png(png_bytes), repeats)
+    (batch, original_size), results["preprocess"] = time_stage(lambda: preprocess_image(image), repeats)
+    model.predict(batch, verbose=0)  # warm-up, graph tracing is not part of the stage
+    prediction, results["predict"] = time_stage(lambda: model.predict(batch, verbose=0), repeats)
+    mask_image, results["postprocess"] = time_stage(lambda: postprocess_prediction(prediction, original_size), repeats)
+    overlay_image, results["overlay"] = time_stage(lambda: create_overlay(image, mask_image), repeats)
+    _, results["render"] = time_stage(lambda: render_results(image_array, prediction, buffers=buffers), repeats)
+    _, results["encode_png"] = time_stage(lambda: encode_png(overlay_image), repeats)
+
+    megapixels = size * size / 1e6
+    for stage in results.values():
+        stage["megapixels_per_s"] = stage["throughput_per_s"] * megapixels
+    return results
+
+
+def compare(current, baseline, tolerance, min_delta_ms):
+    # Regressions are stages whose p50 grew by more than tolerance and min_delta_ms
+    regressions = []
+    for size, stages in current["results"].items():
+        for stage, stats in stages.items():
+            reference = baseline.get("results", {}).get(size, {}).get(stage)
+            if reference is None:
+                continue
+            delta = stats["p50_ms"] - reference["p50_ms"]
+            if stats["p50_ms"] > reference["p50_ms"] * (1 + tolerance) and delta > min_delta_ms:
+                regressions.append((size, stage, reference["p50_ms"], stats["p50_ms"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time every stage of the segmentation pipeline on synthetic images.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--model", choices=list(MODEL_PATHS), default="U-Net")
+    parser.add_argument("--stand-in", action="store_true", help="Use a small stand-in model even if weights exist")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Compare against this results file and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative p50 slowdown")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    model, stand_in = load_model_or_stand_in(args.model, force_stand_in=args.stand_in)
+    report = {
+        "meta": {
+            "model": "stand-in" if stand_in else args.model,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "results": {}
+    }
+
+    print(f"{'size':>6} {'stage':<12} {'p50 ms':>9} {'p99 ms':>9} {'MP/s':>8} {'peak MB':>8}")
+    for size in args.sizes:
+        results = bench_size(model, size, args.repeats)
+        report["results"][str(size)] = results
+        for stage in STAGES:
+            stats = results[stage]
+            peak = "n/a" if stats["peak_rss_mb"] is None else f"{stats['peak_rss_mb']:.1f}"
+            print(f"{size:>6} {stage:<12} {stats['p50_ms']:>9.2f} {stats['p99_ms']:>9.2f} "
+                  f"{stats['megapixels_per_s']:>8.1f} {peak:>8}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("model") != report["meta"]["model"]:
+            print("Warning: baseline was recorded with a different model")
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        for size, stage, before, after in regressions:
+            print(f"REGRESSION {stage} at {size}px: {before:.2f} ms -> {after:.2f} ms")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import time
+import numpy as np
+import cv2
+from instrumentation import stage
+from tiling import (TILE_BATCH_SIZE, TILE_OVERLAP, prepare_tiles, predict_tiles, resize_scene, tile_starts, to_rgb_array,
+                    upsample_rows)
+from utils import IMG_SIZE
+
+# Coarse probabilities within this distance of the threshold count as uncertain
+UNCERTAINTY_MARGIN = 0.2
+
+
+def refinement_map(coarse, threshold=0.5, margin=UNCERTAINTY_MARGIN):
+    # Coarse pixels that need full resolution: uncertain, or on a water/land boundary
+    water = (coarse > threshold).astype(np.uint8)
+    kernel = np.ones((3, 3), dtype=np.uint8)
+    boundary = cv2.dilate(water, kernel) != cv2.erode(water, kernel)
+    return boundary | (np.abs(coarse - threshold) < margin)
+
+
+def _edge_weights(start, tile_size, length, overlap):
+    # Blend ramp along one axis, flat at the scene border so the coarse map never bleeds in there
+    idx = np.arange(tile_size, dtype=np.float32) + 0.5
+    ramp = np.ones(tile_size, dtype=np.float32)
+    if overlap > 0:
+        if start > 0:
+            ramp = np.minimum(ramp, idx / overlap)
+        if start + tile_size < length:
+            ramp = np.minimum(ramp, (tile_size - idx) / overlap)
+    return np.minimum(ramp, 1.0)
+
+
+def iter_cascade_probabilities(model, image, threshold=0.5, margin=UNCERTAINTY_MARGIN, tile_size=IMG_SIZE,
+                               overlap=TILE_OVERLAP, batch_size=TILE_BATCH_SIZE, predict_fn=predict_tiles,
+                               stats=None):
+    """Yield (row_offset, probabilities) strips from a coarse pass plus tiles refined where it matters.
+
+    The whole scene is first predicted once at model resolution. Tiles of the
+    regular tiling grid are then re-predicted at full resolution only where
+    the coarse map is uncertain or a shoreline runs through them; elsewhere
+    the upsampled coarse probabilities are kept. Like iter_tiled_probabilities,
+    refined tiles are merged one band of rows at a time, so working memory is
+    proportional to tile_size * image width. Pass a dict as `stats` to receive
+    the tile counts and timings once the last strip is out.
+    """
+    image = to_rgb_array(image)
+    height, width = image.shape[:2]
+    start = time.perf_counter()
+
+    with stage("cascade_coarse"):
+        batch = resize_scene(image, (tile_size, tile_size)).astype(np.float32)[None] * (1.0 / 255.0)
+    coarse = predict_fn(model, batch)[0]
+    channels = coarse.shape[-1]
+    flagged = refinement_map(coarse[..., 0], threshold, margin)
+    # Columns are upsampled once, rows one strip at a time
+    wide = cv2.resize(coarse, (width, tile_size), interpolation=cv2.INTER_LINEAR).reshape(tile_size, width, channels)
+    coarse_seconds = time.perf_counter() - start
+
+    # Tiles of the regular grid whose coarse footprint (plus a pixel of context) is flagged
+    ys = tile_starts(height, tile_size, overlap)
+    xs = tile_starts(width, tile_size, overlap)
+    scale_y, scale_x = tile_size / height, tile_size / width
+    refine = {}
+    for y in ys:
+        for x in xs:
+            y0, x0 = max(0, int(y * scale_y) - 1), max(0, int(x * scale_x) - 1)
+            y1 = int(np.ceil(min(height, y + tile_size) * scale_y)) + 1
+            x1 = int(np.ceil(min(width, x + tile_size) * scale_x)) + 1
+            if flagged[y0:y1, x0:x1].any():
+                refine.setdefault(y, []).append(x)
+    refined = sum(len(row) for row in refine.values())
+
+    band_height = min(tile_size, height)
+    acc = np.zeros((band_height, width, channels), dtype=np.float32)
+    acc_weight = np.zeros((band_height, width), dtype=np.float32)
+    refine_seconds = 0.0
+    for band, y in enumerate(ys):
+        refine_start = time.perf_counter()
+        row = refine.get(y, [])
+        for b in range(0, len(row), batch_size):
+            batch_xs = row[b:b + batch_size]
+            # Raster readers only decode these windows
+            tiles = [image[y:y + tile_size, x:x + tile_size] for x in batch_xs]
+            probs = predict_fn(model, prepare_tiles(tiles, tile_size))
+            with stage("cascade_merge"):
+                for x, prob in zip(batch_xs, probs):
+                    h, w = min(tile_size, height - y), min(tile_size, width - x)
+                    weights = np.outer(_edge_weights(y, tile_size, height, overlap),
+                                       _edge_weights(x, tile_size, width, overlap))[:h, :w]
+                    acc[:h, x:x + w] += prob[:h, :w] * weights[..., None]
+                    acc_weight[:h, x:x + w] += weights
+
+        with stage("cascade_merge"):
+            # Rows above the next band's start receive no further contributions
+            done = ys[band + 1] - y if band + 1 < len(ys) else band_height
+            strip = upsample_rows(wide, height, y, y + done)
+            weight = acc_weight[:done]
+            covered = weight > 0
+            if covered.any():
+                # Coarse probabilities fill in wherever the refined tiles fade out
+                coarse_weight = np.maximum(0.0, 1.0 - weight[covered])
+                strip[covered] = ((acc[:done][covered] + strip[covered] * coarse_weight[:, None])
+                                  / (weight[covered] + coarse_weight)[:, None])
+        if row:
+            refine_seconds += time.perf_counter() - refine_start
+        yield y, strip[..., 0] if channels == 1 else strip
+
+        acc[:band_height - done] = acc[done:]
+        acc[band_height - done:] = 0
+        acc_weight[:band_height - done] = acc_weight[done:]
+        acc_weight[band_height - done:] = 0
+
+    if stats is not None:
+        tiles = len(ys) * len(xs)
+        seconds = time.perf_counter() - start
+        # Not measured: full tiling extrapolated from the per-tile cost of the refined tiles
+        per_tile = refine_seconds / refined if refined else coarse_seconds
+        stats.update({
+            "tiles": tiles,
+            "refined": refined,
+            "refined_fraction": refined / tiles,
+            "coarse_seconds": coarse_seconds,
+            "refine_seconds": refine_seconds,
+            "seconds": seconds,
+            "estimated_speedup": per_tile * tiles / seconds if seconds else 1.0
+        })
+
+
+def predict_cascade(model, image, threshold=0.5, margin=UNCERTAINTY_MARGIN, tile_size=IMG_SIZE,
+                    overlap=TILE_OVERLAP, batch_size=TILE_BATCH_SIZE, predict_fn=predict_tiles, out=None):
+    # Full-resolution probabilities and stats; pass an np.memmap as `out` for huge scenes
+    image = to_rgb_array(image)
+    height, width = image.shape[:2]
+    stats = {}
+    for y, strip in iter_cascade_probabilities(model, image, threshold, margin, tile_size, overlap, batch_size,
+                                               predict_fn, stats):
+        if out is None:
+            out = np.empty((height, width, *strip.shape[2:]), dtype=np.float32)
+        out[y:y + strip.shape[0]] = strip
+    return out, stats
@@ -0,0 +1,142 @@
+import io
+import os
+import numpy as np
+import cv2
+from PIL import Image
+from artifacts import DEFAULT_PNG_LEVEL
+from instrumentation import stage
+from prediction_cache import PredictionCache, content_hash, make_key
+from render import WATER_COLOR
+from tiling import TILE_BATCH_SIZE, TILE_OVERLAP, iter_tiled_probabilities, predict_tiles, to_rgb_array
+from utils import IMG_SIZE
+
+# Codes of the change map
+NO_WATER = 0
+STABLE_WATER = 1
+WATER_GAIN = 2
+WATER_LOSS = 3
+
+CHANGE_COLORS = np.array([
+    (0, 0, 0),
+    WATER_COLOR,
+    (0, 200, 83),   # gain in green
+    (229, 57, 53)   # loss in red
+], dtype=np.uint8)
+
+# Tile probabilities get their own budget, so a large scene pair never evicts whole-image results
+TILE_PREDICTION_CACHE_MB = float(os.environ.get("AQUASENSE_TILE_PREDICTION_CACHE_MB", 128))
+TILE_PREDICTION_CACHE_DIR = os.environ.get("AQUASENSE_TILE_PREDICTION_CACHE_DIR")
+tile_prediction_cache = PredictionCache(TILE_PREDICTION_CACHE_MB, disk_dir=TILE_PREDICTION_CACHE_DIR)
+
+
+class TileCachePredictor:
+    """predict_fn for iter_tiled_probabilities that only runs the model on tiles it has not seen.
+
+    Tiles are content-hashed and their probabilities kept in a dedicated tile
+    cache, so tiles that are identical to an earlier acquisition (or an
+    earlier run) are reused instead of predicted.
+    """
+
+    def __init__(self, model_name, backend="keras", variant="", cache=tile_prediction_cache):
+        self.model_name = model_name
+        self.backend = backend
+        self.variant = f"tile-{variant}"
+        self.cache = cache
+        self.predicted = 0
+        self.reused = 0
+
+    def __call__(self, model, batch):
+        keys = [make_key(content_hash(tile), self.model_name, self.variant, self.backend) for tile in batch]
+        probabilities = [self.cache.get(key) for key in keys]
+        missing = [i for i, prediction in enumerate(probabilities) if prediction is None]
+        if missing:
+            predictions = predict_tiles(model, batch[missing])
+            # put stores a copy of each row, so cached tiles don't pin the predicted batch
+            for i, prediction in zip(missing, predictions):
+                probabilities[i] = self.cache.put(keys[i], prediction)
+        self.predicted += len(missing)
+        self.reused += len(batch) - len(missing)
+        return np.stack(probabilities)
+
+
+def pixel_area(raster):
+    # Ground area of one pixel from a raster's geotransform, None when it is not georeferenced
+    geotransform = getattr(raster, "geotransform", None)
+    if geotransform is None:
+        return None
+    return abs(geotransform[1] * geotransform[5] - geotransform[2] * geotransform[4])
+
+
+def detect_changes(model, before, after, model_name, backend="keras", threshold=0.5, variant="",
+                   tile_size=IMG_SIZE, overlap=TILE_OVERLAP, batch_size=TILE_BATCH_SIZE,
+                   cache=tile_prediction_cache, area_per_pixel=None):
+    """Segment a co-registered before/after pair and classify every pixel as
+    no water, stable water, water gain or water loss.
+
+    Both images are streamed through the tiled pipeline band by band. Returns
+    the (H, W) change map and a statistics dict with pixel counts, areas when
+    area_per_pixel is known, and how many tiles were predicted or reused.
+    """
+    before = to_rgb_array(before)
+    after = to_rgb_array(after)
+    if before.shape[:2] != after.shape[:2]:
+        raise ValueError("Before and after images must be co-registered and of the same size")
+    height, width = after.shape[:2]
+    predictor = TileCachePredictor(model_name, backend, f"{tile_size}-{overlap}|{variant}", cache)
+    change = np.empty((height, width), dtype=np.uint8)
+
+    strips = zip(
+        iter_tiled_probabilities(model, before, tile_size, overlap, batch_size, predictor),
+        iter_tiled_probabilities(model, after, tile_size, overlap, batch_size, predictor)
+    )
+    for (y, before_strip), (_, after_strip) in strips:
+        # Multi-channel outputs (the ensemble) carry the water probability first
+        if before_strip.ndim == 3:
+            before_strip, after_strip = before_strip[..., 0], after_strip[..., 0]
+        was_water = before_strip > threshold
+        is_water = after_strip > threshold
+        rows = change[y:y + before_strip.shape[0]]
+        rows[:] = is_water
+        rows[was_water & is_water] = STABLE_WATER
+        rows[~was_water & is_water] = WATER_GAIN
+        rows[was_water & ~is_water] = WATER_LOSS
+
+    counts = np.bincount(change.ravel(), minlength=4)
+    stats = {
+        "pixels": height * width,
+        "before_water_px": int(counts[STABLE_WATER] + counts[WATER_LOSS]),
+        "after_water_px": int(counts[STABLE_WATER] + counts[WATER_GAIN]),
+        "gain_px": int(counts[WATER_GAIN]),
+        "loss_px": int(counts[WATER_LOSS]),
+        "tiles_predicted": predictor.predicted,
+        "tiles_reused": predictor.reused
+    }
+    stats["net_px"] = stats["after_water_px"] - stats["before_water_px"]
+    stats["changed_fraction"] = (stats["gain_px"] + stats["loss_px"]) / stats["pixels"]
+    if area_per_pixel:
+        for name in ("before_water", "after_water", "gain", "loss", "net"):
+            stats[f"{name}_area"] = stats[f"{name}_px"] * area_per_pixel
+    return change, stats
+
+
+def change_visualization(change, image=None, opacity=0.5):
+    # Color-coded change map, optionally blended over the after image where there is water
+    colored = CHANGE_COLORS[change]
+    if image is None:
+        return colored
+    image = np.asarray(image)
+    blended = cv2.addWeighted(image, 1 - opacity, colored, opacity, 0)
+    water = change != NO_WATER
+    out = image.copy()
+    out[water] = blended[water]
+    return out
+
+
+def encode_change_map(change, level=DEFAULT_PNG_LEVEL):
+    # Paletted PNG: one byte per pixel holding the change code, shown in the change colors
+    with stage("encode_png"):
+        image = Image.fromarray(np.ascontiguousarray(change, dtype=np.uint8), "L")
+        image.putpalette(CHANGE_COLORS.ravel().tolist())
+        buffered = io.BytesIO()
+        image.save(buffered, format="PNG", compress_level=int(level))
+    return buffered.getvalue()
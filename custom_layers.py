@@ -0,0 +1,28 @@
+import tensorflow as tf
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.layers import Conv2D, BatchNormalization, ReLU
+
+
+class ConvBlock(tf.keras.layers.Layer):
+    def __init__(self, filters=512, kernel_size=3, dilation_rate=1, **kwargs):
+        super(ConvBlock, self).__init__(**kwargs)
+        self.filters = filters
+        self.kernel_size = kernel_size
+        self.dilation_rate = dilation_rate
+        self.net = Sequential([
+            Conv2D(filters, kernel_size, padding='same', dilation_rate=dilation_rate, activation=None, use_bias=False),
+            BatchNormalization(),
+            ReLU()
+        ])
+
+    def call(self, inputs):
+        return self.net(inputs)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({
+            'filters': self.filters,
+            'kernel_size': self.kernel_size,
+            'dilation_rate': self.dilation_rate
+        })
+        return config
@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+ENSEMBLE_NAME = "Ensemble"
+ENSEMBLE_MEMBERS = ["U-Net", "DeepLabV3+"]
+
+# Shared by all ensembles so Streamlit reruns don't create new threads
+_executor = ThreadPoolExecutor(max_workers=len(ENSEMBLE_MEMBERS), thread_name_prefix="ensemble")
+
+
+class EnsembleModel:
+    """Runs several models on one shared input batch and fuses their probabilities.
+
+    predict() returns two channels per pixel: the weighted mean probability and
+    the disagreement (max - min probability across members), so the ensemble
+    plugs into every path that calls model.predict.
+    """
+
+    def __init__(self, models, weights=None, concurrent=True):
+        self.models = list(models)
+        weights = np.ones(len(self.models)) if weights is None else np.asarray(weights, dtype=np.float32)
+        if len(weights) != len(self.models) or weights.sum() <= 0:
+            raise ValueError("Ensemble weights must match the models and sum to a positive value")
+        self.weights = weights / weights.sum()
+        self.concurrent = concurrent
+        self.input_shape = self.models[0].input_shape
+
+    def predict(self, x, batch_size=None, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+        if self.concurrent:
+            # TensorFlow releases the GIL, so members overlap on separate threads
+            futures = [_executor.submit(model.predict, x, batch_size=batch_size, verbose=0) for model in self.models]
+            predictions = [future.result() for future in futures]
+        else:
+            predictions = [model.predict(x, batch_size=batch_size, verbose=0) for model in self.models]
+        return fuse_predictions(predictions, self.weights)
+
+
+def fuse_predictions(predictions, weights):
+    fused = None
+    low = high = None
+    for prediction, weight in zip(predictions, weights):
+        prediction = np.asarray(prediction, dtype=np.float32)
+        # Batches are (N, H, W, channels), or (N, H, W) from some backends and remote models
+        if prediction.ndim == 4:
+            prediction = prediction[..., 0]
+        if fused is None:
+            fused = prediction * weight
+            low, high = prediction.copy(), prediction.copy()
+        else:
+            fused += prediction * weight
+            np.minimum(low, prediction, out=low)
+            np.maximum(high, prediction, out=high)
+    np.subtract(high, low, out=high)
+    return np.stack([fused, high], axis=-1)
+
+
+def split_ensemble(prediction):
+    # (..., 2) ensemble output to fused probabilities and disagreement map
+    prediction = np.asarray(prediction)
+    return prediction[..., 0], prediction[..., 1]
+
+
+def disagreement_visualization(disagreement, size):
+    # Heat map of member disagreement at the original image size (width, height)
+    disagreement = cv2.resize(np.asarray(disagreement, dtype=np.float32), size)
+    heat = cv2.applyColorMap(np.clip(disagreement * 255, 0, 255).astype(np.uint8), cv2.COLORMAP_INFERNO)
+    return cv2.cvtColor(heat, cv2.COLOR_BGR2RGB)
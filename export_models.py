@@ -0,0 +1,88 @@
+import argparse
+import os
+import sys
+import tempfile
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+from utils import MODEL_PATHS, load_keras_model, model_file, preprocess_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff")
+QUANTIZATION_BACKENDS = {
+    "none": "tflite",
+    "float16": "tflite-fp16",
+    "int8": "tflite-int8"
+}
+
+
+def calibration_images(calibration_dir, limit=100):
+    paths = sorted(
+        os.path.join(calibration_dir, name) for name in os.listdir(calibration_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )[:limit]
+    if not paths:
+        raise ValueError(f"No calibration images found in {calibration_dir}")
+    return paths
+
+
+def representative_dataset(paths):
+    # Calibration samples go through the same preprocessing as inference
+    def generator():
+        for path in paths:
+            image = Image.open(path).convert("RGB")
+            processed_image, _ = preprocess_image(image)
+            yield [processed_image.astype(np.float32)]
+    return generator
+
+
+def export_tflite(model_name, quantization="none", calibration_paths=None, output_path=None):
+    if quantization not in QUANTIZATION_BACKENDS:
+        raise ValueError(f"Unknown quantization: {quantization}")
+    if quantization == "int8" and not calibration_paths:
+        raise ValueError("int8 quantization needs a calibration set")
+
+    model = load_keras_model(model_name)
+    with tempfile.TemporaryDirectory() as saved_model_dir:
+        # Going through a SavedModel keeps custom layers such as ConvBlock convertible
+        model.export(saved_model_dir)
+        converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+        if quantization != "none":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if quantization == "float16":
+            converter.target_spec.supported_types = [tf.float16]
+        if calibration_paths:
+            converter.representative_dataset = representative_dataset(calibration_paths)
+        tflite_model = converter.convert()
+
+    output_path = output_path or model_file(model_name, QUANTIZATION_BACKENDS[quantization])
+    with open(output_path, "wb") as f:
+        f.write(tflite_model)
+    return output_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the segmentation models to TFLite for CPU inference.")
+    parser.add_argument("--model", choices=["all", *MODEL_PATHS], default="all")
+    parser.add_argument("--quantization", choices=["all", *QUANTIZATION_BACKENDS], default="all")
+    parser.add_argument("--calibration-dir", help="Images used to calibrate int8 quantization")
+    parser.add_argument("--num-calibration", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    models = list(MODEL_PATHS) if args.model == "all" else [args.model]
+    quantizations = list(QUANTIZATION_BACKENDS) if args.quantization == "all" else [args.quantization]
+    calibration_paths = calibration_images(args.calibration_dir, args.num_calibration) if args.calibration_dir else None
+    if "int8" in quantizations and calibration_paths is None:
+        if args.quantization == "int8":
+            parser.error("--calibration-dir is required for int8 quantization")
+        quantizations.remove("int8")
+        print("Skipping int8: no --calibration-dir given")
+
+    for model_name in models:
+        for quantization in quantizations:
+            path = export_tflite(model_name, quantization, calibration_paths)
+            print(f"{model_name} ({quantization}): {path} ({os.path.getsize(path) / 2**20:.1f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
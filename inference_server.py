@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import functools
+import http.client
+import io
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlencode, urlsplit
+import numpy as np
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+MAX_BATCH = 16
+MAX_LATENCY_MS = 5.0
+MAX_QUEUE = 256
+# "host:port" of a running server; when set, the app sends inference there
+INFERENCE_SERVER = os.environ.get("AQUASENSE_INFERENCE_SERVER")
+
+HTTP_STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class ServerBusy(RuntimeError):
+    pass
+
+
+def encode_array(array):
+    buffered = io.BytesIO()
+    np.save(buffered, np.ascontiguousarray(array), allow_pickle=False)
+    return buffered.getvalue()
+
+
+def decode_array(data):
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+
+class MicroBatcher:
+    """Collects concurrent requests for one model into batches within a short latency window."""
+
+    def __init__(self, model, executor, max_batch=MAX_BATCH, max_latency_ms=MAX_LATENCY_MS, max_queue=MAX_QUEUE):
+        self.model = model
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000
+        self.queue = asyncio.Queue(max_queue)
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def submit(self, x):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((x, future))
+        except asyncio.QueueFull:
+            # Backpressure: reject instead of letting latency grow without bound
+            self.rejected += 1
+            raise ServerBusy("Inference queue is full")
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            rows = len(items[0][0])
+            deadline = loop.time() + self.max_latency
+            while rows < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                rows += len(item[0])
+
+            # Only requests with the same image shape can share a batch
+            groups = {}
+            for item in items:
+                groups.setdefault(item[0].shape[1:], []).append(item)
+            for group in groups.values():
+                await self._predict(loop, group)
+
+    async def _predict(self, loop, items):
+        try:
+            batch = np.concatenate([x for x, _ in items], axis=0)
+            predict = functools.partial(self.model.predict, batch, verbose=0)
+            predictions = await loop.run_in_executor(self.executor, predict)
+        except Exception as e:
+            # Fail this batch's requests only, the loop keeps serving
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(items)
+        offset = 0
+        for x, future in items:
+            if not future.done():
+                future.set_result(predictions[offset:offset + len(x)])
+            offset += len(x)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "batches": self.batches,
+            "requests": self.items,
+            "mean_batch_requests": self.items / self.batches if self.batches else 0.0,
+            "rejected": self.rejected
+        }
+
+
+class InferenceServer:
+    def __init__(self, model_loader=None, max_batch=MAX_BATCH, max_latency_ms=MAX_LATENCY_MS, max_queue=MAX_QUEUE):
+        if model_loader is None:
+            from model_registry import registry
+            model_loader = registry.get
+        self.model_loader = model_loader
+        self.max_batch = max_batch
+        self.max_latency_ms = max_latency_ms
+        self.max_queue = max_queue
+        # One thread runs predicts so batches never compete for the CPU; models load on the
+        # loop's default executor so a slow load never holds up batches for other models
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="inference")
+        self._batchers = {}
+        self._loading = {}
+
+    async def batcher(self, model_name, backend):
+        key = (model_name, backend)
+        if key not in self._batchers:
+            if key not in self._loading:
+                loop = asyncio.get_running_loop()
+                self._loading[key] = loop.run_in_executor(None, self.model_loader, model_name, backend)
+            try:
+                model = await self._loading[key]
+            except Exception:
+                self._loading.pop(key, None)
+                raise
+            if key not in self._batchers:
+                self._batchers[key] = MicroBatcher(model, self.executor, self.max_batch,
+                                                   self.max_latency_ms, self.max_queue)
+        return self._batchers[key]
+
+    async def predict(self, model_name, backend, x):
+        batcher = await self.batcher(model_name, backend)
+        expected = tuple(batcher.model.input_shape[1:])
+        if len(expected) != x.ndim - 1 or any(dim is not None and dim != size for dim, size in zip(expected, x.shape[1:])):
+            raise ValueError(f"Expected input of shape (batch, {', '.join(str(dim) for dim in expected)}), "
+                             f"got {x.shape}")
+        return await batcher.submit(x)
+
+    def stats(self):
+        return {f"{name}|{backend}": batcher.stats() for (name, backend), batcher in self._batchers.items()}
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        if method == "GET" and url.path == "/health":
+            return 200, json.dumps(self.stats()).encode("utf-8"), "application/json"
+        if method != "POST" or url.path != "/predict":
+            return 404, b"Not found", "text/plain"
+        query = parse_qs(url.query)
+        model_name = query.get("model", ["U-Net"])[0]
+        backend = query.get("backend", ["keras"])[0]
+        try:
+            x = decode_array(body).astype(np.float32, copy=False)
+            if x.ndim != 4:
+                return 400, b"Expected a (batch, height, width, channels) array", "text/plain"
+            prediction = await self.predict(model_name, backend, x)
+        except ServerBusy as e:
+            return 503, str(e).encode("utf-8"), "text/plain"
+        except ValueError as e:
+            return 400, str(e).encode("utf-8"), "text/plain"
+        except Exception as e:
+            return 500, str(e).encode("utf-8"), "text/plain"
+        return 200, encode_array(prediction), "application/octet-stream"
+
+    async def handle(self, reader, writer):
+        # Minimal HTTP/1.1 with keep-alive, enough for the bundled client
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, payload, content_type = await self.dispatch(method, target, body)
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTP_STATUS[status]}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=SERVER_HOST, port=SERVER_PORT, ready=None):
+        server = await asyncio.start_server(self.handle, host, port)
+        if ready is not None:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+
+def start_server_thread(server, host=SERVER_HOST, port=SERVER_PORT):
+    # Runs the event loop on a daemon thread, used by the load test
+    ready = threading.Event()
+    thread = threading.Thread(target=lambda: asyncio.run(server.serve(host, port, ready)), daemon=True)
+    thread.start()
+    if not ready.wait(30):
+        raise RuntimeError("Inference server did not start")
+    return thread
+
+
+class InferenceClient:
+    def __init__(self, address=None, timeout=60):
+        host, _, port = (address or f"{SERVER_HOST}:{SERVER_PORT}").partition(":")
+        self.host = host
+        self.port = int(port or SERVER_PORT)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        # One keep-alive connection per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return connection
+
+    def predict(self, model_name, x, backend="keras"):
+        target = "/predict?" + urlencode({"model": model_name, "backend": backend})
+        body = encode_array(np.asarray(x, dtype=np.float32))
+        connection = self._connection()
+        try:
+            connection.request("POST", target, body=body, headers={"Content-Type": "application/octet-stream"})
+            response = connection.getresponse()
+            payload = response.read()
+        except BaseException:
+            # Timeouts and interrupts leave a half-read response; never reuse that connection
+            connection.close()
+            self._local.connection = None
+            raise
+        if response.status == 503:
+            raise ServerBusy(payload.decode("utf-8", "replace"))
+        if response.status != 200:
+            raise RuntimeError(f"Inference server error {response.status}: {payload.decode('utf-8', 'replace')}")
+        return decode_array(payload)
+
+
+class RemoteModel:
+    """Model stand-in that sends predict() calls to the inference server."""
+
+    def __init__(self, client, model_name, backend="keras", input_shape=None):
+        from utils import IMG_SIZE
+        self.client = client
+        self.model_name = model_name
+        self.backend = backend
+        self.input_shape = input_shape or (None, IMG_SIZE, IMG_SIZE, 3)
+
+    def predict(self, x, batch_size=None, verbose=0):
+        return self.client.predict(self.model_name, x, self.backend)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local inference server with dynamic micro-batching.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="Images per batched predict")
+    parser.add_argument("--max-latency-ms", type=float, default=MAX_LATENCY_MS, help="Time to wait for a batch to fill")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE, help="Queued requests before rejecting with 503")
+    args = parser.parse_args(argv)
+
+    server = InferenceServer(max_batch=args.max_batch, max_latency_ms=args.max_latency_ms, max_queue=args.max_queue)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Collection is off unless enabled here, through AQUASENSE_METRICS=1 or AQUASENSE_METRICS_PORT
+METRICS_ENABLED = os.environ.get("AQUASENSE_METRICS", "0") == "1"
+METRICS_PORT = os.environ.get("AQUASENSE_METRICS_PORT")
+
+LATENCY_BUCKETS_S = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROLLING_WINDOW = 1024
+
+_NULL_STAGE = nullcontext()
+
+
+def current_rss_mb():
+    # Resident set size from /proc, None where it is not available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StageMetrics:
+    # Cumulative Prometheus histogram plus a rolling window for quantiles
+    def __init__(self):
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS_S)
+        self.count = 0
+        self.total_s = 0.0
+        self.rss_delta_max_mb = 0.0
+        self.recent = deque(maxlen=ROLLING_WINDOW)
+
+    def observe(self, seconds, rss_delta_mb):
+        self.count += 1
+        self.total_s += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS_S):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+        if rss_delta_mb is not None and rss_delta_mb > self.rss_delta_max_mb:
+            self.rss_delta_max_mb = rss_delta_mb
+        self.recent.append(seconds)
+
+    def summary(self):
+        recent = sorted(self.recent)
+        def quantile(q):
+            return recent[min(len(recent) - 1, int(q * len(recent)))] * 1000 if recent else 0.0
+        return {
+            "count": self.count,
+            "mean_ms": self.total_s / self.count * 1000 if self.count else 0.0,
+            "p50_ms": quantile(0.5),
+            "p99_ms": quantile(0.99),
+            "rss_delta_max_mb": self.rss_delta_max_mb
+        }
+
+
+class Metrics:
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        # Returns a shared no-op context when disabled, so call sites cost almost nothing
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name, seconds, rss_delta_mb=None):
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = StageMetrics()
+            stage.observe(seconds, rss_delta_mb)
+
+    def summary(self):
+        with self._lock:
+            return {name: stage.summary() for name, stage in sorted(self._stages.items())}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP aquasense_stage_seconds Time spent in each pipeline stage.",
+            "# TYPE aquasense_stage_seconds histogram"
+        ]
+        with self._lock:
+            stages = sorted(self._stages.items())
+            for name, stage in stages:
+                for bound, count in zip(LATENCY_BUCKETS_S, stage.bucket_counts):
+                    lines.append(f'aquasense_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'aquasense_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {stage.count}')
+                lines.append(f'aquasense_stage_seconds_sum{{stage="{name}"}} {stage.total_s}')
+                lines.append(f'aquasense_stage_seconds_count{{stage="{name}"}} {stage.count}')
+            lines.append("# HELP aquasense_stage_rss_delta_max_megabytes Largest RSS growth seen during a stage.")
+            lines.append("# TYPE aquasense_stage_rss_delta_max_megabytes gauge")
+            for name, stage in stages:
+                lines.append(f'aquasense_stage_rss_delta_max_megabytes{{stage="{name}"}} {stage.rss_delta_max_mb}')
+        rss = current_rss_mb()
+        if rss is not None:
+            lines.append("# HELP aquasense_resident_memory_megabytes Resident set size of the process.")
+            lines.append("# TYPE aquasense_resident_memory_megabytes gauge")
+            lines.append(f"aquasense_resident_memory_megabytes {rss}")
+        return "\n".join(lines) + "\n"
+
+
+class _Stage:
+    __slots__ = ("metrics", "name", "start", "rss")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.rss = current_rss_mb()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        rss = current_rss_mb()
+        delta = rss - self.rss if rss is not None and self.rss is not None else None
+        self.metrics.record(self.name, seconds, delta)
+
+
+metrics = Metrics()
+
+
+def stage(name):
+    return metrics.stage(name)
+
+
+def timed(name):
+    # Decorator form of stage(); the enabled check is the only cost when disabled
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return fn(*args, **kwargs)
+            with metrics.stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=9464, host="127.0.0.1"):
+    # Idempotent: Streamlit reruns the app script, but only one server is started
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True, name="metrics-server").start()
+            metrics.enabled = True
+        return _server
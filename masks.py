@@ -0,0 +1,183 @@
+import numpy as np
+import cv2
+from tiling import upsample_rows
+
+# Set bits per byte value, for numpy versions without np.bitwise_count
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(packed):
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(packed).sum(dtype=np.int64))
+    return int(_POPCOUNT[packed].sum(dtype=np.int64))
+
+
+def scene_mask_strips(probabilities, size, threshold=0.5, rows=512):
+    """Yield (row_offset, 0/1 uint8 strip) pieces of the water mask at the scene size (height, width).
+
+    Model-resolution probabilities are thresholded first and bilinearly
+    upscaled a strip at a time, so the full-resolution mask is never held
+    whole. The upscale runs in float32 and keeps every pixel interpolated to
+    0.5 or more; render_results resizes the 0/1 mask as uint8, whose
+    fixed-point rounding drops some shoreline pixels up to about 0.75.
+    """
+    probabilities = np.asarray(probabilities)
+    if probabilities.ndim == 3:
+        probabilities = probabilities[..., 0]  # multi-channel outputs carry the water probability first
+    height, width = size
+    if probabilities.shape == (height, width):
+        for y in range(0, height, rows):
+            yield y, (probabilities[y:y + rows] > threshold).view(np.uint8)
+        return
+
+    # Bilinear upscale of the 0/1 mask: columns once at model resolution, rows per strip
+    small = (probabilities > threshold).astype(np.float32)
+    wide = cv2.resize(small, (width, small.shape[0]), interpolation=cv2.INTER_LINEAR)
+    for y in range(0, height, rows):
+        yield y, (upsample_rows(wide, height, y, min(height, y + rows)) >= 0.5).view(np.uint8)
+
+
+class PackedMask:
+    """Binary mask stored one bit per pixel, 8x smaller than a uint8 mask.
+
+    Boolean operations and the water area run on the packed bytes without
+    unpacking. Bits beyond height * width (padding of the last byte) are
+    always kept at zero.
+    """
+
+    __slots__ = ("shape", "bits")
+
+    def __init__(self, shape, bits):
+        self.shape = tuple(shape)
+        self.bits = bits
+
+    @classmethod
+    def from_array(cls, mask):
+        # Any nonzero value is water, so 0/1, 0/255 and boolean masks all work
+        mask = np.asarray(mask)
+        return cls(mask.shape, np.packbits(mask.ravel() != 0))
+
+    @classmethod
+    def from_probabilities(cls, probabilities, threshold=0.5, size=None):
+        # Same thresholding and resize as postprocess_prediction; size is (height, width)
+        mask = np.squeeze(np.asarray(probabilities) > threshold).astype(np.uint8)
+        if size is not None and mask.shape != tuple(size):
+            mask = cv2.resize(mask, (size[1], size[0]))
+        return cls.from_array(mask)
+
+    @classmethod
+    def from_strips(cls, shape, strips):
+        # Packs (row_offset, strip) pieces top to bottom, never holding the unpacked mask
+        bits = np.empty(-(-shape[0] * shape[1] // 8), dtype=np.uint8)
+        filled = 0
+        carry = np.zeros(0, dtype=bool)  # bits of a byte split across two strips
+        for _, strip in strips:
+            flat = np.concatenate((carry, np.asarray(strip).ravel() != 0))
+            whole = flat.size // 8 * 8
+            packed = np.packbits(flat[:whole])
+            bits[filled:filled + packed.size] = packed
+            filled += packed.size
+            carry = flat[whole:]
+        if carry.size:
+            bits[filled] = np.packbits(carry)[0]
+            filled += 1
+        if filled != bits.size:
+            raise ValueError("Strips do not cover the mask")
+        return cls(shape, bits)
+
+    @classmethod
+    def from_rle(cls, shape, runs):
+        # Alternating run lengths in row-major order, starting with a run of zeros
+        runs = np.asarray(runs, dtype=np.int64)
+        values = np.zeros(len(runs), dtype=bool)
+        values[1::2] = True
+        flat = np.repeat(values, runs)
+        if flat.size != shape[0] * shape[1]:
+            raise ValueError("Run lengths do not add up to the mask size")
+        return cls(shape, np.packbits(flat))
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def to_array(self, value=1):
+        # uint8 mask with `value` for water; pass 255 for an image-ready mask
+        flat = np.unpackbits(self.bits, count=self.size)
+        if value != 1:
+            flat *= np.uint8(value)
+        return flat.reshape(self.shape)
+
+    def strips(self, rows=1024):
+        # (row_offset, 0/1 uint8 strip) pieces, unpacking only one strip at a time
+        width = self.shape[1]
+        for y in range(0, self.shape[0], rows):
+            start, count = y * width, min(rows, self.shape[0] - y) * width
+            chunk = np.unpackbits(self.bits[start // 8:-(-(start + count) // 8)])
+            yield y, chunk[start % 8:start % 8 + count].reshape(-1, width)
+
+    def to_rle(self):
+        flat = np.unpackbits(self.bits, count=self.size)
+        edges = np.flatnonzero(np.diff(flat)) + 1
+        boundaries = np.concatenate(([0], edges, [flat.size]))
+        runs = np.diff(boundaries)
+        # Runs start with zeros; a mask starting with water gets a leading empty run
+        if flat.size and flat[0]:
+            runs = np.concatenate(([0], runs))
+        return runs.astype(np.uint32)
+
+    def count(self):
+        return _popcount(self.bits)
+
+    def fraction(self):
+        return self.count() / self.size if self.size else 0.0
+
+    def area(self, area_per_pixel=1.0):
+        return self.count() * area_per_pixel
+
+    def _check(self, other):
+        if self.shape != other.shape:
+            raise ValueError(f"Mask shapes differ: {self.shape} and {other.shape}")
+
+    def union(self, other):
+        self._check(other)
+        return PackedMask(self.shape, self.bits | other.bits)
+
+    def intersection(self, other):
+        self._check(other)
+        return PackedMask(self.shape, self.bits & other.bits)
+
+    def difference(self, other):
+        # Water in this mask but not in the other
+        self._check(other)
+        return PackedMask(self.shape, self.bits & ~other.bits)
+
+    def symmetric_difference(self, other):
+        self._check(other)
+        return PackedMask(self.shape, self.bits ^ other.bits)
+
+    def invert(self):
+        bits = ~self.bits
+        padding = bits.size * 8 - self.size
+        if padding:
+            bits[-1] &= np.uint8(0xFF << padding & 0xFF)
+        return PackedMask(self.shape, bits)
+
+    def iou(self, other):
+        union = self.union(other).count()
+        return 1.0 if union == 0 else self.intersection(other).count() / union
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    __xor__ = symmetric_difference
+    __invert__ = invert
+
+    def __eq__(self, other):
+        return isinstance(other, PackedMask) and self.shape == other.shape and np.array_equal(self.bits, other.bits)
+
+    def __repr__(self):
+        return f"PackedMask(shape={self.shape}, fraction={self.fraction():.4f})"
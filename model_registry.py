@@ -0,0 +1,188 @@
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from instrumentation import stage
+from utils import DEFAULT_BACKEND, IMG_SIZE, load_keras_model
+
+# Memory budget for resident models in MB (unset means no limit)
+MODEL_MEMORY_BUDGET_MB = os.environ.get("AQUASENSE_MODEL_MEMORY_MB")
+# Models unused for this many seconds are evicted on the next access (unset disables)
+MODEL_IDLE_TIMEOUT_S = os.environ.get("AQUASENSE_MODEL_IDLE_TIMEOUT_S")
+# Model loaded in the background when the app starts (empty disables)
+PREWARM_MODEL = os.environ.get("AQUASENSE_PREWARM_MODEL", "U-Net")
+
+
+def model_size_bytes(model):
+    # Runtime backends report their own size
+    if hasattr(model, "size_bytes"):
+        return model.size_bytes
+    # Size of all weights, computed from shapes so no tensor is copied to host
+    total = 0
+    for weight in model.weights:
+        total += int(np.prod(weight.shape)) * np.dtype(weight.dtype).itemsize
+    return total
+
+
+def warm_up_model(model):
+    # Dummy predicts so graph tracing happens at load time, not on the first upload. Compiled
+    # models trace one graph per batch size, and tiles, TTA and multi-image uploads reach all of them
+    input_shape = [IMG_SIZE if dim is None else dim for dim in model.input_shape[1:]]
+    for batch_size in getattr(model, "batch_sizes", (1,)):
+        dummy = np.zeros((batch_size, *input_shape), dtype=np.float32)
+        model.predict(dummy, verbose=0)
+
+
+class ModelEntry:
+    def __init__(self, name, backend, model, load_time, warmup_time, size_bytes):
+        self.name = name
+        self.backend = backend
+        self.model = model
+        self.load_time = load_time
+        self.warmup_time = warmup_time
+        self.size_bytes = size_bytes
+        self.last_used = time.monotonic()
+        self.uses = 0
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "backend": self.backend,
+            "load_time_s": self.load_time,
+            "warmup_time_s": self.warmup_time,
+            "size_mb": self.size_bytes / (1024 * 1024),
+            "idle_s": time.monotonic() - self.last_used,
+            "uses": self.uses
+        }
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded models, shared by every Streamlit session."""
+
+    def __init__(self, loader=load_keras_model, memory_budget_mb=None, idle_timeout=None, warmup=True):
+        self.loader = loader
+        self.memory_budget_mb = memory_budget_mb
+        self.idle_timeout = idle_timeout
+        self.warmup = warmup
+        self._entries = OrderedDict()  # least recently used first
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._prewarming = {}
+
+    def get(self, model_name, backend=DEFAULT_BACKEND):
+        key = (model_name, backend)
+        with self._lock:
+            self._evict_idle()
+            entry = self._touch(key)
+            if entry is not None:
+                return entry.model
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Load outside the registry lock so other models stay available,
+        # while concurrent requests for the same model wait for a single load
+        with load_lock:
+            with self._lock:
+                entry = self._touch(key)
+                if entry is not None:
+                    return entry.model
+
+            start = time.perf_counter()
+            with stage("model_load"):
+                model = self.loader(model_name, backend)
+            load_time = time.perf_counter() - start
+
+            warmup_time = 0.0
+            if self.warmup:
+                start = time.perf_counter()
+                with stage("model_warmup"):
+                    warm_up_model(model)
+                warmup_time = time.perf_counter() - start
+
+            entry = ModelEntry(model_name, backend, model, load_time, warmup_time, model_size_bytes(model))
+            with self._lock:
+                self._entries[key] = entry
+                self._touch(key)
+                self._evict_over_budget(keep=key)
+            return model
+
+    def prewarm(self, model_name, backend=DEFAULT_BACKEND):
+        # Loads a model on a daemon thread, once per model; a later get() waits on the same load lock
+        key = (model_name, backend)
+        with self._lock:
+            thread = self._prewarming.get(key)
+            if thread is None:
+                thread = threading.Thread(target=self._prewarm, args=key, daemon=True, name="model-prewarm")
+                self._prewarming[key] = thread
+                thread.start()
+        return thread
+
+    def _prewarm(self, model_name, backend):
+        try:
+            self.get(model_name, backend)
+        except Exception:
+            # The foreground get() reports the error when the model is actually needed
+            with self._lock:
+                self._prewarming.pop((model_name, backend), None)
+
+    def stats(self, model_name=None, backend=DEFAULT_BACKEND):
+        with self._lock:
+            if model_name is not None:
+                entry = self._entries.get((model_name, backend))
+                return entry.stats() if entry is not None else None
+            return [entry.stats() for entry in self._entries.values()]
+
+    def resident_mb(self):
+        with self._lock:
+            return sum(entry.size_bytes for entry in self._entries.values()) / (1024 * 1024)
+
+    def evict(self, model_name, backend=DEFAULT_BACKEND):
+        with self._lock:
+            removed = self._entries.pop((model_name, backend), None)
+        if removed is not None:
+            del removed
+            gc.collect()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        gc.collect()
+
+    def _touch(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.last_used = time.monotonic()
+            entry.uses += 1
+            self._entries.move_to_end(key)
+        return entry
+
+    def _evict_idle(self):
+        if not self.idle_timeout:
+            return
+        now = time.monotonic()
+        idle = [key for key, entry in self._entries.items() if now - entry.last_used > self.idle_timeout]
+        for key in idle:
+            del self._entries[key]
+        if idle:
+            gc.collect()
+
+    def _evict_over_budget(self, keep):
+        if not self.memory_budget_mb:
+            return
+        budget = self.memory_budget_mb * 1024 * 1024
+        evicted = False
+        while sum(entry.size_bytes for entry in self._entries.values()) > budget:
+            victim = next((key for key in self._entries if key != keep), None)
+            if victim is None:
+                break  # a single model larger than the budget is still kept
+            del self._entries[victim]
+            evicted = True
+        if evicted:
+            gc.collect()
+
+
+registry = ModelRegistry(
+    memory_budget_mb=float(MODEL_MEMORY_BUDGET_MB) if MODEL_MEMORY_BUDGET_MB else None,
+    idle_timeout=float(MODEL_IDLE_TIMEOUT_S) if MODEL_IDLE_TIMEOUT_S else None
+)
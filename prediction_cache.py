@@ -0,0 +1,146 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from utils import MODEL_PATHS, model_file
+
+# Memory tier size in MB and optional directory for the on-disk tier
+PREDICTION_CACHE_MB = float(os.environ.get("AQUASENSE_PREDICTION_CACHE_MB", 256))
+PREDICTION_CACHE_DIR = os.environ.get("AQUASENSE_PREDICTION_CACHE_DIR")
+
+
+def content_hash(data):
+    # Hash of the raw uploaded bytes, accepts bytes or a file-like object
+    if hasattr(data, "getvalue"):
+        data = data.getvalue()
+    elif hasattr(data, "read"):
+        position = data.tell()
+        data.seek(0)
+        raw = data.read()
+        data.seek(position)
+        data = raw
+    return hashlib.sha256(data).hexdigest()
+
+
+def model_version(model_name, backend="keras"):
+    # Changes whenever the weights file is replaced
+    if model_name not in MODEL_PATHS:
+        return "unversioned"
+    path = model_file(model_name, backend)
+    if not os.path.exists(path):
+        return "unversioned"
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def make_key(image_hash, model_name, variant="", backend="keras"):
+    # variant identifies inference settings that change the probabilities (e.g. tiling)
+    parts = [image_hash, model_name, backend, model_version(model_name, backend), variant]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class PredictionCache:
+    """Two-tier cache of probability maps: an LRU in memory and optional .npy files on disk."""
+
+    def __init__(self, max_memory_mb=PREDICTION_CACHE_MB, disk_dir=None):
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            probabilities = self._entries.get(key)
+            if probabilities is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return probabilities
+
+        probabilities = self._load(key)
+        with self._lock:
+            if probabilities is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, probabilities)
+        return probabilities
+
+    def put(self, key, probabilities):
+        # Copy so the entry never keeps a caller's larger batch alive behind a view, and its
+        # nbytes is the memory it actually holds. Cached arrays are shared between sessions,
+        # so the copy is read-only
+        probabilities = np.array(probabilities, dtype=np.float32, copy=True)
+        probabilities.flags.writeable = False
+        with self._lock:
+            self._remember(key, probabilities)
+        self._store(key, probabilities)
+        return probabilities
+
+    def get_or_compute(self, key, compute):
+        probabilities = self.get(key)
+        if probabilities is None:
+            probabilities = self.put(key, compute())
+        return probabilities
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "memory_mb": self._memory_bytes / (1024 * 1024),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+
+    def _remember(self, key, probabilities):
+        if probabilities.nbytes > self.max_memory_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous.nbytes
+        self._entries[key] = probabilities
+        self._memory_bytes += probabilities.nbytes
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.npy")
+
+    def _load(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            probabilities = np.load(self._path(key))
+        except (OSError, ValueError):
+            return None
+        probabilities.flags.writeable = False
+        return probabilities
+
+    def _store(self, key, probabilities):
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, probabilities)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+prediction_cache = PredictionCache(disk_dir=PREDICTION_CACHE_DIR)
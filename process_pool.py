@@ -0,0 +1,202 @@
+import atexit
+import math
+import multiprocessing as mp
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+CORES_PER_WORKER = int(os.environ.get("AQUASENSE_CORES_PER_WORKER", 4))
+WORKER_BATCH_SIZE = 8
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _worker_main(model_name, backend, loader, cores, intra_op, inter_op, input_name, input_shape, max_batch, conn):
+    # Pin the process and size TF's thread pools before TensorFlow is imported
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    os.environ["OMP_NUM_THREADS"] = str(intra_op)
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+
+    input_shm = output_shm = None
+    try:
+        if loader is None:
+            from utils import load_keras_model
+            loader = load_keras_model
+        model = loader(model_name, backend)
+        input_shm = shared_memory.SharedMemory(name=input_name)
+        inputs = np.ndarray((max_batch, *input_shape), dtype=np.float32, buffer=input_shm.buf)
+
+        # Probe the output shape once, then expose an output slot of the same batch capacity
+        probe = np.asarray(model.predict(np.zeros((1, *input_shape), dtype=np.float32), verbose=0), dtype=np.float32)
+        output_shape = probe.shape[1:]
+        output_shm = shared_memory.SharedMemory(create=True, size=max_batch * probe[0].nbytes)
+        outputs = np.ndarray((max_batch, *output_shape), dtype=np.float32, buffer=output_shm.buf)
+        conn.send(("ready", output_shm.name, output_shape))
+    except Exception as e:
+        conn.send(("error", repr(e), None))
+        return
+
+    try:
+        while True:
+            n = conn.recv()
+            if n is None:
+                break
+            try:
+                outputs[:n] = model.predict(inputs[:n], verbose=0)
+                conn.send(("ok", n, None))
+            except Exception as e:
+                conn.send(("error", repr(e), None))
+    finally:
+        inputs = outputs = None
+        input_shm.close()
+        output_shm.close()
+        output_shm.unlink()
+
+
+class _Worker:
+    def __init__(self, ctx, model_name, backend, loader, cores, intra_op, inter_op, input_shape, max_batch):
+        self.max_batch = max_batch
+        self.input_shm = shared_memory.SharedMemory(create=True, size=max_batch * int(np.prod(input_shape)) * 4)
+        self.inputs = np.ndarray((max_batch, *input_shape), dtype=np.float32, buffer=self.input_shm.buf)
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(model_name, backend, loader, cores, intra_op, inter_op, self.input_shm.name,
+                  tuple(input_shape), max_batch, child_conn),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self):
+        status, name, output_shape = self.conn.recv()
+        if status != "ready":
+            raise RuntimeError(f"Inference worker failed to start: {name}")
+        self.output_shm = shared_memory.SharedMemory(name=name)
+        self.outputs = np.ndarray((self.max_batch, *output_shape), dtype=np.float32, buffer=self.output_shm.buf)
+
+    def run(self, batch):
+        # Only the batch size crosses the pipe, the tensors stay in shared memory
+        n = len(batch)
+        self.inputs[:n] = batch
+        self.conn.send(n)
+        status, detail, _ = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Inference worker error: {detail}")
+        return self.outputs[:n].copy()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=10)
+        if self.process.is_alive():
+            self.process.terminate()
+        # Views into the segments must be released before they can be closed
+        self.inputs = self.outputs = None
+        if hasattr(self, "output_shm"):
+            self.output_shm.close()
+        self.input_shm.close()
+        self.input_shm.unlink()
+
+
+class InferencePool:
+    """Worker processes that each hold a model pinned to their own cores.
+
+    predict() has the Keras signature, so the pool drops into predict_tiled and
+    predict_probabilities_batch; large batches are split across idle workers.
+    """
+
+    def __init__(self, model_name, backend="keras", workers=None, cores_per_worker=CORES_PER_WORKER,
+                 inter_op=1, max_batch=WORKER_BATCH_SIZE, input_shape=None, loader=None):
+        from utils import IMG_SIZE
+        self._closed = False
+        self._executor = None
+        cores = available_cores()
+        cores_per_worker = max(1, min(cores_per_worker, len(cores)))
+        workers = workers or max(1, len(cores) // cores_per_worker)
+        self.input_shape = (None, *(input_shape or (IMG_SIZE, IMG_SIZE, 3)))
+        self.max_batch = max_batch
+
+        # spawn keeps TensorFlow state from being forked into the workers
+        ctx = mp.get_context("spawn")
+        self._workers = []
+        for i in range(workers):
+            worker_cores = cores[(i * cores_per_worker) % len(cores):][:cores_per_worker]
+            self._workers.append(_Worker(ctx, model_name, backend, loader, worker_cores, cores_per_worker,
+                                         inter_op, self.input_shape[1:], max_batch))
+        try:
+            for worker in self._workers:
+                worker.wait_ready()
+        except Exception:
+            self.close()
+            raise
+        self.output_shape = (None, *self._workers[0].outputs.shape[1:])
+
+        self._idle = queue.Queue()
+        for worker in self._workers:
+            self._idle.put(worker)
+        self._executor = ThreadPoolExecutor(len(self._workers), thread_name_prefix="pool-dispatch")
+        # Unregistered on close, so closed pools can be collected
+        atexit.register(self.close)
+
+    @property
+    def workers(self):
+        return len(self._workers)
+
+    def _run_chunk(self, chunk):
+        worker = self._idle.get()
+        try:
+            return worker.run(chunk)
+        finally:
+            self._idle.put(worker)
+
+    def predict(self, x, batch_size=None, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+        if not len(x):
+            return np.empty((0, *self.output_shape[1:]), dtype=np.float32)
+        # Spread the batch evenly over the workers, capped by the shared-memory slot size
+        chunk = min(self.max_batch, max(1, math.ceil(len(x) / len(self._workers))))
+        chunks = [x[start:start + chunk] for start in range(0, len(x), chunk)]
+        if len(chunks) == 1:
+            return self._run_chunk(chunks[0])
+        return np.concatenate(list(self._executor.map(self._run_chunk, chunks)), axis=0)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        for worker in self._workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_model(model_name, backend="keras", processes=0, cores_per_worker=CORES_PER_WORKER):
+    """An InferencePool of `processes` workers, or the shared in-process model when 0.
+
+    Returns (model, pool); the caller closes the pool, which is None in-process.
+    """
+    if processes:
+        pool = InferencePool(model_name, backend, workers=processes, cores_per_worker=cores_per_worker)
+        return pool, pool
+    from model_registry import registry
+    return registry.get(model_name, backend), None
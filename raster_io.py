@@ -0,0 +1,371 @@
+import math
+import os
+import struct
+import numpy as np
+from PIL import Image
+
+try:
+    import rasterio
+    from rasterio.windows import Window
+except ImportError:  # optional, only needed for compressed GeoTIFFs
+    rasterio = None
+
+TIFF_EXTENSIONS = (".tif", ".tiff")
+
+# TIFF field types: numpy dtype and values per count
+TIFF_TYPES = {
+    1: ("u1", 1), 2: ("S1", 1), 3: ("u2", 1), 4: ("u4", 1), 5: ("u4", 2),
+    6: ("i1", 1), 7: ("u1", 1), 8: ("i2", 1), 9: ("i4", 1), 10: ("i4", 2),
+    11: ("f4", 1), 12: ("f8", 1), 16: ("u8", 1), 17: ("i8", 1), 18: ("u8", 1)
+}
+SAMPLE_FORMATS = {1: "u", 2: "i", 3: "f"}
+# Pixels sampled across the scene to find the value range of float and signed rasters
+RANGE_SAMPLE_PX = 512 * 512
+
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+BITS_PER_SAMPLE = 258
+COMPRESSION = 259
+STRIP_OFFSETS = 273
+SAMPLES_PER_PIXEL = 277
+ROWS_PER_STRIP = 278
+STRIP_BYTE_COUNTS = 279
+PLANAR_CONFIG = 284
+TILE_WIDTH = 322
+TILE_LENGTH = 323
+TILE_OFFSETS = 324
+TILE_BYTE_COUNTS = 325
+SAMPLE_FORMAT = 339
+MODEL_PIXEL_SCALE = 33550
+MODEL_TIEPOINT = 33922
+MODEL_TRANSFORMATION = 34264
+GEO_KEY_DIRECTORY = 34735
+GEO_KEY_PROJECTED_CRS = 3072
+GEO_KEY_GEOGRAPHIC_CRS = 2048
+
+
+class TiffFormatError(ValueError):
+    # Any TIFF the memory-mapped reader cannot handle; open_raster falls back to other readers
+    pass
+
+
+class RasterReader:
+    """Lazy raster: image[y0:y1, x0:x1] reads only that window as a (rows, cols, 3) array.
+
+    geotransform uses the GDAL order (x0, pixel_width, row_rotation, y0, column_rotation, pixel_height).
+    """
+
+    height = 0
+    width = 0
+    bands = 0
+    dtype = np.dtype(np.uint8)
+    geotransform = None
+    crs = None
+    _value_range = None
+
+    @property
+    def shape(self):
+        return (self.height, self.width, 3)
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    @property
+    def value_range(self):
+        # (low, high) mapped onto 0-255 for float, signed and 32/64-bit unsigned rasters, sampled
+        # once across the whole scene so every window is scaled the same way
+        if not _is_stretched(self.dtype):
+            return None
+        if self._value_range is None:
+            step = max(1, int(math.sqrt(self.height * self.width / RANGE_SAMPLE_PX)))
+            sample = self._read(slice(None, None, step), slice(None, None, step))
+            self._value_range = sample_value_range(rgb_bands(sample))
+        return self._value_range
+
+    def read_window(self, y, x, height, width):
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        return to_rgb_window(self._read(rows, cols), self.value_range)
+
+    def _read(self, rows, cols):
+        # Raw samples of a window, any slice steps applied
+        y0, y1, y_step = rows.indices(self.height)
+        x0, x1, x_step = cols.indices(self.width)
+        width = max(x1 - x0, 0)
+        if y_step == 1:
+            window = self.read_window(y0, x0, max(y1 - y0, 0), width)
+        else:
+            # Decimated reads fetch one row per step instead of the whole window
+            window = np.empty((len(range(y0, y1, y_step)), width, self.bands), dtype=self.dtype.newbyteorder("="))
+            for i, y in enumerate(range(y0, y1, y_step)):
+                window[i] = self.read_window(y, x0, 1, width).reshape(width, self.bands)
+        return window[:, ::x_step]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def rgb_bands(window):
+    # Band 1 as gray for one and two bands (the second is usually alpha), the first three otherwise
+    if window.ndim == 2:
+        window = window[..., None]
+    if window.shape[2] < 3:
+        return np.repeat(window[..., :1], 3, axis=2)
+    return window[..., :3]
+
+
+def _is_stretched(dtype):
+    # Sample types scaled from a value range rather than by a fixed shift
+    return dtype.kind in "fi" or (dtype.kind == "u" and dtype.itemsize > 2)
+
+
+def sample_value_range(samples):
+    # Floats already in 0-1 are taken as reflectance, anything else is stretched over its own range
+    finite = samples[np.isfinite(samples)] if samples.dtype.kind == "f" else samples.ravel()
+    if not finite.size:
+        return (0.0, 1.0)
+    low, high = float(finite.min()), float(finite.max())
+    if samples.dtype.kind == "f" and low >= 0.0 and high <= 1.0:
+        return (0.0, 1.0)
+    return (low, high)
+
+
+def to_rgb_window(window, value_range=None):
+    """Bring any band count and sample type to three uint8 channels.
+
+    uint16 keeps its high byte. Float, signed and wider unsigned samples are
+    scaled from value_range (by default the window's own) onto 0-255.
+    """
+    window = rgb_bands(window)
+    if window.dtype.kind == "u" and window.dtype.itemsize == 2:
+        window = (window >> 8).astype(np.uint8)
+    elif _is_stretched(window.dtype):
+        low, high = value_range or sample_value_range(window)
+        scaled = (window.astype(np.float32) - low) * (255.0 / (high - low) if high > low else 0.0)
+        window = np.clip(np.nan_to_num(scaled), 0, 255).astype(np.uint8)
+    return window
+
+
+class ArrayRaster(RasterReader):
+    # Wraps an in-memory array or PIL image
+    def __init__(self, image):
+        if hasattr(image, "convert"):
+            image = np.asarray(image.convert("RGB") if image.mode != "RGB" else image)
+        self.array = image
+        self.height, self.width = image.shape[:2]
+        self.bands = 1 if image.ndim == 2 else image.shape[2]
+        self.dtype = image.dtype
+
+    def read_window(self, y, x, height, width):
+        return self.array[y:y + height, x:x + width]
+
+
+class TiffRaster(RasterReader):
+    """Uncompressed striped or tiled (Geo)TIFF and BigTIFF, read through a memory map."""
+
+    def __init__(self, source, header_only=False):
+        if isinstance(source, (str, os.PathLike)):
+            self.buffer = np.memmap(source, dtype=np.uint8, mode="r")
+        else:
+            data = source.getvalue() if hasattr(source, "getvalue") else source.read()
+            self.buffer = np.frombuffer(data, dtype=np.uint8)
+
+        try:
+            self._parse(header_only)
+        except TiffFormatError:
+            raise
+        except (struct.error, ValueError, IndexError, KeyError, TypeError, ZeroDivisionError, OSError) as e:
+            # Truncated or unusual files fail anywhere in the hand-written parser
+            raise TiffFormatError(f"Cannot parse TIFF: {e!r}") from e
+
+    def _parse(self, header_only):
+        tags = self._read_ifd()
+        self.geotransform = self._geotransform(tags)
+        self.crs = self._crs(tags)
+        if header_only:
+            # Georeferencing only, for files whose pixels another reader decodes
+            return
+        if tags.get(COMPRESSION, [1])[0] != 1:
+            raise TiffFormatError("Only uncompressed TIFFs can be memory-mapped, install rasterio for compressed files")
+
+        self.width = int(tags[IMAGE_WIDTH][0])
+        self.height = int(tags[IMAGE_LENGTH][0])
+        self.bands = int(tags.get(SAMPLES_PER_PIXEL, [1])[0])
+        bits = int(tags.get(BITS_PER_SAMPLE, [8])[0])
+        kind = SAMPLE_FORMATS.get(int(tags.get(SAMPLE_FORMAT, [1])[0]), "u")
+        self.dtype = np.dtype(f"{self.byte_order}{kind}{bits // 8}")
+        self.planar = int(tags.get(PLANAR_CONFIG, [1])[0]) == 2
+
+        if TILE_OFFSETS in tags:
+            self.chunk_height = int(tags[TILE_LENGTH][0])
+            self.chunk_width = int(tags[TILE_WIDTH][0])
+            self.offsets = tags[TILE_OFFSETS]
+        else:
+            # Strips are handled as full-width tiles
+            self.chunk_height = min(int(tags.get(ROWS_PER_STRIP, [self.height])[0]), self.height)
+            self.chunk_width = self.width
+            self.offsets = tags[STRIP_OFFSETS]
+        self.chunks_down = -(-self.height // self.chunk_height)
+        self.chunks_across = -(-self.width // self.chunk_width)
+
+        self.array = self._contiguous_view()
+
+    def read_window(self, y, x, height, width):
+        if self.array is not None:
+            return self.array[y:y + height, x:x + width]
+
+        out = np.empty((height, width, self.bands), dtype=self.dtype.newbyteorder("="))
+        ch, cw = self.chunk_height, self.chunk_width
+        for row in range(y // ch, min(-(-(y + height) // ch), self.chunks_down)):
+            for col in range(x // cw, min(-(-(x + width) // cw), self.chunks_across)):
+                cy0, cx0 = row * ch, col * cw
+                ys = slice(max(y, cy0) - cy0, min(y + height, cy0 + ch) - cy0)
+                xs = slice(max(x, cx0) - cx0, min(x + width, cx0 + cw) - cx0)
+                oy, ox = cy0 + ys.start - y, cx0 + xs.start - x
+                region = out[oy:oy + ys.stop - ys.start, ox:ox + xs.stop - xs.start]
+                index = row * self.chunks_across + col
+                if self.planar:
+                    plane = self.chunks_down * self.chunks_across
+                    for band in range(self.bands):
+                        region[..., band] = self._chunk(band * plane + index, row, 1)[ys, xs, 0]
+                else:
+                    region[:] = self._chunk(index, row, self.bands)[ys, xs]
+        return out
+
+    def _chunk(self, index, row, bands):
+        ch, cw = self.chunk_height, self.chunk_width
+        start = int(self.offsets[index])
+        # The last strip may be shorter, tiles are always padded to full size
+        rows = min(ch, self.height - row * ch) if cw == self.width else ch
+        nbytes = rows * cw * bands * self.dtype.itemsize
+        return self.buffer[start:start + nbytes].view(self.dtype).reshape(rows, cw, bands)
+
+    def _contiguous_view(self):
+        # Zero-copy view when all strips are stored back to back, the common case
+        if self.planar or self.chunk_width != self.width:
+            return None
+        row_bytes = self.width * self.bands * self.dtype.itemsize
+        start = int(self.offsets[0])
+        for i, offset in enumerate(self.offsets):
+            if int(offset) != start + i * self.chunk_height * row_bytes:
+                return None
+        end = start + self.height * row_bytes
+        if end > self.buffer.size:
+            raise TiffFormatError("TIFF file is truncated")
+        return self.buffer[start:end].view(self.dtype).reshape(self.height, self.width, self.bands)
+
+    def _read_ifd(self):
+        header = bytes(self.buffer[:16])
+        self.byte_order = {b"II": "<", b"MM": ">"}.get(header[:2])
+        if self.byte_order is None:
+            raise TiffFormatError("Not a TIFF file")
+        version = struct.unpack(self.byte_order + "H", header[2:4])[0]
+        if version == 42:
+            offset = struct.unpack(self.byte_order + "I", header[4:8])[0]
+            count_fmt, entry_fmt, entry_size, inline = "H", "HHI", 12, 4
+        elif version == 43:
+            offset = struct.unpack(self.byte_order + "Q", header[8:16])[0]
+            count_fmt, entry_fmt, entry_size, inline = "Q", "HHQ", 20, 8
+        else:
+            raise TiffFormatError(f"Unsupported TIFF version: {version}")
+
+        count_size = struct.calcsize(count_fmt)
+        count = struct.unpack(self.byte_order + count_fmt, bytes(self.buffer[offset:offset + count_size]))[0]
+        tags = {}
+        for i in range(count):
+            entry = offset + count_size + i * entry_size
+            raw = bytes(self.buffer[entry:entry + entry_size])
+            tag, field_type, n = struct.unpack(self.byte_order + entry_fmt, raw[:entry_size - inline])
+            if field_type not in TIFF_TYPES:
+                continue
+            code, per_value = TIFF_TYPES[field_type]
+            dtype = np.dtype(self.byte_order + code)
+            nbytes = dtype.itemsize * per_value * n
+            if nbytes <= inline:
+                data = raw[entry_size - inline:entry_size - inline + nbytes]
+            else:
+                value_offset = struct.unpack(self.byte_order + ("I" if inline == 4 else "Q"), raw[-inline:])[0]
+                data = bytes(self.buffer[value_offset:value_offset + nbytes])
+            values = np.frombuffer(data, dtype=dtype)
+            if field_type in (5, 10):
+                values = values[0::2] / values[1::2]
+            tags[tag] = values
+        return tags
+
+    def _geotransform(self, tags):
+        if MODEL_TRANSFORMATION in tags:
+            m = tags[MODEL_TRANSFORMATION]
+            return (float(m[3]), float(m[0]), float(m[1]), float(m[7]), float(m[4]), float(m[5]))
+        if MODEL_PIXEL_SCALE in tags and MODEL_TIEPOINT in tags:
+            sx, sy = float(tags[MODEL_PIXEL_SCALE][0]), float(tags[MODEL_PIXEL_SCALE][1])
+            i, j, _, x, y, _ = (float(v) for v in tags[MODEL_TIEPOINT][:6])
+            return (x - i * sx, sx, 0.0, y + j * sy, 0.0, -sy)
+        return None
+
+    def _crs(self, tags):
+        keys = tags.get(GEO_KEY_DIRECTORY)
+        if keys is None:
+            return None
+        for k in range(1, int(keys[3]) + 1):
+            key_id, location, _, value = (int(v) for v in keys[4 * k:4 * k + 4])
+            if location == 0 and key_id in (GEO_KEY_PROJECTED_CRS, GEO_KEY_GEOGRAPHIC_CRS) and value not in (0, 32767):
+                return f"EPSG:{value}"
+        return None
+
+    def close(self):
+        self.array = None
+        self.buffer = None
+
+
+class RasterioRaster(RasterReader):
+    # Windowed reads through rasterio/GDAL, used for compressed GeoTIFFs when available
+    def __init__(self, source):
+        self.dataset = rasterio.open(source)
+        self.height, self.width = self.dataset.height, self.dataset.width
+        self.bands = self.dataset.count
+        self.dtype = np.dtype(self.dataset.dtypes[0])
+        self.geotransform = self.dataset.transform.to_gdal()
+        self.crs = self.dataset.crs.to_string() if self.dataset.crs else None
+
+    def read_window(self, y, x, height, width):
+        data = self.dataset.read(window=Window(x, y, width, height))
+        return np.moveaxis(data, 0, -1)
+
+    def close(self):
+        self.dataset.close()
+
+
+def open_raster(source):
+    # Path, uploaded file or in-memory image to the lightest reader that can window it
+    name = getattr(source, "name", source if isinstance(source, (str, os.PathLike)) else "")
+    if str(name).lower().endswith(TIFF_EXTENSIONS):
+        try:
+            return TiffRaster(source)
+        except ValueError:
+            if hasattr(source, "seek"):
+                source.seek(0)
+            if rasterio is not None:
+                return RasterioRaster(source)
+        # Compressed TIFF without rasterio: PIL decodes it once, the geotags come from the header
+        raster = ArrayRaster(Image.open(source))
+        if hasattr(source, "seek"):
+            source.seek(0)
+        try:
+            header = TiffRaster(source, header_only=True)
+            raster.geotransform, raster.crs = header.geotransform, header.crs
+        except ValueError:
+            pass
+        return raster
+    if isinstance(source, (str, os.PathLike)) or hasattr(source, "read"):
+        # JPEG and PNG cannot be windowed, they are decoded once
+        return ArrayRaster(Image.open(source))
+    return ArrayRaster(source)
@@ -0,0 +1,91 @@
+import numpy as np
+import cv2
+from instrumentation import timed
+
+WATER_COLOR = np.array([65, 105, 225], dtype=np.uint8)  # Royal Blue for water
+# Above this water fraction a full LUT pass beats gathering the water pixels
+DENSE_WATER_FRACTION = 0.03
+
+
+class RenderBuffers:
+    """Reusable output buffers for render_results, reallocated only when the image size changes.
+
+    The arrays returned by render_results are views of these buffers and are
+    overwritten by the next call, so use one RenderBuffers per result kept alive.
+    """
+
+    def __init__(self):
+        self.size = None
+
+    def ensure(self, height, width):
+        if self.size != (height, width):
+            self.size = (height, width)
+            self.mask = np.empty((height, width), dtype=np.uint8)
+            self.inverse = np.empty((height, width), dtype=np.uint8)
+            self.colored = np.empty((height, width, 3), dtype=np.uint8)
+            self.overlay = np.empty((height, width, 3), dtype=np.uint8)
+        return self
+
+
+def blend_lut(opacity, color=WATER_COLOR):
+    # lut[value, channel] is the addWeighted result for one water pixel
+    values = np.arange(256, dtype=np.float32)[:, None]
+    blended = values * (1 - opacity) + color.astype(np.float32)[None, :] * opacity
+    return np.clip(np.rint(blended), 0, 255).astype(np.uint8)
+
+
+@timed("render")
+def render_results(original, probabilities, threshold=0.5, opacity=0.3, buffers=None):
+    """Binary mask (0/255), colored mask and overlay in one pass over preallocated buffers."""
+    original = np.asarray(original)
+    height, width = original.shape[:2]
+    buffers = (buffers or RenderBuffers()).ensure(height, width)
+    mask = buffers.mask
+
+    probabilities = np.squeeze(probabilities)
+    if probabilities.ndim == 3:
+        probabilities = probabilities[..., 0]  # multi-channel outputs carry the water probability first
+    if probabilities.ndim != 2:
+        raise ValueError(f"Cannot render probabilities of shape {probabilities.shape}")
+    if probabilities.shape == (height, width):
+        np.greater(probabilities, threshold, out=mask.view(bool))
+    else:
+        # Threshold at model resolution, then upscale the 0/1 mask like postprocess_prediction
+        small = np.greater(probabilities, threshold).view(np.uint8)
+        resized = cv2.resize(small, (width, height), dst=mask)
+        if resized is not mask:
+            np.copyto(mask, resized)
+
+    # Per-channel writes are much faster than a broadcast (h, w, 1) * (3,) multiply
+    for channel in range(3):
+        np.multiply(mask, WATER_COLOR[channel], out=buffers.colored[..., channel])
+
+    overlay = buffers.overlay
+    lut = blend_lut(opacity)
+    if cv2.countNonZero(mask) > DENSE_WATER_FRACTION * mask.size:
+        cv2.LUT(original, lut.reshape(256, 1, 3), dst=overlay)
+        cv2.compare(mask, 0, cv2.CMP_EQ, dst=buffers.inverse)
+        cv2.copyTo(original, buffers.inverse, overlay)
+    else:
+        np.copyto(overlay, original)
+        water = np.flatnonzero(mask)
+        flat = overlay.reshape(-1, 3)
+        flat[water] = lut[original.reshape(-1, 3)[water], np.arange(3)]
+
+    mask *= 255
+    return mask, buffers.colored, overlay
+
+
+def render_overlay(image, strips, opacity=0.3):
+    """Full-size overlay from (row_offset, 0/1 mask strip) pieces, rendered one band at a time.
+
+    Only the output is held whole; raster readers decode just the band being
+    blended and the render buffers are reused across bands.
+    """
+    height, width = image.shape[:2]
+    out = np.empty((height, width, 3), dtype=np.uint8)
+    buffers = RenderBuffers()
+    for y, strip in strips:
+        band = np.ascontiguousarray(image[y:y + len(strip), 0:width])
+        out[y:y + len(strip)] = render_results(band, strip, 0.5, opacity, buffers)[2]
+    return out
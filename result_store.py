@@ -0,0 +1,252 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import numpy as np
+
+# Where saved runs are kept. Saving is opt-in: runs keep full probability maps on disk
+# with no size limit, so the history is disabled unless this is set
+RESULT_STORE_DIR = os.environ.get("AQUASENSE_RESULT_STORE_DIR", "")
+DAY_S = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    image_hash TEXT NOT NULL,
+    file_name TEXT,
+    model TEXT NOT NULL,
+    backend TEXT,
+    variant TEXT,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    height INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    channels INTEGER NOT NULL,
+    scene_height INTEGER NOT NULL,
+    scene_width INTEGER NOT NULL,
+    threshold REAL,
+    water_pixels INTEGER,
+    water_fraction REAL,
+    water_area REAL,
+    crs TEXT,
+    min_x REAL,
+    min_y REAL,
+    max_x REAL,
+    max_y REAL
+);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created);
+CREATE INDEX IF NOT EXISTS runs_image ON runs (image_hash, model);
+CREATE VIRTUAL TABLE IF NOT EXISTS runs_bounds USING rtree (id, min_x, max_x, min_y, max_y);
+"""
+
+
+def scene_bounds(geotransform, height, width):
+    # (min_x, min_y, max_x, max_y) of a raster from the corners of its GDAL geotransform
+    x0, dx, rx, y0, ry, dy = geotransform
+    xs = [x0 + dx * col + rx * row for row in (0, height) for col in (0, width)]
+    ys = [y0 + ry * col + dy * row for row in (0, height) for col in (0, width)]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _water_rows(array, y, rows, grid=None):
+    # Water channel of a band of rows, read straight from the memory map; grid resamples
+    # a finer array at the (row, column) indices of a coarser one
+    if grid is None:
+        return array[y:y + rows] if array.ndim == 2 else array[y:y + rows, :, 0]
+    band = array[grid[0][y:y + rows]]
+    return band[:, grid[1]] if array.ndim == 2 else band[:, grid[1], 0]
+
+
+def _sample_grid(shape, size):
+    # Nearest rows and columns of an array of `shape` at the pixel centres of a `size` grid
+    return tuple(((np.arange(n) + 0.5) * (length / n)).astype(np.intp) for n, length in zip(size, shape[:2]))
+
+
+class ResultStore:
+    """Saved runs: arrays as .npy files on disk, indexed in SQLite.
+
+    Each run records the image hash, model, time, water statistics and, for
+    georeferenced scenes, its bounds in an R-tree, so queries by area and time
+    stay fast as the history grows. Arrays are reopened memory-mapped and
+    read-only, so loading a run copies nothing until its pixels are touched.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "arrays"), exist_ok=True)
+        self._lock = threading.Lock()
+        # One connection shared by Streamlit's session threads, serialised by the lock
+        self._db = sqlite3.connect(os.path.join(directory, "runs.sqlite"), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+
+    def save(self, array, image_hash, model_name, backend="", variant="", file_name=None, kind="probabilities",
+             threshold=0.5, geotransform=None, crs=None, area_per_pixel=None, created=None, scene_size=None):
+        """Store a probability map or binary mask and return the run id.
+
+        scene_size is the (height, width) of the scene the array was predicted
+        for, when the array is at model resolution; geotransform and
+        area_per_pixel refer to scene pixels.
+        """
+        if kind not in ("probabilities", "mask"):
+            raise ValueError(f"Unknown result kind: {kind}")
+        array = np.asarray(array, dtype=np.float32 if kind == "probabilities" else np.uint8)
+        height, width = array.shape[:2]
+        scene_height, scene_width = scene_size or (height, width)
+        channels = 1 if array.ndim == 2 else array.shape[2]
+        # Statistics on the water channel; masks are stored as 0/1
+        water = array if array.ndim == 2 else array[..., 0]
+        water_pixels = int(np.count_nonzero(water > threshold if kind == "probabilities" else water))
+        water_fraction = water_pixels / max(height * width, 1)
+        bounds = scene_bounds(geotransform, scene_height, scene_width) if geotransform is not None else (None,) * 4
+
+        path = os.path.join("arrays", f"{uuid.uuid4().hex}.npy")
+        full_path = os.path.join(self.directory, path)
+        tmp_path = f"{full_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, full_path)
+
+        row = {
+            "created": time.time() if created is None else created,
+            "image_hash": image_hash,
+            "file_name": file_name,
+            "model": model_name,
+            "backend": backend,
+            "variant": variant,
+            "kind": kind,
+            "path": path,
+            "height": height,
+            "width": width,
+            "channels": channels,
+            "scene_height": scene_height,
+            "scene_width": scene_width,
+            "threshold": threshold,
+            "water_pixels": water_pixels,
+            "water_fraction": water_fraction,
+            "water_area": water_fraction * scene_height * scene_width * area_per_pixel if area_per_pixel else None,
+            "crs": crs,
+            "min_x": bounds[0],
+            "min_y": bounds[1],
+            "max_x": bounds[2],
+            "max_y": bounds[3]
+        }
+        try:
+            with self._lock, self._db:
+                cursor = self._db.execute(
+                    f"INSERT INTO runs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})", list(row.values()))
+                run_id = cursor.lastrowid
+                if geotransform is not None:
+                    self._db.execute("INSERT INTO runs_bounds VALUES (?, ?, ?, ?, ?)",
+                                     (run_id, bounds[0], bounds[2], bounds[1], bounds[3]))
+        except sqlite3.Error:
+            os.remove(full_path)
+            raise
+        return run_id
+
+    def query(self, bounds=None, crs=None, since=None, until=None, model_name=None, image_hash=None, limit=None):
+        """Runs matching every given filter, newest first.
+
+        bounds is (min_x, min_y, max_x, max_y) and matches runs that intersect
+        it. Coordinates only compare within one CRS, so bounds require crs
+        (e.g. "EPSG:32633") and only match runs stored in it. since and until
+        are Unix timestamps.
+        """
+        clauses, params = [], []
+        if bounds is not None:
+            if crs is None:
+                raise ValueError("bounds need the crs they are given in")
+            clauses.append("id IN (SELECT id FROM runs_bounds WHERE max_x >= ? AND min_x <= ? AND max_y >= ? AND min_y <= ?)")
+            params += [bounds[0], bounds[2], bounds[1], bounds[3]]
+        for clause, value in (("crs = ?", crs), ("created >= ?", since), ("created <= ?", until),
+                              ("model = ?", model_name), ("image_hash = ?", image_hash)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        sql = "SELECT * FROM runs"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params)]
+
+    def get(self, run_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def load(self, run_id):
+        # Read-only memory map of the stored array
+        run = self.get(run_id)
+        if run is None:
+            raise KeyError(f"No run with id {run_id}")
+        return np.load(os.path.join(self.directory, run["path"]), mmap_mode="r")
+
+    def compare(self, first_id, second_id, rows=1024):
+        """Water IoU, gain and loss between two runs of the same scene, streamed over memory maps.
+
+        Runs stored at different resolutions (e.g. resized and tiled) are
+        compared on the coarser grid, and pixel counts are in its pixels.
+        """
+        runs, masks = [], []
+        for run_id in (first_id, second_id):
+            run = self.get(run_id)
+            if run is None:
+                raise KeyError(f"No run with id {run_id}")
+            runs.append(run)
+            masks.append((self.load(run_id), run["threshold"] if run["kind"] == "probabilities" else 0))
+        (first_array, first_threshold), (second_array, second_threshold) = masks
+        scenes = [(run["scene_height"], run["scene_width"]) for run in runs]
+        if scenes[0] != scenes[1]:
+            raise ValueError("Runs cover scenes of different sizes")
+
+        size = min(first_array.shape[:2], second_array.shape[:2], key=lambda shape: shape[0] * shape[1])
+        grids = [None if array.shape[:2] == size else _sample_grid(array.shape, size)
+                 for array in (first_array, second_array)]
+        both = either = gain = loss = 0
+        for y in range(0, size[0], rows):
+            first = _water_rows(first_array, y, rows, grids[0]) > first_threshold
+            second = _water_rows(second_array, y, rows, grids[1]) > second_threshold
+            both += int(np.count_nonzero(first & second))
+            either += int(np.count_nonzero(first | second))
+            gain += int(np.count_nonzero(second & ~first))
+            loss += int(np.count_nonzero(first & ~second))
+        return {"iou": both / either if either else 1.0, "gain_pixels": gain, "loss_pixels": loss}
+
+    def delete(self, run_id):
+        run = self.get(run_id)
+        if run is None:
+            return
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+            self._db.execute("DELETE FROM runs_bounds WHERE id = ?", (run_id,))
+        try:
+            os.remove(os.path.join(self.directory, run["path"]))
+        except OSError:
+            pass
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_result_store = None
+_result_store_lock = threading.Lock()
+
+
+def get_result_store():
+    # Opened on first use; None unless AQUASENSE_RESULT_STORE_DIR is set
+    global _result_store
+    if not RESULT_STORE_DIR:
+        return None
+    with _result_store_lock:
+        if _result_store is None:
+            _result_store = ResultStore(RESULT_STORE_DIR)
+        return _result_store
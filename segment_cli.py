@@ -0,0 +1,204 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import numpy as np
+from PIL import Image
+from instrumentation import metrics, stage
+from process_pool import CORES_PER_WORKER, load_model
+from render import RenderBuffers, render_results
+from tta import TTA_MODES, with_tta
+from utils import (
+    BACKENDS,
+    BATCH_SIZE,
+    DEFAULT_BACKEND,
+    MODEL_PATHS,
+    preprocess_image
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff")
+
+_render_buffers = threading.local()
+
+
+def output_paths(image_path, output_dir):
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    return os.path.join(output_dir, f"{stem}_mask.png"), os.path.join(output_dir, f"{stem}_overlay.png")
+
+
+def list_pending(input_dir, output_dir, overlay=True, resume=True):
+    # Outputs are renamed into place only once fully written, so an existing file means done
+    paths = sorted(
+        os.path.join(input_dir, name) for name in os.listdir(input_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not resume:
+        return paths, 0
+    pending = []
+    for path in paths:
+        mask_path, overlay_path = output_paths(path, output_dir)
+        if os.path.exists(mask_path) and (not overlay or os.path.exists(overlay_path)):
+            continue
+        pending.append(path)
+    return pending, len(paths) - len(pending)
+
+
+def load_and_preprocess(path):
+    try:
+        with stage("decode"):
+            image = Image.open(path)
+            image = image.convert("RGB") if image.mode != "RGB" else image
+            image.load()
+        processed_image, original_size = preprocess_image(image)
+        return path, image, processed_image, original_size, None
+    except Exception as e:
+        return path, None, None, None, e
+
+
+def prefetch(executor, fn, items, depth):
+    # Ordered map over a thread pool that keeps at most `depth` items in flight
+    items = iter(items)
+    pending = deque(executor.submit(fn, item) for item in islice(items, depth))
+    while pending:
+        result = pending.popleft().result()
+        for item in islice(items, 1):
+            pending.append(executor.submit(fn, item))
+        yield result
+
+
+def batched(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def save_png(image, path):
+    tmp_path = path + ".tmp"
+    with stage("encode_png"):
+        image.save(tmp_path, format="PNG")
+    os.replace(tmp_path, path)
+
+
+def write_result(path, image, prediction, output_dir, overlay, opacity):
+    # Each writer thread renders into its own reusable buffers
+    buffers = getattr(_render_buffers, "buffers", None)
+    if buffers is None:
+        buffers = _render_buffers.buffers = RenderBuffers()
+    mask_path, overlay_path = output_paths(path, output_dir)
+    mask, _, overlay_array = render_results(np.asarray(image), prediction, opacity=opacity, buffers=buffers)
+    if overlay:
+        save_png(Image.fromarray(overlay_array), overlay_path)
+    save_png(Image.fromarray(mask), mask_path)
+
+
+def run(input_dir, output_dir, model_name="U-Net", batch_size=BATCH_SIZE, workers=4,
+        overlay=True, opacity=0.3, resume=True, backend=DEFAULT_BACKEND, processes=0,
+        cores_per_worker=CORES_PER_WORKER, tta="off", log=print):
+    os.makedirs(output_dir, exist_ok=True)
+    paths, skipped = list_pending(input_dir, output_dir, overlay, resume)
+    log(f"{len(paths)} images to process, {skipped} already done")
+    if not paths:
+        return {"processed": 0, "skipped": skipped, "failed": 0, "seconds": 0.0, "images_per_sec": 0.0}
+
+    # Inference worker processes pinned to their own cores, batches passed through shared memory
+    model, pool = load_model(model_name, backend, processes, cores_per_worker)
+    if pool is not None:
+        log(f"Started {pool.workers} inference processes")
+    model = with_tta(model, tta)
+    processed = failed = 0
+    start = time.perf_counter()
+
+    try:
+        with ThreadPoolExecutor(workers) as reader, ThreadPoolExecutor(workers) as writer:
+            writes = deque()
+            records = prefetch(reader, load_and_preprocess, paths, depth=2 * batch_size)
+
+            for batch in batched(records, batch_size):
+                ok = []
+                for record in batch:
+                    if record[4] is not None:
+                        log(f"Skipping {record[0]}: {record[4]}")
+                        failed += 1
+                    else:
+                        ok.append(record)
+                if not ok:
+                    continue
+
+                inputs = np.concatenate([record[2] for record in ok], axis=0, dtype=np.float32)
+                with stage("predict"):
+                    predictions = model.predict(inputs, batch_size=batch_size, verbose=0)
+
+                for record, prediction in zip(ok, predictions):
+                    path, image = record[:2]
+                    writes.append((path, writer.submit(write_result, path, image, prediction,
+                                                       output_dir, overlay, opacity)))
+
+                # Bound the write backlog so finished images don't pile up in memory
+                while len(writes) > 2 * batch_size:
+                    processed, failed = _collect(writes.popleft(), processed, failed, log)
+
+            while writes:
+                processed, failed = _collect(writes.popleft(), processed, failed, log)
+    finally:
+        # Worker processes and their shared memory must not outlive a failed run
+        if pool is not None:
+            pool.close()
+
+    seconds = time.perf_counter() - start
+    rate = processed / seconds if seconds > 0 else 0.0
+    log(f"Processed {processed} images in {seconds:.1f}s ({rate:.2f} images/sec), {failed} failed")
+    return {"processed": processed, "skipped": skipped, "failed": failed, "seconds": seconds, "images_per_sec": rate}
+
+
+def _collect(write, processed, failed, log):
+    path, future = write
+    try:
+        future.result()
+        return processed + 1, failed
+    except Exception as e:
+        log(f"Failed to write results for {path}: {e}")
+        return processed, failed + 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Segment water regions in every image of a directory.")
+    parser.add_argument("input_dir", help="Directory containing input images")
+    parser.add_argument("output_dir", help="Directory for masks and overlays")
+    parser.add_argument("--model", choices=list(MODEL_PATHS), default="U-Net")
+    parser.add_argument("--backend", choices=list(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=4, help="Threads for decoding and for writing")
+    parser.add_argument("--tta", choices=list(TTA_MODES), default="off", help="Test-time augmentation")
+    parser.add_argument("--processes", type=int, default=0, help="Run inference in this many worker processes")
+    parser.add_argument("--cores-per-worker", type=int, default=CORES_PER_WORKER)
+    parser.add_argument("--opacity", type=float, default=0.3, help="Overlay opacity")
+    parser.add_argument("--no-overlay", action="store_true", help="Only write masks")
+    parser.add_argument("--no-resume", action="store_true", help="Reprocess images that already have outputs")
+    parser.add_argument("--stage-timings", action="store_true", help="Print per-stage latency at the end")
+    args = parser.parse_args(argv)
+    metrics.enabled = metrics.enabled or args.stage_timings
+
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"Input directory not found: {args.input_dir}")
+
+    summary = run(args.input_dir, args.output_dir, model_name=args.model, batch_size=args.batch_size,
+                  workers=args.workers, overlay=not args.no_overlay, opacity=args.opacity,
+                  resume=not args.no_resume, backend=args.backend, processes=args.processes,
+                  cores_per_worker=args.cores_per_worker, tta=args.tta)
+    if args.stage_timings:
+        for name, stats in metrics.summary().items():
+            print(f"{name:<20} n={stats['count']:<6} p50={stats['p50_ms']:.1f} ms p99={stats['p99_ms']:.1f} ms")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
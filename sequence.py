@@ -0,0 +1,295 @@
+import argparse
+import csv
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+from PIL import Image
+from instrumentation import stage
+from render import RenderBuffers, render_results
+from utils import BATCH_SIZE, DEFAULT_BACKEND, predict_probabilities_batch
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".m4v")
+FRAME_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff")
+# Mean absolute difference (0-1) of downscaled grey frames below which the last prediction is reused
+CHANGE_THRESHOLD = 0.01
+# Force a fresh inference after this many reused frames, so slow drift is still picked up
+MAX_REUSE = 15
+THUMBNAIL_SIZE = 64
+# Decoded frames held back waiting for their batch; reaching it flushes a partial batch
+MAX_PENDING_FRAMES = 4 * BATCH_SIZE
+
+
+def is_video(path):
+    return str(path).lower().endswith(VIDEO_EXTENSIONS)
+
+
+def iter_frames(source, step=1):
+    # (frame_index, RGB array) from a video file or a folder of images, keeping every `step`-th frame
+    if os.path.isdir(source):
+        paths = sorted(os.path.join(source, name) for name in os.listdir(source)
+                       if name.lower().endswith(FRAME_EXTENSIONS))
+        for index in range(0, len(paths), step):
+            with stage("decode"):
+                image = Image.open(paths[index])
+                frame = np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+            yield index, frame
+        return
+
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video {source}")
+    try:
+        index = 0
+        while True:
+            # Skipped frames are only grabbed, not decoded
+            if index % step:
+                if not capture.grab():
+                    break
+                index += 1
+                continue
+            with stage("decode"):
+                ok, frame = capture.read()
+                if ok:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            if not ok:
+                break
+            yield index, frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def source_fps(source):
+    if os.path.isdir(source):
+        return None
+    capture = cv2.VideoCapture(source)
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    capture.release()
+    return fps or None
+
+
+def frame_count(source):
+    # Frames in a video or images in a folder, 0 when the video doesn't report it
+    if os.path.isdir(source):
+        return sum(name.lower().endswith(FRAME_EXTENSIONS) for name in os.listdir(source))
+    capture = cv2.VideoCapture(source)
+    count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    return max(count, 0)
+
+
+def read_ahead(items, depth, poll_s=0.1):
+    # Runs the iterator on a background thread so decoding overlaps inference. When the consumer
+    # stops early the thread stops too and closes the iterator, releasing e.g. the video capture
+    buffer = queue.Queue(depth)
+    done = object()
+    stop = threading.Event()
+
+    def offer(item):
+        # False once the consumer has gone away
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=poll_s)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not offer(item):
+                    return
+        except Exception as e:
+            offer(e)
+            return
+        finally:
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+        offer(done)
+
+    threading.Thread(target=produce, daemon=True, name="frame-reader").start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+class FrameSkipper:
+    """Decides whether a frame differs enough from the last inferred frame to run the model."""
+
+    def __init__(self, threshold=CHANGE_THRESHOLD, max_reuse=MAX_REUSE):
+        self.threshold = threshold
+        self.max_reuse = max_reuse
+        self._reference = None
+        self._reused = 0
+
+    def needs_inference(self, frame):
+        thumbnail = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY), (THUMBNAIL_SIZE, THUMBNAIL_SIZE),
+                               interpolation=cv2.INTER_AREA).astype(np.float32)
+        if (self._reference is not None and self._reused < self.max_reuse
+                and float(np.mean(np.abs(thumbnail - self._reference))) / 255 < self.threshold):
+            self._reused += 1
+            return False
+        self._reference = thumbnail
+        self._reused = 0
+        return True
+
+
+def segment_sequence(model, frames, batch_size=BATCH_SIZE, change_threshold=CHANGE_THRESHOLD, max_reuse=MAX_REUSE):
+    """Yield (frame_index, frame, probabilities, reused) in frame order.
+
+    Frames that changed enough since the last inferred frame are predicted in
+    batches; the others reuse the probabilities of that frame. A threshold of
+    0 runs the model on every frame.
+    """
+    skipper = FrameSkipper(change_threshold, max_reuse) if change_threshold > 0 else None
+    last_prediction = None
+    pending = []  # (index, frame, slot): slot is the keyframe in this batch, -1 for the previous prediction
+    keyframes = []
+
+    def flush():
+        predictions = predict_probabilities_batch(model, keyframes, batch_size)[0] if keyframes else None
+        for index, frame, slot in pending:
+            yield index, frame, predictions[slot] if slot >= 0 else last_prediction, slot < 0 or keyframes[slot] is not frame
+
+    for index, frame in frames:
+        if skipper is None or skipper.needs_inference(frame):
+            keyframes.append(frame)
+        pending.append((index, frame, len(keyframes) - 1))
+        # Long runs of reused frames would otherwise pile up until the batch fills
+        if len(keyframes) == batch_size or len(pending) >= MAX_PENDING_FRAMES:
+            results = list(flush())
+            last_prediction = results[-1][2]
+            yield from results
+            pending, keyframes = [], []
+
+    if pending:
+        yield from flush()
+
+
+class OverlayVideoWriter:
+    """Renders and encodes overlay frames on one background thread, in order."""
+
+    def __init__(self, path, fps, threshold=0.5, opacity=0.3, max_pending=BATCH_SIZE * 2):
+        self.path = path
+        self.fps = fps
+        self.threshold = threshold
+        self.opacity = opacity
+        self.max_pending = max_pending
+        self._writer = None
+        self._buffers = RenderBuffers()
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="overlay-video")
+        self._pending = deque()
+
+    def _write(self, frame, probabilities):
+        _, _, overlay = render_results(frame, probabilities, self.threshold, self.opacity, self._buffers)
+        if self._writer is None:
+            height, width = frame.shape[:2]
+            self._writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*"mp4v"), self.fps, (width, height))
+        with stage("encode_video"):
+            self._writer.write(cv2.cvtColor(overlay, cv2.COLOR_RGB2BGR))
+
+    def write(self, frame, probabilities):
+        self._pending.append(self._executor.submit(self._write, frame, probabilities))
+        while len(self._pending) > self.max_pending or (self._pending and self._pending[0].done()):
+            self._pending.popleft().result()
+
+    def close(self):
+        while self._pending:
+            self._pending.popleft().result()
+        self._executor.shutdown()
+        if self._writer is not None:
+            self._writer.release()
+
+
+def run_sequence(model, source, overlay_path=None, step=1, batch_size=BATCH_SIZE, change_threshold=CHANGE_THRESHOLD,
+                 max_reuse=MAX_REUSE, threshold=0.5, opacity=0.3, progress=None):
+    """Segment a video or image folder; returns per-frame rows and a summary dict."""
+    fps = source_fps(source)
+    output_fps = (fps or 10.0) / step
+    writer = OverlayVideoWriter(overlay_path, output_fps, threshold, opacity) if overlay_path else None
+    rows = []
+    start = time.perf_counter()
+    frames = read_ahead(iter_frames(source, step), batch_size * 2)
+    try:
+        for index, frame, probabilities, reused in segment_sequence(model, frames, batch_size, change_threshold, max_reuse):
+            probabilities = np.asarray(probabilities)
+            water = probabilities[..., 0] if probabilities.ndim == 3 else probabilities
+            rows.append({
+                "frame": index,
+                "time_s": index / fps if fps else None,
+                "water_fraction": float(np.mean(water > threshold)),
+                "reused": reused
+            })
+            if writer is not None:
+                writer.write(frame, water)
+            if progress is not None:
+                progress(len(rows))
+    finally:
+        # Stops the reader thread and releases the capture if the loop ended early
+        frames.close()
+        if writer is not None:
+            writer.close()
+
+    seconds = time.perf_counter() - start
+    inferred = sum(not row["reused"] for row in rows)
+    summary = {
+        "frames": len(rows),
+        "inferred": inferred,
+        "reused": len(rows) - inferred,
+        "seconds": seconds,
+        "frames_per_sec": len(rows) / seconds if seconds else 0.0,
+        "source_fps": fps
+    }
+    # Above 1.0 the sequence is processed faster than it plays back
+    summary["realtime_factor"] = summary["frames_per_sec"] * step / fps if fps else None
+    return rows, summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Segment water in a video or a folder of frames.")
+    parser.add_argument("source", help="Video file or folder of images")
+    parser.add_argument("--model", default="U-Net")
+    parser.add_argument("--backend", default=DEFAULT_BACKEND)
+    parser.add_argument("--overlay", help="Write an overlay video (mp4) to this path")
+    parser.add_argument("--csv", help="Write the per-frame water fraction to this CSV file")
+    parser.add_argument("--step", type=int, default=1, help="Process every n-th frame")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--change-threshold", type=float, default=CHANGE_THRESHOLD,
+                        help="Reuse the last prediction for frames that changed less than this (0 disables)")
+    parser.add_argument("--max-reuse", type=int, default=MAX_REUSE)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--opacity", type=float, default=0.3)
+    args = parser.parse_args(argv)
+
+    from model_registry import registry
+    model = registry.get(args.model, args.backend)
+    rows, summary = run_sequence(model, args.source, args.overlay, args.step, args.batch_size,
+                                 args.change_threshold, args.max_reuse, args.threshold, args.opacity)
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["frame", "time_s", "water_fraction", "reused"])
+            writer.writeheader()
+            writer.writerows(rows)
+    realtime = f", {summary['realtime_factor']:.2f}x real time" if summary["realtime_factor"] else ""
+    print(f"{summary['frames']} frames ({summary['inferred']} inferred, {summary['reused']} reused) in "
+          f"{summary['seconds']:.1f}s, {summary['frames_per_sec']:.1f} frames/sec{realtime}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
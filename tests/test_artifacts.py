@@ -0,0 +1,58 @@
+import io
+import zipfile
+
+from artifacts import EncodedCache, stream_zip
+
+
+def make_cache(tmp_path, max_memory_mb=0.001, max_disk_mb=1):
+    return EncodedCache(max_memory_mb=max_memory_mb, disk_dir=str(tmp_path), max_disk_mb=max_disk_mb)
+
+
+def test_artifacts_larger_than_memory_are_served_from_disk(tmp_path):
+    cache = make_cache(tmp_path)
+    calls = []
+
+    def encode():
+        calls.append(1)
+        return b"x" * 4096
+
+    assert cache.get_or_encode(("scene", "overlay"), encode) == b"x" * 4096
+    assert cache.get_or_encode(("scene", "overlay"), encode) == b"x" * 4096
+    assert len(calls) == 1
+    # A new process finds the artifact from the earlier run
+    assert make_cache(tmp_path).get_or_encode(("scene", "overlay"), encode) == b"x" * 4096
+    assert len(calls) == 1
+
+
+def test_bundle_is_streamed_to_disk_once(tmp_path):
+    cache = make_cache(tmp_path)
+    calls = []
+
+    def chunks():
+        calls.append(1)
+        return stream_zip([("a.bin", b"a" * 8192), ("b.txt", lambda: b"b" * 100)])
+
+    data = cache.get_or_stream(("scene", "bundle"), chunks)
+    assert cache.get_or_stream(("scene", "bundle"), chunks) == data
+    assert len(calls) == 1
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.read("a.bin") == b"a" * 8192
+        assert archive.read("b.txt") == b"b" * 100
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, max_disk_mb=0.01)
+    for name in "abc":
+        cache.get_or_encode(name, lambda: b"x" * 4096)
+    assert len([p for p in tmp_path.iterdir()]) == 2
+    calls = []
+    cache.get_or_encode("a", lambda: calls.append(1) or b"x" * 4096)
+    assert calls == [1]
+
+
+def test_without_disk_tier_bundle_is_still_built(tmp_path):
+    cache = EncodedCache(max_memory_mb=0.001, disk_dir=None)
+    data = cache.get_or_stream("bundle", lambda: stream_zip([("a.bin", b"a" * 4096)]))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.read("a.bin") == b"a" * 4096
+    assert not list(tmp_path.iterdir())
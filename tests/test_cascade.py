@@ -0,0 +1,63 @@
+import numpy as np
+from cascade import iter_cascade_probabilities, predict_cascade, refinement_map
+from tiling import predict_tiled
+
+
+class MeanModel:
+    def __init__(self):
+        self.tiles = 0
+
+    def predict(self, batch, verbose=0):
+        self.tiles += len(batch)
+        return batch.mean(axis=-1, keepdims=True)
+
+
+def make_scene(height=200, width=260, shore=40):
+    # Water in a band on the left, dry land everywhere else
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[:, :shore] = 255
+    return image
+
+
+def test_refinement_map_flags_shorelines_and_uncertain_pixels():
+    coarse = np.zeros((8, 8), dtype=np.float32)
+    coarse[:, :3] = 1.0
+    coarse[6, 6] = 0.4
+
+    flagged = refinement_map(coarse, 0.5, 0.2)
+
+    assert flagged[:, 2:4].all()
+    assert flagged[6, 6]
+    assert not flagged[:, 0].any() and not flagged[0, 6]
+
+
+def test_confident_scenes_need_no_refinement():
+    model = MeanModel()
+    probabilities, stats = predict_cascade(model, np.zeros((200, 260, 3), dtype=np.uint8), tile_size=64, overlap=16)
+
+    assert probabilities.shape == (200, 260)
+    assert probabilities.max() == 0
+    assert model.tiles == 1
+    assert stats["refined"] == 0 and stats["tiles"] == 4 * 6
+
+
+def test_only_tiles_near_the_shore_are_refined():
+    image = make_scene()
+    model = MeanModel()
+
+    probabilities, stats = predict_cascade(model, image, tile_size=64, overlap=16)
+
+    assert 0 < stats["refined"] < stats["tiles"]
+    assert model.tiles == 1 + stats["refined"]
+    # Refined tiles reproduce the full tiling where the mask would change
+    full = predict_tiled(MeanModel(), image, tile_size=64, overlap=16)
+    np.testing.assert_array_equal(probabilities > 0.5, full > 0.5)
+    np.testing.assert_allclose(probabilities[:, 100:], 0.0, atol=1e-6)
+
+
+def test_strips_cover_every_row_once():
+    strips = list(iter_cascade_probabilities(MeanModel(), make_scene(), tile_size=64, overlap=16))
+
+    rows = [y + len(strip) for y, strip in strips]
+    assert [y for y, _ in strips] == [0] + rows[:-1]
+    assert rows[-1] == 200
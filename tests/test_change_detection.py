@@ -0,0 +1,45 @@
+import io
+import numpy as np
+from PIL import Image
+from change_detection import CHANGE_COLORS, TileCachePredictor, encode_change_map
+from prediction_cache import PredictionCache
+
+
+class ConstantModel:
+    def predict(self, batch, verbose=0):
+        return np.full(batch.shape[:3] + (1,), 0.75, dtype=np.float32)
+
+
+def test_cached_tiles_do_not_keep_the_batch_alive():
+    cache = PredictionCache(max_memory_mb=16)
+    predictor = TileCachePredictor("U-Net", cache=cache)
+    batch = np.random.default_rng(0).random((4, 32, 32, 3), dtype=np.float32)
+
+    predictor(ConstantModel(), batch)
+
+    entries = list(cache._entries.values())
+    assert len(entries) == 4
+    assert all(entry.base is None for entry in entries)
+    assert cache.stats()["memory_mb"] * 1024 * 1024 == 4 * 32 * 32 * 4
+
+
+def test_repeated_tiles_are_reused():
+    cache = PredictionCache(max_memory_mb=16)
+    predictor = TileCachePredictor("U-Net", cache=cache)
+    batch = np.random.default_rng(1).random((2, 32, 32, 3), dtype=np.float32)
+
+    predictor(ConstantModel(), batch)
+    probabilities = predictor(ConstantModel(), batch)
+
+    assert probabilities.shape == (2, 32, 32, 1)
+    assert (predictor.predicted, predictor.reused) == (2, 2)
+
+
+def test_change_map_png_keeps_codes_and_colors():
+    change = np.random.default_rng(2).integers(0, 4, (20, 30)).astype(np.uint8)
+
+    image = Image.open(io.BytesIO(encode_change_map(change)))
+
+    assert image.mode == "P"
+    np.testing.assert_array_equal(np.asarray(image), change)
+    np.testing.assert_array_equal(np.asarray(image.convert("RGB")), CHANGE_COLORS[change])
@@ -0,0 +1,36 @@
+import numpy as np
+from ensemble import EnsembleModel, fuse_predictions, split_ensemble
+
+
+class ConstantModel:
+    input_shape = (None, 6, 8, 3)
+
+    def __init__(self, value, channels=True):
+        self.value = value
+        self.channels = channels
+
+    def predict(self, x, batch_size=None, verbose=0):
+        shape = x.shape[:3] + ((1,) if self.channels else ())
+        return np.full(shape, self.value, dtype=np.float32)
+
+
+def test_members_with_and_without_a_channel_axis_are_fused():
+    batch = np.zeros((2, 6, 8), dtype=np.float32)
+    with_channel = np.full((2, 6, 8, 1), 0.8, dtype=np.float32)
+    without_channel = batch + 0.2
+
+    fused = fuse_predictions([with_channel, without_channel], np.array([0.5, 0.5]))
+
+    assert fused.shape == (2, 6, 8, 2)
+    np.testing.assert_allclose(fused[..., 0], 0.5)
+    np.testing.assert_allclose(fused[..., 1], 0.6)
+
+
+def test_ensemble_model_mixes_member_output_shapes():
+    model = EnsembleModel([ConstantModel(1.0), ConstantModel(0.0, channels=False)], [0.75, 0.25], concurrent=False)
+
+    probabilities, disagreement = split_ensemble(model.predict(np.zeros((3, 6, 8, 3))))
+
+    assert probabilities.shape == disagreement.shape == (3, 6, 8)
+    np.testing.assert_allclose(probabilities, 0.75)
+    np.testing.assert_allclose(disagreement, 1.0)
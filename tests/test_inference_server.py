@@ -0,0 +1,75 @@
+import asyncio
+import socket
+import threading
+import time
+import numpy as np
+import pytest
+from inference_server import InferenceClient, InferenceServer
+
+
+@pytest.fixture
+def silent_server():
+    # Accepts connections and reads requests but never answers
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    connections = []
+
+    def accept():
+        while True:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                return
+            connections.append(connection)
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield f"127.0.0.1:{listener.getsockname()[1]}"
+    listener.close()
+    for connection in connections:
+        connection.close()
+
+
+def test_timed_out_connection_is_not_reused(silent_server):
+    client = InferenceClient(silent_server, timeout=0.2)
+    x = np.zeros((1, 4, 4, 3), dtype=np.float32)
+
+    with pytest.raises(TimeoutError):
+        client.predict("U-Net", x)
+    assert client._local.connection is None
+
+
+class ConstantModel:
+    input_shape = (None, 4, 4, 3)
+
+    def predict(self, x, verbose=0):
+        return np.ones(x.shape[:3] + (1,), dtype=np.float32)
+
+
+def test_loading_a_model_does_not_stall_other_models():
+    loading = threading.Event()
+    release = threading.Event()
+
+    def load(model_name, backend):
+        if model_name == "slow":
+            loading.set()
+            release.wait(5)
+        return ConstantModel()
+
+    async def scenario():
+        server = InferenceServer(load, max_latency_ms=1)
+        x = np.zeros((1, 4, 4, 3), dtype=np.float32)
+        await server.predict("fast", "keras", x)
+        slow = asyncio.ensure_future(server.predict("slow", "keras", x))
+        while not loading.is_set():
+            await asyncio.sleep(0.01)
+        start = time.perf_counter()
+        prediction = await asyncio.wait_for(server.predict("fast", "keras", x), 2)
+        elapsed = time.perf_counter() - start
+        release.set()
+        await slow
+        return prediction, elapsed
+
+    prediction, elapsed = asyncio.run(scenario())
+    assert prediction.shape == (1, 4, 4, 1)
+    assert elapsed < 1
@@ -0,0 +1,80 @@
+import cv2
+import numpy as np
+import pytest
+from masks import PackedMask, scene_mask_strips
+
+
+def random_mask(shape=(37, 53), seed=0):
+    return np.random.default_rng(seed).random(shape) > 0.6
+
+
+def test_round_trip_keeps_every_pixel():
+    mask = random_mask()
+    packed = PackedMask.from_array(mask)
+
+    assert packed.nbytes == -(-mask.size // 8)
+    np.testing.assert_array_equal(packed.to_array(), mask)
+    np.testing.assert_array_equal(packed.to_array(255), mask * 255)
+    assert packed.count() == np.count_nonzero(mask)
+    assert packed.area(2.5) == np.count_nonzero(mask) * 2.5
+
+
+def test_strips_pack_and_unpack_across_byte_boundaries():
+    mask = random_mask()
+    strips = [(y, mask[y:y + 5].astype(np.uint8)) for y in range(0, mask.shape[0], 5)]
+
+    packed = PackedMask.from_strips(mask.shape, strips)
+
+    assert packed == PackedMask.from_array(mask)
+    unpacked = np.concatenate([strip for _, strip in packed.strips(rows=7)])
+    np.testing.assert_array_equal(unpacked, mask)
+    with pytest.raises(ValueError):
+        PackedMask.from_strips(mask.shape, strips[:-1])
+
+
+def test_set_operations_match_boolean_arrays():
+    a, b = random_mask(seed=1), random_mask(seed=2)
+    pa, pb = PackedMask.from_array(a), PackedMask.from_array(b)
+
+    np.testing.assert_array_equal((pa | pb).to_array(), a | b)
+    np.testing.assert_array_equal((pa & pb).to_array(), a & b)
+    np.testing.assert_array_equal((pa - pb).to_array(), a & ~b)
+    np.testing.assert_array_equal((pa ^ pb).to_array(), a ^ b)
+    np.testing.assert_array_equal((~pa).to_array(), ~a)
+    # Inverting keeps the padding bits clear, so counts stay exact
+    assert (~pa).count() == a.size - np.count_nonzero(a)
+    assert pa.iou(pb) == pytest.approx(np.count_nonzero(a & b) / np.count_nonzero(a | b))
+    with pytest.raises(ValueError):
+        pa | PackedMask.from_array(random_mask((10, 10)))
+
+
+@pytest.mark.parametrize("first", [0, 1])
+def test_run_lengths_round_trip(first):
+    mask = random_mask()
+    mask[0, 0] = first
+    packed = PackedMask.from_array(mask)
+
+    runs = packed.to_rle()
+
+    assert runs.sum() == mask.size
+    assert (runs[0] == 0) == bool(first)
+    assert PackedMask.from_rle(mask.shape, runs) == packed
+    with pytest.raises(ValueError):
+        PackedMask.from_rle(mask.shape, runs[:-1])
+
+
+def test_model_resolution_probabilities_match_the_resized_mask():
+    probabilities = np.random.default_rng(3).random((16, 16), dtype=np.float32)
+    expected = cv2.resize((probabilities > 0.5).astype(np.uint8), (70, 50))
+
+    packed = PackedMask.from_probabilities(probabilities, size=(50, 70))
+    streamed = np.concatenate([strip for _, strip in scene_mask_strips(probabilities, (50, 70), rows=16)])
+
+    np.testing.assert_array_equal(packed.to_array(), expected)
+    # The streamed mask upscales in float32; the uint8 resize only drops shoreline pixels
+    interpolated = cv2.resize((probabilities > 0.5).astype(np.float32), (70, 50))
+    differs = streamed != expected
+    assert (streamed[differs] == 1).all()
+    assert ((interpolated[differs] > 0.499) & (interpolated[differs] < 0.76)).all()
+    clear = np.abs(interpolated - 0.5) > 1e-4
+    np.testing.assert_array_equal(streamed[clear], interpolated[clear] >= 0.5)
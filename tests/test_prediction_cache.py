@@ -0,0 +1,61 @@
+import io
+import numpy as np
+from prediction_cache import PredictionCache, content_hash, make_key
+
+
+def probabilities(value, size=32):
+    return np.full((size, size), value, dtype=np.float32)
+
+
+def test_content_hash_accepts_bytes_and_files():
+    data = b"scene bytes"
+    upload = io.BytesIO(data)
+    upload.seek(4)
+
+    assert content_hash(data) == content_hash(upload)
+    assert upload.tell() == 4
+    assert make_key(content_hash(data), "U-Net") != make_key(content_hash(data), "U-Net", variant="tiled")
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = PredictionCache(max_memory_mb=2 * 32 * 32 * 4 / (1024 * 1024))
+    cache.put("a", probabilities(0.1))
+    cache.put("b", probabilities(0.2))
+    assert cache.get("a") is not None
+    cache.put("c", probabilities(0.3))
+
+    assert cache.get("b") is None
+    assert cache.get("a")[0, 0] == np.float32(0.1)
+    assert cache.stats()["entries"] == 2
+
+
+def test_cached_arrays_are_read_only_copies():
+    cache = PredictionCache(max_memory_mb=1)
+    source = probabilities(0.5)
+    stored = cache.put("a", source[:16])
+
+    assert stored.base is None and not stored.flags.writeable
+    source[:] = 0
+    assert cache.get("a")[0, 0] == np.float32(0.5)
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    PredictionCache(max_memory_mb=1, disk_dir=str(tmp_path)).put("a", probabilities(0.7))
+    cache = PredictionCache(max_memory_mb=1, disk_dir=str(tmp_path))
+    calls = []
+
+    result = cache.get_or_compute("a", lambda: calls.append(1) or probabilities(0.0))
+
+    assert calls == [] and result[0, 0] == np.float32(0.7)
+    assert cache.stats()["disk_hits"] == 1
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_misses_are_computed_once():
+    cache = PredictionCache(max_memory_mb=1)
+    calls = []
+    for _ in range(3):
+        cache.get_or_compute("a", lambda: calls.append(1) or probabilities(0.2))
+
+    assert calls == [1]
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (2, 1)
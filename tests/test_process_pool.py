@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+from process_pool import InferencePool
+
+
+class MeanModel:
+    def predict(self, x, verbose=0):
+        return np.mean(x, axis=-1, keepdims=True)
+
+
+def load_mean_model(model_name, backend):
+    return MeanModel()
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = InferencePool("mean", workers=2, cores_per_worker=1, max_batch=2, input_shape=(8, 8, 3),
+                         loader=load_mean_model)
+    yield pool
+    pool.close()
+
+
+def test_empty_batch_returns_empty_output(pool):
+    out = pool.predict(np.zeros((0, 8, 8, 3), dtype=np.float32))
+    assert out.shape == (0, 8, 8, 1)
+    assert out.dtype == np.float32
+
+
+def test_batch_is_split_across_workers(pool):
+    x = np.random.default_rng(0).random((5, 8, 8, 3), dtype=np.float32)
+    np.testing.assert_allclose(pool.predict(x), MeanModel().predict(x), rtol=1e-6)
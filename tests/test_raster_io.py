@@ -0,0 +1,109 @@
+import struct
+import numpy as np
+import pytest
+from PIL import Image
+from raster_io import ArrayRaster, TiffFormatError, TiffRaster, open_raster, to_rgb_window
+
+SAMPLE_FORMAT_CODES = {"u": 1, "i": 2, "f": 3}
+
+
+def write_tiff(path, array):
+    # Minimal little-endian, single-strip, uncompressed TIFF
+    array = np.ascontiguousarray(array if array.ndim == 3 else array[..., None])
+    array = array.astype(array.dtype.newbyteorder("<"))
+    height, width, bands = array.shape
+    pixels = array.tobytes()
+    entries = [
+        (256, 4, width), (257, 4, height), (258, 3, array.dtype.itemsize * 8), (259, 3, 1),
+        (262, 3, 2 if bands >= 3 else 1), (273, 4, 8), (277, 3, bands), (278, 4, height),
+        (279, 4, len(pixels)), (284, 3, 1), (339, 3, SAMPLE_FORMAT_CODES[array.dtype.kind])
+    ]
+    ifd = struct.pack("<H", len(entries))
+    for tag, field_type, value in entries:
+        packed = struct.pack("<H", value) + b"\0\0" if field_type == 3 else struct.pack("<I", value)
+        ifd += struct.pack("<HHI", tag, field_type, 1) + packed
+    ifd += struct.pack("<I", 0)
+    with open(path, "wb") as f:
+        f.write(b"II" + struct.pack("<HI", 42, 8 + len(pixels)) + pixels + ifd)
+    return str(path)
+
+
+@pytest.mark.parametrize("bands", [1, 2, 4])
+def test_band_counts_become_rgb(tmp_path, bands):
+    array = np.zeros((6, 5, bands), dtype=np.uint8)
+    array[..., 0] = 40
+    array[..., 1:] = 200
+    raster = open_raster(write_tiff(tmp_path / "scene.tif", array))
+
+    assert isinstance(raster, TiffRaster)
+    window = raster[0:6, 0:5]
+    assert window.shape == (6, 5, 3) and window.dtype == np.uint8
+    expected = [40, 40, 40] if bands < 3 else [40, 200, 200]
+    assert window[0, 0].tolist() == expected
+
+
+def test_uint16_keeps_the_high_byte(tmp_path):
+    array = np.full((4, 4, 3), 0x1234, dtype=np.uint16)
+    raster = open_raster(write_tiff(tmp_path / "scene.tif", array))
+
+    assert (raster[0:4, 0:4] == 0x12).all()
+
+
+def test_float_reflectance_is_scaled_to_bytes(tmp_path):
+    array = np.linspace(0.0, 1.0, 16 * 3, dtype=np.float32).reshape(4, 4, 3)
+    raster = open_raster(write_tiff(tmp_path / "scene.tif", array))
+
+    window = raster[0:4, 0:4]
+    assert window.dtype == np.uint8
+    assert window.min() == 0 and window.max() == 255
+    # Every window is scaled with the scene's range, not its own
+    assert raster[3:4, 3:4].max() == 255 and raster[0:1, 0:1].min() == 0
+    assert raster[2:3, 0:1].min() > 0
+
+
+def test_signed_and_large_floats_are_stretched_over_the_scene_range(tmp_path):
+    array = np.arange(-8, 8, dtype=np.int16).reshape(4, 4)
+    raster = open_raster(write_tiff(tmp_path / "scene.tif", array))
+
+    window = raster[0:4, 0:4]
+    assert window[0, 0, 0] == 0 and window[3, 3, 0] == 255
+    assert raster[1:2, 0:1][0, 0, 0] == window[1, 0, 0]
+
+
+def test_uint32_is_stretched_over_the_scene_range(tmp_path):
+    array = (np.arange(16, dtype=np.uint32) * 100000).reshape(4, 4)
+    raster = open_raster(write_tiff(tmp_path / "scene.tif", array))
+
+    window = raster[0:4, 0:4]
+    assert window.dtype == np.uint8
+    assert window[0, 0, 0] == 0 and window[3, 3, 0] == 255
+    assert raster[1:2, 0:1][0, 0, 0] == window[1, 0, 0] > 0
+
+
+def test_non_finite_floats_do_not_break_scaling():
+    window = np.array([[[np.nan], [0.5], [np.inf], [1.0]]], dtype=np.float32)
+
+    rgb = to_rgb_window(window)
+
+    assert rgb.shape == (1, 4, 3)
+    assert rgb[0, 0, 0] == 0 and rgb[0, 3, 0] == 255
+
+
+def test_truncated_tiffs_raise_a_format_error(tmp_path):
+    data = open(write_tiff(tmp_path / "scene.tif", np.zeros((4, 4, 3), dtype=np.uint8)), "rb").read()
+    # Cut anywhere before the last tag value ends; the padding and next-IFD offset after it are not read
+    for length in range(1, len(data) - 6):
+        path = tmp_path / f"truncated_{length}.tif"
+        path.write_bytes(data[:length])
+        with pytest.raises(TiffFormatError):
+            TiffRaster(str(path))
+
+
+def test_tiffs_the_reader_cannot_map_fall_back_to_pil(tmp_path):
+    path = tmp_path / "compressed.tif"
+    Image.new("RGB", (8, 6), (10, 20, 30)).save(path, compression="tiff_lzw")
+
+    raster = open_raster(str(path))
+
+    assert isinstance(raster, ArrayRaster)
+    assert raster[0:6, 0:8][0, 0].tolist() == [10, 20, 30]
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from render import RenderBuffers, render_overlay, render_results
+from utils import create_mask_visualization, create_overlay, postprocess_prediction
+
+
+def make_scene(water_fraction, height=60, width=80, model_size=None):
+    rng = np.random.default_rng(0)
+    original = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    probabilities = rng.random(model_size or (height, width), dtype=np.float32)
+    # Shift the probabilities so about water_fraction of the pixels exceed 0.5
+    probabilities += 0.5 - np.quantile(probabilities, 1 - water_fraction)
+    return original, probabilities
+
+
+def reference(original, probabilities, threshold, opacity):
+    mask = postprocess_prediction(probabilities[None, ..., None], original.shape[:2], threshold)
+    return (np.array(mask), np.array(create_mask_visualization(mask)),
+            np.array(create_overlay(original, mask, opacity)))
+
+
+@pytest.mark.parametrize("water_fraction", [0.01, 0.5])
+@pytest.mark.parametrize("model_size", [None, (32, 32)])
+def test_render_matches_the_reference_pipeline(water_fraction, model_size):
+    original, probabilities = make_scene(water_fraction, model_size=model_size)
+
+    rendered = render_results(original, probabilities, 0.5, 0.3)
+
+    for ours, expected in zip(rendered, reference(original, probabilities, 0.5, 0.3)):
+        np.testing.assert_array_equal(ours, expected)
+
+
+def test_buffers_are_reused_for_the_same_size():
+    buffers = RenderBuffers()
+    original, probabilities = make_scene(0.2)
+
+    first = render_results(original, probabilities, buffers=buffers)
+    second = render_results(original, probabilities, 0.9, buffers=buffers)
+
+    assert all(a is b for a, b in zip(first, second))
+    render_results(original[:30], probabilities[:30], buffers=buffers)
+    assert buffers.size == (30, 80)
+
+
+def test_multichannel_probabilities_use_the_first_channel():
+    original, probabilities = make_scene(0.3)
+    stacked = np.stack([probabilities, 1 - probabilities], axis=-1)
+
+    mask = render_results(original, stacked)[0].copy()
+
+    np.testing.assert_array_equal(mask, render_results(original, probabilities)[0])
+    with pytest.raises(ValueError):
+        render_results(original, np.zeros((2, 2, 2, 2), dtype=np.float32))
+
+
+def test_overlay_rendered_in_strips_matches_one_pass():
+    original, probabilities = make_scene(0.4)
+    mask = (probabilities > 0.5).astype(np.uint8)
+    strips = [(y, mask[y:y + 16]) for y in range(0, len(mask), 16)]
+
+    overlay = render_overlay(original, strips, 0.3)
+
+    np.testing.assert_array_equal(overlay, render_results(original, probabilities, 0.5, 0.3)[2])
@@ -0,0 +1,74 @@
+import os
+import numpy as np
+import pytest
+from result_store import ResultStore, scene_bounds
+
+GEOTRANSFORM = (500000.0, 10.0, 0.0, 4000000.0, 0.0, -10.0)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(str(tmp_path))
+    yield store
+    store.close()
+
+
+def probabilities(water_columns, size=(40, 40)):
+    array = np.zeros(size, dtype=np.float32)
+    array[:, :water_columns] = 0.9
+    return array
+
+
+def test_saved_runs_reload_memory_mapped(store):
+    run_id = store.save(probabilities(10), "hash", "U-Net", created=100.0, area_per_pixel=4.0)
+
+    run = store.get(run_id)
+    assert run["water_pixels"] == 400 and run["water_fraction"] == 0.25
+    assert run["water_area"] == 400 * 4.0
+    array = store.load(run_id)
+    assert isinstance(array, np.memmap) and not array.flags.writeable
+    np.testing.assert_array_equal(array, probabilities(10))
+    with pytest.raises(ValueError):
+        store.save(probabilities(10), "hash", "U-Net", kind="heatmap")
+
+
+def test_query_filters_by_time_model_and_area(store):
+    far = (600000.0, 10.0, 0.0, 4000000.0, 0.0, -10.0)
+    near = store.save(probabilities(5), "a", "U-Net", geotransform=GEOTRANSFORM, crs="EPSG:32633", created=100.0)
+    store.save(probabilities(5), "b", "U-Net", geotransform=far, crs="EPSG:32633", created=200.0)
+    other_crs = store.save(probabilities(5), "c", "U-Net", geotransform=GEOTRANSFORM, crs="EPSG:32634", created=250.0)
+    plain = store.save(probabilities(5), "d", "DeepLabV3+", created=300.0)
+
+    assert [run["id"] for run in store.query()][0] == plain
+    assert [run["id"] for run in store.query(model_name="DeepLabV3+")] == [plain]
+    assert [run["id"] for run in store.query(since=150.0, until=260.0, limit=1)] == [other_crs]
+    area = (500100.0, 3999700.0, 500200.0, 3999900.0)
+    assert [run["id"] for run in store.query(bounds=area, crs="EPSG:32633")] == [near]
+    with pytest.raises(ValueError):
+        store.query(bounds=area)
+
+
+def test_scene_bounds_follow_the_geotransform():
+    assert scene_bounds(GEOTRANSFORM, 40, 30) == (500000.0, 3999600.0, 500300.0, 4000000.0)
+
+
+def test_compare_across_resolutions(store):
+    first = store.save(probabilities(10), "hash", "U-Net", scene_size=(80, 80))
+    second = store.save(probabilities(40, size=(80, 80)), "hash", "U-Net")
+
+    comparison = store.compare(first, second, rows=7)
+
+    assert comparison == {"iou": 0.5, "gain_pixels": 400, "loss_pixels": 0}
+    other = store.save(probabilities(10), "hash", "U-Net", scene_size=(100, 100))
+    with pytest.raises(ValueError):
+        store.compare(first, other)
+
+
+def test_delete_removes_the_row_and_the_array(store, tmp_path):
+    run_id = store.save(probabilities(10), "hash", "U-Net", geotransform=GEOTRANSFORM, crs="EPSG:32633")
+    path = os.path.join(str(tmp_path), store.get(run_id)["path"])
+
+    store.delete(run_id)
+
+    assert store.get(run_id) is None and not os.path.exists(path)
+    assert store.query(bounds=scene_bounds(GEOTRANSFORM, 40, 40), crs="EPSG:32633") == []
@@ -0,0 +1,58 @@
+import threading
+import time
+import numpy as np
+import pytest
+from PIL import Image
+from sequence import frame_count, read_ahead
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_read_ahead_yields_items_in_order():
+    assert list(read_ahead(iter(range(10)), depth=2)) == list(range(10))
+
+
+def test_read_ahead_reraises_producer_errors():
+    def items():
+        yield 1
+        raise ValueError("bad frame")
+
+    frames = read_ahead(items(), depth=2)
+    assert next(frames) == 1
+    with pytest.raises(ValueError, match="bad frame"):
+        next(frames)
+
+
+def test_stopping_early_closes_the_source_and_the_reader_thread():
+    closed = threading.Event()
+
+    def items():
+        try:
+            for i in range(1000):
+                yield i
+        finally:
+            closed.set()
+
+    frames = read_ahead(items(), depth=2, poll_s=0.01)
+    assert next(frames) == 0
+    frames.close()
+
+    assert closed.wait(2.0)
+    assert wait_for(lambda: not any(t.name == "frame-reader" for t in threading.enumerate()))
+
+
+def test_frame_count_of_an_image_folder(tmp_path):
+    for i in range(3):
+        Image.fromarray(np.zeros((4, 4, 3), dtype=np.uint8)).save(tmp_path / f"{i}.png")
+    (tmp_path / "notes.txt").write_text("not a frame")
+
+    assert frame_count(str(tmp_path)) == 3
+
+
+def test_frame_count_of_a_missing_video_is_zero(tmp_path):
+    assert frame_count(str(tmp_path / "missing.mp4")) == 0
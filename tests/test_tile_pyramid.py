@@ -0,0 +1,54 @@
+import numpy as np
+from raster_io import ArrayRaster
+from tile_pyramid import TileCache, TilePyramid
+
+
+class CountingRaster(ArrayRaster):
+    def __init__(self, image):
+        super().__init__(image)
+        self.pixels_read = 0
+
+    def read_window(self, y, x, height, width):
+        self.pixels_read += height * width
+        return super().read_window(y, x, height, width)
+
+
+def make_pyramid(tmp_path, raster, key="scene"):
+    probabilities = np.zeros((raster.height, raster.width), dtype=np.float32)
+    probabilities[:, :raster.width // 2] = 1.0
+    return TilePyramid(key, raster, probabilities, cache=TileCache(str(tmp_path), max_mb=64), tile_size=64)
+
+
+def test_low_zoom_tiles_do_not_read_the_whole_scene(tmp_path):
+    raster = CountingRaster(np.full((1024, 1024, 3), 100, dtype=np.uint8))
+    pyramid = make_pyramid(tmp_path, raster)
+    assert pyramid.max_zoom == 4
+
+    assert pyramid.tile("mask", 0, 0, 0) is not None
+    # The largest overview (level 2, 256 px) reads every other row of the scene
+    assert raster.pixels_read <= 1024 * 1024 // 2
+
+    raster.pixels_read = 0
+    for z in range(2):
+        pyramid.tile("overlay", z, 0, 0)
+    assert raster.pixels_read == 0
+
+
+def test_overview_tiles_match_the_scene(tmp_path):
+    raster = CountingRaster(np.full((1024, 1024, 3), 100, dtype=np.uint8))
+    pyramid = make_pyramid(tmp_path, raster, key="halves")
+    overlay, mask = pyramid._render(0, 0, 0)
+
+    assert mask.shape == (64, 64)
+    assert mask[:, :30].all() and not mask[:, 34:].any()
+    assert overlay.shape == (64, 64, 3)
+
+
+def test_strided_raster_reads_only_the_requested_rows():
+    image = np.arange(20 * 10 * 3, dtype=np.uint8).reshape(20, 10, 3)
+    raster = CountingRaster(image)
+
+    window = raster[2:20:4, 1:9:2]
+
+    np.testing.assert_array_equal(window, image[2:20:4, 1:9:2])
+    assert raster.pixels_read == 5 * 8
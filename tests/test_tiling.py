@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from tiling import blend_weights, iter_tiled_probabilities, predict_tiled, tile_starts
+
+
+class MeanModel:
+    # Water probability is the mean channel value, so tiles agree wherever they overlap
+    def __init__(self, channels=1):
+        self.channels = channels
+        self.batches = []
+
+    def predict(self, batch, verbose=0):
+        self.batches.append(len(batch))
+        mean = batch.mean(axis=-1, keepdims=True)
+        return np.repeat(mean, self.channels, axis=-1)
+
+
+def make_image(height, width):
+    return np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def test_tile_starts_cover_the_axis_and_end_at_the_edge():
+    assert tile_starts(100, 128, 32) == [0]
+    starts = tile_starts(300, 128, 32)
+    assert starts == [0, 96, 172]
+    assert all(b - a <= 128 - 32 for a, b in zip(starts, starts[1:]))
+    with pytest.raises(ValueError):
+        tile_starts(300, 128, 128)
+
+
+def test_blend_weights_ramp_over_the_overlap():
+    weights = blend_weights(64, 16)
+    assert weights.shape == (64, 64) and weights.dtype == np.float32
+    assert weights[32, 32] == 1.0
+    assert 0 < weights[0, 0] < weights[8, 8] < 1.0
+    np.testing.assert_array_equal(weights, weights[::-1, ::-1])
+    assert (blend_weights(64, 0) == 1.0).all()
+
+
+def test_tiled_probabilities_match_the_untiled_prediction():
+    image = make_image(150, 170)
+    expected = image.astype(np.float32).mean(axis=-1) / 255.0
+
+    probabilities = predict_tiled(MeanModel(), image, tile_size=64, overlap=16, batch_size=2)
+
+    assert probabilities.shape == (150, 170)
+    np.testing.assert_allclose(probabilities, expected, atol=1e-5)
+
+
+def test_strips_cover_every_row_once():
+    image = make_image(150, 170)
+    model = MeanModel(channels=2)
+
+    strips = list(iter_tiled_probabilities(model, image, tile_size=64, overlap=16, batch_size=2))
+
+    rows = [y + strip.shape[0] for y, strip in strips]
+    assert [y for y, _ in strips] == [0] + rows[:-1]
+    assert rows[-1] == 150
+    assert all(strip.shape[1:] == (170, 2) for _, strip in strips)
+    assert max(model.batches) <= 2
+
+
+def test_small_images_are_padded_to_one_tile():
+    image = make_image(20, 30)
+    probabilities = predict_tiled(MeanModel(), image, tile_size=64, overlap=16)
+    assert probabilities.shape == (20, 30)
+    np.testing.assert_allclose(probabilities, image.mean(axis=-1) / 255.0, atol=1e-5)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from tta import TTA_MODES, TTAModel, _forward, _inverse, with_tta
+
+
+class PixelModel:
+    # Per-pixel model, so every flip and rotation gives the same answer
+    input_shape = (None, 16, 16, 3)
+
+    def __init__(self, squeeze=False):
+        self.squeeze = squeeze
+        self.batches = []
+
+    def predict(self, x, batch_size=None, verbose=0):
+        self.batches.append(len(x))
+        out = x[..., :1] * 0.5 + x[..., 1:2] * 0.25
+        return out[..., 0] if self.squeeze else out
+
+
+class LeftEdgeModel(PixelModel):
+    # Only the leftmost column is water, whatever the input
+    def predict(self, x, batch_size=None, verbose=0):
+        out = np.zeros((*x.shape[:3], 1), dtype=np.float32)
+        out[:, :, 0] = 1.0
+        return out
+
+
+def make_batch(n=2, height=16, width=16):
+    return np.random.default_rng(0).random((n, height, width, 3), dtype=np.float32)
+
+
+@pytest.mark.parametrize("turns, flip", TTA_MODES["d4"])
+def test_inverse_undoes_each_transform(turns, flip):
+    batch = make_batch()
+    np.testing.assert_array_equal(_inverse(_forward(batch, turns, flip), turns, flip), batch)
+
+
+@pytest.mark.parametrize("mode", ["flips", "d4"])
+@pytest.mark.parametrize("squeeze", [False, True])
+def test_equivariant_models_are_unchanged_in_one_call(mode, squeeze):
+    batch = make_batch()
+    model = PixelModel(squeeze)
+
+    out = TTAModel(model, mode).predict(batch)
+
+    np.testing.assert_allclose(out, PixelModel(squeeze).predict(batch), rtol=1e-6)
+    assert model.batches == [len(batch) * len(TTA_MODES[mode])]
+
+
+def test_predictions_are_mapped_back_before_averaging():
+    out = TTAModel(LeftEdgeModel(), "flips").predict(make_batch())[0, ..., 0]
+
+    # Identity and the vertical flip put water on the left, the horizontal flip on the right
+    np.testing.assert_allclose(out[:, 0], 2 / 3)
+    np.testing.assert_allclose(out[:, -1], 1 / 3)
+    assert out[:, 1:-1].max() == 0
+
+
+def test_non_square_inputs_skip_quarter_turns():
+    model = PixelModel()
+    out = TTAModel(model, "d4").predict(make_batch(width=24))
+
+    assert out.shape == (2, 16, 24, 1)
+    assert model.batches == [2 * 4]
+
+
+def test_off_leaves_the_model_untouched():
+    model = PixelModel()
+    assert with_tta(model, "off") is model and with_tta(model, None) is model
+    assert isinstance(with_tta(model, "flips"), TTAModel)
+    with pytest.raises(ValueError):
+        TTAModel(model, "spin")
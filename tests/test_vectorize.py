@@ -0,0 +1,70 @@
+import json
+import numpy as np
+from masks import PackedMask
+from vectorize import dumps, mask_to_geojson, vectorize_strips
+
+
+def make_mask():
+    mask = np.zeros((60, 40), dtype=np.uint8)
+    # A U-shaped lake whose arms only join near the bottom
+    mask[5:50, 5:12] = 1
+    mask[5:50, 25:32] = 1
+    mask[40:50, 5:32] = 1
+    # A pond with a hole in it
+    mask[52:59, 2:20] = 1
+    mask[54:57, 8:14] = 0
+    return mask
+
+
+def signed_area(ring):
+    x, y = np.array(ring).T
+    return np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))
+
+
+def test_polygons_have_outer_rings_and_holes():
+    features = mask_to_geojson(make_mask(), tolerance=0)["features"]
+
+    assert len(features) == 2
+    lake, pond = sorted(features, key=lambda f: len(f["geometry"]["coordinates"]))
+    assert len(pond["geometry"]["coordinates"]) == 2
+    outer, hole = pond["geometry"]["coordinates"]
+    assert signed_area(outer) > 0 > signed_area(hole)
+    assert outer[0] == outer[-1]
+
+
+def test_bodies_crossing_strip_seams_are_traced_once():
+    mask = make_mask()
+    whole = mask_to_geojson(mask, tolerance=0)["features"]
+
+    strips = [(y, mask[y:y + 8]) for y in range(0, len(mask), 8)]
+    streamed = list(vectorize_strips(strips, tolerance=0, min_rows=8))
+
+    assert len(streamed) == len(whole) == 2
+    key = lambda f: f["properties"]["area"]
+    assert sorted(map(key, streamed)) == sorted(map(key, whole))
+
+
+def test_small_islands_and_holes_are_dropped():
+    mask = make_mask()
+    mask[1:3, 36:38] = 1
+    features = mask_to_geojson(mask, tolerance=0, min_hole_area=100)["features"]
+
+    assert len(features) == 2
+    assert all(len(f["geometry"]["coordinates"]) == 1 for f in features)
+
+
+def test_geotransform_maps_pixel_centres_and_sets_the_crs():
+    mask = np.zeros((10, 10), dtype=np.uint8)
+    mask[2:6, 2:6] = 1
+    geotransform = (500000.0, 10.0, 0.0, 4000000.0, 0.0, -10.0)
+
+    collection = json.loads(dumps(mask_to_geojson(PackedMask.from_array(mask), tolerance=0, min_area=0,
+                                                  geotransform=geotransform, crs="EPSG:32633")))
+
+    assert collection["crs"]["properties"]["name"] == "EPSG:32633"
+    (feature,) = collection["features"]
+    xs, ys = np.array(feature["geometry"]["coordinates"][0]).T
+    assert (xs.min(), xs.max()) == (500025.0, 500055.0)
+    assert (ys.min(), ys.max()) == (3999945.0, 3999975.0)
+    assert feature["properties"]["area"] == 9 * 100.0
+    assert "crs" not in mask_to_geojson(mask, crs="EPSG:32633")
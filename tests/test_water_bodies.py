@@ -0,0 +1,59 @@
+import csv
+import io
+import numpy as np
+import pytest
+from water_bodies import CSV_COLUMNS, analyze_mask, analyze_strips, summarize, to_csv
+
+
+def make_mask():
+    mask = np.zeros((30, 40), dtype=np.uint8)
+    mask[2:20, 3:9] = 1     # tall lake crossing several strips
+    mask[10:14, 20:36] = 1  # pond
+    mask[24, 30] = 1        # pixels touching only diagonally form one body
+    mask[25, 31] = 1
+    return mask
+
+
+def test_statistics_of_each_body():
+    bodies = analyze_mask(make_mask())
+
+    assert [body["id"] for body in bodies] == [1, 2, 3]
+    lake, pond, diagonal = bodies
+    assert lake["area_px"] == 18 * 6 and lake["perimeter_px"] == 2 * (18 + 6)
+    assert (lake["x_min"], lake["y_min"], lake["x_max"], lake["y_max"]) == (3, 2, 8, 19)
+    assert lake["centroid_x"] == pytest.approx(5.5) and lake["centroid_y"] == pytest.approx(10.5)
+    assert pond["area_px"] == 64
+    assert diagonal["area_px"] == 2 and diagonal["perimeter_px"] == 8
+
+
+@pytest.mark.parametrize("rows", [1, 3, 7])
+def test_strip_seams_do_not_split_bodies(rows):
+    mask = make_mask()
+    strips = [(y, mask[y:y + rows]) for y in range(0, len(mask), rows)]
+
+    assert analyze_strips(strips) == analyze_mask(mask)
+
+
+def test_map_units_and_minimum_area():
+    bodies = analyze_mask(make_mask(), area_per_pixel=100.0, min_area=10)
+
+    assert len(bodies) == 2
+    assert bodies[0]["area"] == 108 * 100.0
+    assert bodies[0]["perimeter"] == 48 * 10.0
+
+
+def test_probabilities_are_thresholded():
+    probabilities = make_mask() * np.float32(0.8)
+    assert len(analyze_mask(probabilities, threshold=0.5)) == 3
+    assert analyze_mask(probabilities, threshold=0.9) == []
+
+
+def test_summary_and_csv():
+    bodies = analyze_mask(make_mask(), area_per_pixel=4.0)
+
+    assert summarize(bodies) == {"count": 3, "total_area_px": 174, "largest_area_px": 108, "largest_id": 1}
+    assert summarize([])["count"] == 0
+    rows = list(csv.DictReader(io.StringIO(to_csv(bodies))))
+    assert list(rows[0]) == CSV_COLUMNS + ["area", "perimeter"]
+    assert [int(row["area_px"]) for row in rows] == [108, 64, 2]
+    assert to_csv([]).strip() == ",".join(CSV_COLUMNS)
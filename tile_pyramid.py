@@ -0,0 +1,262 @@
+import math
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+import cv2
+from artifacts import encode_image, encode_mask
+from instrumentation import stage
+from render import render_results
+from tiling import to_rgb_array
+
+PYRAMID_TILE_SIZE = 256
+# Disk budget for rendered tiles and where they are kept
+TILE_CACHE_MB = float(os.environ.get("AQUASENSE_TILE_CACHE_MB", 512))
+TILE_CACHE_DIR = os.environ.get("AQUASENSE_TILE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "aquasense_tiles"))
+LAYERS = ("overlay", "mask")
+# Levels at most this many pixels wide and tall are kept whole in memory as overviews,
+# shared by every pyramid of the same scene up to the budget below
+OVERVIEW_MAX_SIDE = 2048
+OVERVIEW_CACHE_MB = float(os.environ.get("AQUASENSE_OVERVIEW_CACHE_MB", 128))
+
+
+class TileCache:
+    """Tiles on disk in {key}/{layer}/{z}/{x}/{y}.{ext} layout, evicting least recently used past max_mb."""
+
+    def __init__(self, directory=TILE_CACHE_DIR, max_mb=TILE_CACHE_MB):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()  # relative path -> size, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # Tiles from earlier runs count against the budget, oldest first
+        found = []
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                found.append((stat.st_mtime, os.path.relpath(path, directory), stat.st_size))
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._bytes += size
+
+    def get(self, path):
+        with self._lock:
+            if path not in self._entries:
+                return None
+            self._entries.move_to_end(path)
+        try:
+            with open(os.path.join(self.directory, path), "rb") as f:
+                return f.read()
+        except OSError:
+            with self._lock:
+                self._bytes -= self._entries.pop(path, 0)
+            return None
+
+    def put(self, path, data):
+        full_path = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f"{full_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, full_path)
+        with self._lock:
+            self._bytes += len(data) - self._entries.pop(path, 0)
+            self._entries[path] = len(data)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                victim, size = self._entries.popitem(last=False)
+                self._bytes -= size
+                try:
+                    os.remove(os.path.join(self.directory, victim))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {"tiles": len(self._entries), "size_mb": self._bytes / (1024 * 1024)}
+
+
+_tile_cache = None
+_tile_cache_lock = threading.Lock()
+
+
+def get_tile_cache():
+    # Created on first use so importing this module doesn't scan the cache directory
+    global _tile_cache
+    with _tile_cache_lock:
+        if _tile_cache is None:
+            _tile_cache = TileCache()
+        return _tile_cache
+
+
+_overviews = OrderedDict()  # (scene key, tile size, zoom) -> (image, probabilities), least recently used first
+_overview_bytes = 0
+_overview_lock = threading.RLock()
+
+
+def _scaled_range(start, stop, factor):
+    # Pixel range mapped onto a grid `factor` times as fine, at least one pixel wide
+    first = int(start * factor)
+    return first, max(first + 1, int(math.ceil(stop * factor)))
+
+
+class TilePyramid:
+    """XYZ pyramid of overlay and mask tiles for one result, rendered on first request.
+
+    Zoom max_zoom is full resolution, each level below halves it, and zoom 0
+    fits the scene in a single tile. The scene can be an array, PIL image or
+    raster reader; a raster reader only reads the window under a requested
+    tile, while a PIL image is decoded once up front.
+    """
+
+    def __init__(self, key, image, probabilities, threshold=0.5, opacity=0.3, tile_size=PYRAMID_TILE_SIZE,
+                 overlay_codec="jpeg", cache=None):
+        self.image = to_rgb_array(image)
+        self.probabilities = np.asarray(probabilities)
+        if self.probabilities.ndim == 3:
+            self.probabilities = self.probabilities[..., 0]
+        self.height, self.width = self.image.shape[:2]
+        self.tile_size = tile_size
+        self.threshold = threshold
+        self.opacity = opacity
+        self.overlay_codec = overlay_codec
+        self.cache = cache
+        self.max_zoom = max(0, math.ceil(math.log2(max(self.height, self.width) / tile_size)))
+        self.key = f"{key}-{threshold:.3f}-{opacity:.3f}-{tile_size}"
+        # Overviews don't depend on threshold or opacity
+        self.scene_key = f"{key}-{tile_size}"
+
+    def level_size(self, z):
+        # (width, height) of the scene at zoom z
+        scale = 2.0 ** (z - self.max_zoom)
+        return max(1, math.ceil(self.width * scale)), max(1, math.ceil(self.height * scale))
+
+    def tile_count(self, z):
+        width, height = self.level_size(z)
+        return math.ceil(width / self.tile_size), math.ceil(height / self.tile_size)
+
+    def tile_path(self, layer, z, x, y):
+        extension = ".png" if layer == "mask" or self.overlay_codec == "png" else ".jpg"
+        return os.path.join(self.key, layer, str(z), str(x), f"{y}{extension}")
+
+    def tile(self, layer, z, x, y):
+        """Encoded tile bytes, or None outside the scene."""
+        if layer not in LAYERS:
+            raise ValueError(f"Unknown layer: {layer}")
+        columns, rows = self.tile_count(z)
+        if not (0 <= z <= self.max_zoom and 0 <= x < columns and 0 <= y < rows):
+            return None
+        cache = self.cache or get_tile_cache()
+        path = self.tile_path(layer, z, x, y)
+        data = cache.get(path)
+        if data is None:
+            overlay, mask = self._render(z, x, y)
+            # Both layers come out of one render, so the sibling is cached as well
+            for name, tile_data in (("overlay", encode_image(overlay, self.overlay_codec)), ("mask", encode_mask(mask))):
+                cache.put(self.tile_path(name, z, x, y), tile_data)
+                if name == layer:
+                    data = tile_data
+        return data
+
+    def _render(self, z, x, y):
+        with stage("render_tile"):
+            width, height = self.level_size(z)
+            ts = self.tile_size
+            tile_w = min(ts, width - x * ts)
+            tile_h = min(ts, height - y * ts)
+            if self._has_overview(z):
+                image, probabilities = self._overview(z)
+                window = image[y * ts:y * ts + tile_h, x * ts:x * ts + tile_w]
+                probabilities = probabilities[y * ts:y * ts + tile_h, x * ts:x * ts + tile_w]
+            else:
+                scale = 2.0 ** (self.max_zoom - z)  # scene pixels per tile pixel
+                x0, y0 = int(x * ts * scale), int(y * ts * scale)
+                x1 = min(self.width, int(math.ceil((x * ts + tile_w) * scale)))
+                y1 = min(self.height, int(math.ceil((y * ts + tile_h) * scale)))
+                window, probabilities = self._resample(x0, y0, x1, y1, tile_w, tile_h)
+
+            # Fresh buffers per call, tiles may be rendered concurrently
+            mask, _, overlay = render_results(window, probabilities, self.threshold, self.opacity)
+            return overlay, mask
+
+    def _has_overview(self, z):
+        width, height = self.level_size(z)
+        # At least 4x down, so building the largest one skips at least every other row
+        return z < self.max_zoom - 1 and max(width, height) <= OVERVIEW_MAX_SIDE
+
+    def _overview(self, z):
+        """Level z as a whole (image, probabilities) pair, built once per scene.
+
+        The largest overview level is decimated from the scene; each level below
+        it is halved from the level above, so no tile of these levels reads the
+        full-resolution scene.
+        """
+        global _overview_bytes
+        key = (self.scene_key, z)
+        with _overview_lock:
+            if key in _overviews:
+                _overviews.move_to_end(key)
+                return _overviews[key]
+            width, height = self.level_size(z)
+            if self._has_overview(z + 1):
+                image, probabilities = self._overview(z + 1)
+                image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+                probabilities = cv2.resize(probabilities, (width, height), interpolation=cv2.INTER_AREA)
+            else:
+                image, probabilities = self._resample(0, 0, self.width, self.height, width, height)
+            image.flags.writeable = False
+            probabilities.flags.writeable = False
+            _overviews[key] = (image, probabilities)
+            _overview_bytes += image.nbytes + probabilities.nbytes
+            while _overview_bytes > OVERVIEW_CACHE_MB * 1024 * 1024 and len(_overviews) > 1:
+                _, (old_image, old_probabilities) = _overviews.popitem(last=False)
+                _overview_bytes -= old_image.nbytes + old_probabilities.nbytes
+            return image, probabilities
+
+    def _resample(self, x0, y0, x1, y1, out_w, out_h):
+        # Scene window and its probabilities resized to (out_w, out_h). Only every step-th
+        # pixel is read, about twice the output resolution, so coarse levels don't read
+        # every source pixel under them
+        step = max(1, int(min((x1 - x0) / out_w, (y1 - y0) / out_h)) // 2)
+        window = np.ascontiguousarray(self.image[y0:y1:step, x0:x1:step])
+        interpolation = cv2.INTER_AREA if window.shape[0] > out_h else cv2.INTER_LINEAR
+        window = cv2.resize(window, (out_w, out_h), interpolation=interpolation)
+
+        # Probabilities may be at model resolution; map the window onto them
+        prob_h, prob_w = self.probabilities.shape
+        py0, py1 = _scaled_range(y0, y1, prob_h / self.height)
+        px0, px1 = _scaled_range(x0, x1, prob_w / self.width)
+        prob_step = max(1, int(min((px1 - px0) / out_w, (py1 - py0) / out_h)) // 2)
+        probabilities = np.ascontiguousarray(self.probabilities[py0:py1:prob_step, px0:px1:prob_step],
+                                             dtype=np.float32)
+        probabilities = cv2.resize(probabilities, (out_w, out_h), interpolation=cv2.INTER_LINEAR)
+        return window, probabilities
+
+    def viewport(self, layer, z, center_x, center_y, width, height):
+        """RGB array of the view centred on (center_x, center_y), fractions of the scene.
+
+        Only the tiles intersecting the view are fetched (and rendered on a miss).
+        """
+        level_w, level_h = self.level_size(z)
+        width, height = min(width, level_w), min(height, level_h)
+        left = int(np.clip(center_x * level_w - width / 2, 0, level_w - width))
+        top = int(np.clip(center_y * level_h - height / 2, 0, level_h - height))
+        ts = self.tile_size
+        view = np.zeros((height, width, 3), dtype=np.uint8)
+        for ty in range(top // ts, (top + height - 1) // ts + 1):
+            for tx in range(left // ts, (left + width - 1) // ts + 1):
+                data = self.tile(layer, z, tx, ty)
+                if data is None:
+                    continue
+                tile = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                tile = cv2.cvtColor(tile, cv2.COLOR_BGR2RGB)
+                # Intersection of the tile with the view, in level pixels
+                ox, oy = tx * ts, ty * ts
+                ix0, iy0 = max(left, ox), max(top, oy)
+                ix1, iy1 = min(left + width, ox + tile.shape[1]), min(top + height, oy + tile.shape[0])
+                view[iy0 - top:iy1 - top, ix0 - left:ix1 - left] = tile[iy0 - oy:iy1 - oy, ix0 - ox:ix1 - ox]
+        return view
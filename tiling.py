@@ -0,0 +1,139 @@
+import numpy as np
+import cv2
+from instrumentation import stage
+from utils import IMG_SIZE
+
+TILE_OVERLAP = 32
+TILE_BATCH_SIZE = 8
+
+
+def tile_starts(length, tile_size=IMG_SIZE, overlap=TILE_OVERLAP):
+    # Start offsets along one axis; the last tile is aligned to the far edge
+    if length <= tile_size:
+        return [0]
+    step = tile_size - overlap
+    if step <= 0:
+        raise ValueError("Tile overlap must be smaller than the tile size")
+    starts = list(range(0, length - tile_size, step))
+    starts.append(length - tile_size)
+    return starts
+
+
+def blend_weights(tile_size=IMG_SIZE, overlap=TILE_OVERLAP):
+    # Linear ramp over the overlap band so neighbouring tiles fade into each other
+    if overlap <= 0:
+        return np.ones((tile_size, tile_size), dtype=np.float32)
+    idx = np.arange(tile_size, dtype=np.float32) + 0.5
+    ramp = np.minimum(1.0, np.minimum(idx, tile_size - idx) / overlap)
+    return np.outer(ramp, ramp).astype(np.float32)
+
+
+def to_rgb_array(image):
+    # PIL images are converted to RGB; arrays, memmaps and raster readers are used as-is
+    if hasattr(image, "convert"):
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return np.asarray(image)
+    return image
+
+
+def resize_scene(image, size, band_rows=IMG_SIZE):
+    # Scene downsampled to size (width, height), read band by band so raster readers never decode it whole
+    image = to_rgb_array(image)
+    height, width = image.shape[:2]
+    out_width, out_height = size
+    out = np.empty((out_height, out_width, 3), dtype=np.uint8)
+    for y in range(0, height, band_rows):
+        y1 = min(height, y + band_rows)
+        top, bottom = round(y * out_height / height), round(y1 * out_height / height)
+        if bottom > top:
+            band = np.ascontiguousarray(image[y:y1, 0:width][..., :3])
+            out[top:bottom] = cv2.resize(band, (out_width, bottom - top), interpolation=cv2.INTER_AREA)
+    return out
+
+
+def upsample_rows(wide, height, y0, y1):
+    # Rows y0:y1 of a bilinear resize to `height` rows, from an array already resized along its columns
+    last = wide.shape[0] - 1
+    source = np.clip((np.arange(y0, y1) + 0.5) * (wide.shape[0] / height) - 0.5, 0, last)
+    top = source.astype(np.intp)
+    fraction = (source - top).astype(np.float32).reshape(-1, *(1,) * (wide.ndim - 1))
+    rows = wide[top]
+    rows *= 1 - fraction
+    rows += wide[np.minimum(top + 1, last)] * fraction
+    return rows
+
+
+def prepare_tiles(tiles, tile_size=IMG_SIZE):
+    # Stack raw tiles into one float32 batch, padding edge tiles of small images
+    batch = np.zeros((len(tiles), tile_size, tile_size, 3), dtype=np.float32)
+    for i, tile in enumerate(tiles):
+        h, w = tile.shape[:2]
+        batch[i, :h, :w] = tile[..., :3]
+        if h < tile_size or w < tile_size:
+            batch[i] = np.pad(batch[i, :h, :w], ((0, tile_size - h), (0, tile_size - w), (0, 0)), mode="edge")
+    batch *= 1.0 / 255.0
+    return batch
+
+
+def predict_tiles(model, batch):
+    with stage("predict"):
+        prediction = model.predict(batch, verbose=0)
+    prediction = np.asarray(prediction, dtype=np.float32)
+    if prediction.ndim == 3:
+        prediction = prediction[..., None]
+    return prediction
+
+
+def iter_tiled_probabilities(model, image, tile_size=IMG_SIZE, overlap=TILE_OVERLAP,
+                             batch_size=TILE_BATCH_SIZE, predict_fn=predict_tiles):
+    """Yield (row_offset, probabilities) strips covering the image top to bottom.
+
+    Tiles are processed one band of rows at a time, so working memory is
+    proportional to tile_size * image width, not to the scene size. Strips are
+    (rows, width) for single-channel models and (rows, width, channels) otherwise.
+    """
+    image = to_rgb_array(image)
+    height, width = image.shape[:2]
+    ys = tile_starts(height, tile_size, overlap)
+    xs = tile_starts(width, tile_size, overlap)
+    weights = blend_weights(tile_size, overlap)
+
+    band_height = min(tile_size, height)
+    acc = None  # allocated once the number of output channels is known
+    acc_weight = np.zeros((band_height, width), dtype=np.float32)
+
+    for band, y in enumerate(ys):
+        for b in range(0, len(xs), batch_size):
+            batch_xs = xs[b:b + batch_size]
+            # Raster readers only decode these windows
+            tiles = [image[y:y + tile_size, x:x + tile_size] for x in batch_xs]
+            probs = predict_fn(model, prepare_tiles(tiles, tile_size))
+            if acc is None:
+                acc = np.zeros((band_height, width, probs.shape[-1]), dtype=np.float32)
+            for x, prob in zip(batch_xs, probs):
+                h, w = min(tile_size, height - y), min(tile_size, width - x)
+                acc[:h, x:x + w] += prob[:h, :w] * weights[:h, :w, None]
+                acc_weight[:h, x:x + w] += weights[:h, :w]
+
+        # Rows above the next band's start receive no further contributions
+        done = ys[band + 1] - y if band + 1 < len(ys) else band_height
+        strip = acc[:done] / acc_weight[:done, :, None]
+        yield y, strip[..., 0] if strip.shape[-1] == 1 else strip
+
+        acc[:band_height - done] = acc[done:]
+        acc[band_height - done:] = 0
+        acc_weight[:band_height - done] = acc_weight[done:]
+        acc_weight[band_height - done:] = 0
+
+
+def predict_tiled(model, image, tile_size=IMG_SIZE, overlap=TILE_OVERLAP,
+                  batch_size=TILE_BATCH_SIZE, out=None):
+    # Full-resolution probability map; pass an np.memmap as `out` for huge scenes
+    image = to_rgb_array(image)
+    height, width = image.shape[:2]
+    for y, strip in iter_tiled_probabilities(model, image, tile_size, overlap, batch_size):
+        if out is None:
+            out = np.empty((height, width, *strip.shape[2:]), dtype=np.float32)
+        out[y:y + strip.shape[0]] = strip
+    return out
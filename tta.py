@@ -0,0 +1,68 @@
+import numpy as np
+from instrumentation import stage
+
+# Each transform is (quarter turns, horizontal flip after rotating)
+TTA_MODES = {
+    "off": [(0, False)],
+    "flips": [(0, False), (0, True), (2, True)],  # identity, horizontal and vertical flip
+    "d4": [(k, flip) for flip in (False, True) for k in range(4)]  # all rotations and reflections
+}
+
+
+def _forward(batch, turns, flip):
+    batch = np.rot90(batch, turns, axes=(1, 2))
+    return batch[:, :, ::-1] if flip else batch
+
+
+def _inverse(batch, turns, flip):
+    if flip:
+        batch = batch[:, :, ::-1]
+    return np.rot90(batch, -turns, axes=(1, 2))
+
+
+class TTAModel:
+    """Wraps a model so predict() averages over flipped and rotated copies of the input.
+
+    All variants go through one predict call as a single larger batch, so the
+    cost grows much slower than the number of augmentations. Like the
+    ensemble, it plugs into every path that calls model.predict, tiles included.
+    """
+
+    def __init__(self, model, mode="flips"):
+        if mode not in TTA_MODES:
+            raise ValueError(f"Unknown TTA mode: {mode}")
+        self.model = model
+        self.mode = mode
+        self.transforms = TTA_MODES[mode]
+        self.input_shape = model.input_shape
+
+    def predict(self, x, batch_size=None, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+        transforms = self.transforms
+        if x.shape[1] != x.shape[2]:
+            # Quarter turns would change the shape of non-square inputs
+            transforms = [(turns, flip) for turns, flip in transforms if turns % 2 == 0]
+        if len(transforms) == 1:
+            return self.model.predict(x, batch_size=batch_size, verbose=0)
+
+        with stage("tta"):
+            augmented = np.concatenate([_forward(x, turns, flip) for turns, flip in transforms])
+        predictions = self.model.predict(augmented, batch_size=batch_size and batch_size * len(transforms),
+                                         verbose=0)
+        predictions = np.asarray(predictions, dtype=np.float32)
+        squeeze = predictions.ndim == 3
+        if squeeze:
+            predictions = predictions[..., None]
+
+        with stage("tta"):
+            n = len(x)
+            total = np.zeros((n, *predictions.shape[1:]), dtype=np.float32)
+            for i, (turns, flip) in enumerate(transforms):
+                total += _inverse(predictions[i * n:(i + 1) * n], turns, flip)
+            total *= 1.0 / len(transforms)
+        return total[..., 0] if squeeze else total
+
+
+def with_tta(model, mode):
+    # Leaves the model untouched when TTA is off
+    return model if mode in (None, "off") else TTAModel(model, mode)
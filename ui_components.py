@@ -1,17 +1,47 @@
+import os
+import tempfile
+import time
+from datetime import datetime
 import streamlit as st
 from PIL import Image
-import io
+import numpy as np
+from artifacts import DEFAULT_PNG_LEVEL, DEFAULT_QUALITY, IMAGE_CODECS, encode_image, encode_mask, encoded_cache, stream_zip
+from cascade import UNCERTAINTY_MARGIN, predict_cascade
+from change_detection import change_visualization, detect_changes, encode_change_map, pixel_area
+from ensemble import ENSEMBLE_NAME, ENSEMBLE_MEMBERS, EnsembleModel, disagreement_visualization, split_ensemble
+from inference_server import INFERENCE_SERVER, InferenceClient, RemoteModel, ServerBusy
+from masks import PackedMask, scene_mask_strips
+from instrumentation import metrics, stage
+from model_registry import registry
+from prediction_cache import prediction_cache, content_hash, make_key, model_version
+from raster_io import open_raster, TIFF_EXTENSIONS
+from render import WATER_COLOR, render_overlay, render_results
+from result_store import DAY_S, get_result_store
+from sequence import CHANGE_THRESHOLD, VIDEO_EXTENSIONS, frame_count, run_sequence
+from tiling import predict_tiled, resize_scene, to_rgb_array, TILE_OVERLAP, TILE_BATCH_SIZE
+from tile_pyramid import LAYERS, PYRAMID_TILE_SIZE, TilePyramid, get_tile_cache
+from tta import TTA_MODES, with_tta
 from utils import (
-    load_keras_model,
-    preprocess_image,
-    postprocess_prediction,
-    create_overlay,
-    create_mask_visualization
+    DEFAULT_BACKEND,
+    IMG_SIZE,
+    available_backends,
+    predict_probabilities_batch
 )
+from vectorize import dumps, mask_to_geojson
+from water_bodies import analyze_mask, summarize, to_csv
+
+# Scenes above this size (px) get the tiled zoomable viewer
+LARGE_SCENE_PX = 2048
+# Longest side of the on-page previews of large scenes
+PREVIEW_PX = 1024
+VIEWER_SIZE = (768, 512)
+
+# Inference runs in this process unless AQUASENSE_INFERENCE_SERVER points at a server
+inference_client = InferenceClient(INFERENCE_SERVER) if INFERENCE_SERVER else None
 
 def model_selection():
     st.subheader("Models:")
-    selectBox = st.selectbox("Choose Models: ", ["U-Net", "DeepLabV3+"])
+    selectBox = st.selectbox("Choose Models: ", ["U-Net", "DeepLabV3+", ENSEMBLE_NAME])
     return selectBox
 
 def home_page():
@@ -25,81 +55,618 @@ def home_page():
     model_selected = model_selection()
     st.write(f"Model Selected: {model_selected}")
 
-    # Load selected model
-    with st.spinner('Loading model...'):
-        model = load_keras_model(model_selected)
+    ensemble = model_selected == ENSEMBLE_NAME
+    if ensemble:
+        unet_weight = st.slider("U-Net weight in the ensemble", 0.0, 1.0, 0.5, step=0.05)
+        backends = [b for b in available_backends(ENSEMBLE_MEMBERS[0]) if b in available_backends(ENSEMBLE_MEMBERS[1])]
+    else:
+        backends = available_backends(model_selected)
+    backend = st.selectbox("Inference backend:", backends,
+                           index=backends.index(DEFAULT_BACKEND) if DEFAULT_BACKEND in backends else 0)
+
+    # Load selected model (cached across reruns and sessions)
+    member_names = ENSEMBLE_MEMBERS if ensemble else [model_selected]
+    if inference_client is not None:
+        members = [RemoteModel(inference_client, name, backend) for name in member_names]
+        st.caption(f"Inference served by {INFERENCE_SERVER}")
+    else:
+        with st.spinner('Loading model...'):
+            members = [registry.get(name, backend) for name in member_names]
+        for name in member_names:
+            model_stats = registry.stats(name, backend)
+            if model_stats is not None:
+                st.caption(f"{name} loaded in {model_stats['load_time_s']:.2f}s "
+                           f"(warm-up {model_stats['warmup_time_s']:.2f}s), {model_stats['size_mb']:.1f} MB resident")
+    model = EnsembleModel(members, [unet_weight, 1 - unet_weight]) if ensemble else members[0]
+
+    tta_mode = st.selectbox("Test-time augmentation:", list(TTA_MODES),
+                            help="Average predictions over flipped (and rotated) copies, run as one batch.")
+    model = with_tta(model, tta_mode)
+
+    # Model settings that change the probabilities, part of every cache key
+    model_variant = f"tta-{tta_mode}"
+    if ensemble:
+        versions = "|".join(model_version(name, backend) for name in ENSEMBLE_MEMBERS)
+        model_variant = f"{model_variant}|ensemble-{unet_weight:.2f}|{versions}"
+
+    mode = st.radio("Mode:", ["Segmentation", "Change detection", "Video / sequence", "History"], horizontal=True)
+    if mode == "History":
+        history_section()
+        return
+    if mode == "Video / sequence":
+        sequence_section(model)
+        return
+    if mode == "Change detection":
+        change_detection_section(model, model_selected, backend, model_variant)
+        return
+
+    uploaded_files = st.file_uploader("Upload Image:", type=["jpg", "jpeg", "png", "tif", "tiff"],
+                                      accept_multiple_files=True)
+
+    tiled = st.checkbox("Full-resolution tiled inference",
+                        help="Segment the image in overlapping tiles instead of resizing it to the model input size.")
+    if tiled:
+        with st.expander("Tiling options"):
+            tile_overlap = st.slider("Tile overlap (px)", 0, 128, TILE_OVERLAP, step=8)
+            tile_batch_size = st.slider("Tiles per batch", 1, 32, TILE_BATCH_SIZE)
+            cascade = st.checkbox("Coarse-to-fine cascade",
+                                  help="Predict the whole image once at low resolution, then refine only tiles "
+                                       "that are uncertain or contain a shoreline.")
+            margin = st.slider("Uncertainty margin", 0.05, 0.45, UNCERTAINTY_MARGIN, step=0.05,
+                               disabled=not cascade,
+                               help="Coarse probabilities this close to 0.5 are refined at full resolution.")
 
-    uploaded_file = st.file_uploader("Upload Image:", type=["jpg", "jpeg", "png"])
+    # Display settings only re-render from cached probabilities
+    threshold = st.slider("Water probability threshold", 0.05, 0.95, 0.5, step=0.05)
+    opacity = st.slider("Overlay opacity", 0.0, 1.0, 0.3, step=0.05)
+
+    with st.expander("Download options"):
+        codec = st.selectbox("Overlay format", list(IMAGE_CODECS))
+        if codec == "png":
+            level = st.slider("PNG compression level", 0, 9, DEFAULT_PNG_LEVEL,
+                              help="Higher levels give smaller files but encode slower.")
+            quality = DEFAULT_QUALITY
+        else:
+            quality = st.slider("Quality", 50, 100, DEFAULT_QUALITY)
+            level = DEFAULT_PNG_LEVEL
+    encoding = {"codec": codec, "level": level, "quality": quality}
+    result_store = get_result_store()
+    save_runs = result_store is not None and st.checkbox(
+        "Save new results to history", value=True, help="Keep probability maps on disk to reopen or compare them later.")
+
+    if uploaded_files and model is not None:
+        # TIFF uploads stay windowed rasters, other formats are decoded once
+        with stage("decode"):
+            images = [load_upload(uploaded_file) for uploaded_file in uploaded_files]
 
-    if uploaded_file is not None and model is not None:
-        # Read and display the image
-        image = Image.open(uploaded_file)
-        
         # Create a container for results
         st.subheader("Water Region Detection Results")
         results_container = st.container()
-        
-        # Process image
-        processed_image, original_size = preprocess_image(image)
-        
-        # Make prediction
-        with st.spinner('Detecting water regions...'):
-            prediction = model.predict(processed_image)
-        
-        # Post-process prediction
-        mask_image = postprocess_prediction(prediction, original_size)
-        
-        # Create visualizations
-        colored_mask = create_mask_visualization(mask_image)
-        overlay_image = create_overlay(image, mask_image)
-        
+
+        # Probabilities are cached per image content, model version and inference mode
+        variant = f"tiled-{IMG_SIZE}-{tile_overlap}" if tiled else f"resized-{IMG_SIZE}"
+        if tiled and cascade:
+            variant = f"cascade-{IMG_SIZE}-{tile_overlap}-{margin:.2f}"
+        variant = f"{variant}|{model_variant}"
+        keys = [
+            make_key(content_hash(uploaded_file), model_selected, variant, backend)
+            for uploaded_file in uploaded_files
+        ]
+        probabilities = [prediction_cache.get(key) for key in keys]
+        missing = [i for i, prediction in enumerate(probabilities) if prediction is None]
+        georefs = [scene_georef(image) for image in images]
+
+        # Make prediction, all uncached uploads share a single batched predict
+        if missing:
+            try:
+                with st.spinner('Detecting water regions...'):
+                    if tiled:
+                        for i in missing:
+                            # TIFF uploads are read window by window instead of as one decoded image
+                            source = images[i]
+                            if cascade:
+                                prediction, cascade_stats = predict_cascade(model, source, margin=margin,
+                                                                            overlap=tile_overlap,
+                                                                            batch_size=tile_batch_size)
+                                st.session_state[f"cascade_{keys[i]}"] = cascade_stats
+                            else:
+                                prediction = predict_tiled(model, source, overlap=tile_overlap,
+                                                           batch_size=tile_batch_size)
+                            probabilities[i] = prediction_cache.put(keys[i], prediction)
+                    else:
+                        # Rasters are downsampled band by band, never decoded whole
+                        inputs = [images[i] if isinstance(images[i], Image.Image)
+                                  else resize_scene(images[i], (IMG_SIZE, IMG_SIZE)) for i in missing]
+                        predictions, _ = predict_probabilities_batch(model, inputs)
+                        for i, prediction in zip(missing, predictions):
+                            probabilities[i] = prediction_cache.put(keys[i], prediction)
+            except ServerBusy:
+                st.error("The inference server is busy, please try again in a moment.")
+                return
+
+            if save_runs:
+                with stage("save_run"):
+                    for i in missing:
+                        georef = georefs[i] or (None, None, None)
+                        # Resized-mode results are at model resolution, the georeference is the scene's
+                        width, height = images[i].size
+                        result_store.save(probabilities[i], content_hash(uploaded_files[i]), model_selected, backend,
+                                          variant, file_name=uploaded_files[i].name, geotransform=georef[0],
+                                          crs=georef[1], area_per_pixel=georef[2], scene_size=(height, width))
+
         # Display results row by row with download buttons
         with results_container:
-            # Display Original Image
-            st.markdown("**Original Image**")
-            col1, col2 = st.columns([3, 1])
-            with col1:
-                st.image(image, width=350)
-            with col2:
-                buffered = io.BytesIO()
-                image.save(buffered, format="PNG")
-                st.download_button(
-                    label="Download Original",
-                    data=buffered.getvalue(),
-                    file_name="original_image.png",
-                    mime="image/png"
-                )
+            for i, (uploaded_file, image, prediction) in enumerate(zip(uploaded_files, images, probabilities)):
+                if len(images) > 1:
+                    st.markdown(f"#### {uploaded_file.name}")
+                cascade_stats = st.session_state.get(f"cascade_{keys[i]}") if tiled and cascade else None
+                if cascade_stats:
+                    st.caption(f"Cascade refined {cascade_stats['refined']} of {cascade_stats['tiles']} tiles "
+                               f"({cascade_stats['refined_fraction']:.0%}) in {cascade_stats['seconds']:.1f}s, "
+                               f"an estimated {cascade_stats['estimated_speedup']:.1f}x faster than full tiling "
+                               f"(extrapolated from the time per refined tile)")
+                disagreement = None
+                if ensemble:
+                    prediction, disagreement = split_ensemble(prediction)
+                display_result(uploaded_file.name, image, prediction, threshold, opacity, key=i,
+                               disagreement=disagreement, source=uploaded_file.getvalue(),
+                               result_key=keys[i], encoding=encoding, georef=georefs[i])
 
-            # Display Segmentation Mask
-            st.markdown("**Segmentation Mask**")
-            col1, col2 = st.columns([3, 1])
-            with col1:
-                st.image(colored_mask, width=350)
-            with col2:
-                buffered = io.BytesIO()
-                colored_mask.save(buffered, format="PNG")
-                st.download_button(
-                    label="Download Mask",
-                    data=buffered.getvalue(),
-                    file_name="segmentation_mask.png",
-                    mime="image/png"
-                )
+def preview_size(height, width):
+    # (width, height) of the on-page preview of a large scene
+    scale = PREVIEW_PX / max(height, width)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def scene_georef(image):
+    # (geotransform, crs, pixel area) of a georeferenced raster, None for other uploads
+    if getattr(image, "geotransform", None) is None:
+        return None
+    return image.geotransform, image.crs, pixel_area(image)
+
+def load_upload(uploaded_file):
+    # TIFF uploads stay windowed rasters, everything else is decoded to RGB
+    if uploaded_file.name.lower().endswith(TIFF_EXTENSIONS):
+        return open_raster(uploaded_file)
+    image = Image.open(uploaded_file)
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+def change_detection_section(model, model_name, backend, variant=""):
+    st.markdown("Upload two co-registered acquisitions of the same area to map where water appeared or receded.")
+    col1, col2 = st.columns(2)
+    with col1:
+        before_file = st.file_uploader("Before:", type=["jpg", "jpeg", "png", "tif", "tiff"], key="change_before")
+    with col2:
+        after_file = st.file_uploader("After:", type=["jpg", "jpeg", "png", "tif", "tiff"], key="change_after")
+
+    with st.expander("Tiling options"):
+        tile_overlap = st.slider("Tile overlap (px)", 0, 128, TILE_OVERLAP, step=8, key="change_overlap")
+        tile_batch_size = st.slider("Tiles per batch", 1, 32, TILE_BATCH_SIZE, key="change_batch")
+    threshold = st.slider("Water probability threshold", 0.05, 0.95, 0.5, step=0.05, key="change_threshold")
+    opacity = st.slider("Overlay opacity", 0.0, 1.0, 0.5, step=0.05, key="change_opacity")
+
+    if before_file is None or after_file is None or model is None:
+        return
+
+    with stage("decode"):
+        before, after = load_upload(before_file), load_upload(after_file)
+
+    # Tiles identical to ones segmented before (e.g. the earlier date) come from the cache
+    try:
+        with st.spinner('Detecting changes...'):
+            change, stats = detect_changes(model, before, after, model_name, backend, threshold, variant,
+                                           overlap=tile_overlap, batch_size=tile_batch_size,
+                                           area_per_pixel=pixel_area(after))
+    except ServerBusy:
+        st.error("The inference server is busy, please try again in a moment.")
+        return
+    except ValueError as e:
+        st.error(str(e))
+        return
+
+    st.subheader("Water Change Results")
+    height, width = change.shape
+    if max(height, width) > LARGE_SCENE_PX:
+        # Large scenes are shown as a downsampled preview, the full-resolution map is a download
+        step = -(-max(height, width) // PREVIEW_PX)
+        shown = change[::step, ::step]
+        background = resize_scene(after, (shown.shape[1], shown.shape[0]))
+    else:
+        shown, background = change, np.asarray(to_rgb_array(after)[0:height, 0:width])
+    st.image(change_visualization(shown, background, opacity), width=700)
+    st.caption("Blue: permanent water, green: water gain, red: water loss")
+
+    # Encoded on request only, then memoized per image pair and settings
+    memo_key = (content_hash(before_file), content_hash(after_file), model_name, backend, variant, threshold,
+                tile_overlap, "change_map")
+    if st.session_state.get("change_map_prepared") == memo_key:
+        stem = after_file.name.rsplit(".", 1)[0]
+        st.download_button(
+            label="Download Change Map (PNG)",
+            data=encoded_cache.get_or_encode(memo_key, lambda: encode_change_map(change)),
+            file_name=f"{stem}_water_change.png",
+            mime="image/png",
+            key="change_map"
+        )
+    elif st.button("Prepare change map download"):
+        st.session_state["change_map_prepared"] = memo_key
+        st.rerun()
+
+    # Areas in km² for georeferenced rasters in metres, otherwise in pixels
+    if "gain_area" in stats:
+        unit, scale, suffix = "area", 1e-6, " km²"
+    else:
+        unit, scale, suffix = "px", 1, " px"
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Water before", f"{stats[f'before_water_{unit}'] * scale:,.2f}{suffix}")
+    col2.metric("Water after", f"{stats[f'after_water_{unit}'] * scale:,.2f}{suffix}",
+                delta=f"{stats[f'net_{unit}'] * scale:,.2f}{suffix}")
+    col3.metric("Gain", f"{stats[f'gain_{unit}'] * scale:,.2f}{suffix}")
+    col4.metric("Loss", f"{stats[f'loss_{unit}'] * scale:,.2f}{suffix}")
+    tiles = stats["tiles_predicted"] + stats["tiles_reused"]
+    st.caption(f"{stats['changed_fraction']:.2%} of pixels changed; "
+               f"{stats['tiles_reused']} of {tiles} tiles reused from earlier results")
+
+def sequence_section(model):
+    st.markdown("Upload drone or camera footage to track water coverage frame by frame.")
+    video_file = st.file_uploader("Upload Video:", type=[extension[1:] for extension in VIDEO_EXTENSIONS])
+    step = st.slider("Process every n-th frame", 1, 30, 1)
+    change_threshold = st.slider("Reuse prediction below frame change", 0.0, 0.1, CHANGE_THRESHOLD, step=0.005,
+                                 format="%.3f", help="Frames that barely changed reuse the last prediction. 0 disables.")
+    threshold = st.slider("Water probability threshold", 0.05, 0.95, 0.5, step=0.05, key="sequence_threshold")
+    write_overlay = st.checkbox("Create overlay video")
+    opacity = st.slider("Overlay opacity", 0.0, 1.0, 0.3, step=0.05, key="sequence_opacity") if write_overlay else 0.3
 
-            # Display Overlay Result
-            st.markdown("**Overlay Result**")
-            col1, col2 = st.columns([3, 1])
-            with col1:
-                st.image(overlay_image, width=350)
-            with col2:
-                buffered = io.BytesIO()
-                overlay_image.save(buffered, format="PNG")
+    if video_file is None or model is None:
+        return
+    settings = (content_hash(video_file), step, change_threshold, threshold, write_overlay, opacity)
+    result = st.session_state.get("sequence_result")
+    if result is None or result["settings"] != settings:
+        if not st.button("Process video"):
+            return
+        # OpenCV reads videos from disk only
+        suffix = os.path.splitext(video_file.name)[1]
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, f"input{suffix}")
+            with open(source, "wb") as f:
+                f.write(video_file.getvalue())
+            overlay_path = os.path.join(directory, "overlay.mp4") if write_overlay else None
+            progress = st.progress(0.0)
+            total = max(1, frame_count(source) // step)
+            try:
+                rows, summary = run_sequence(model, source, overlay_path, step, change_threshold=change_threshold,
+                                             threshold=threshold, opacity=opacity,
+                                             progress=lambda done: progress.progress(min(1.0, done / total)))
+            except ServerBusy:
+                st.error("The inference server is busy, please try again in a moment.")
+                return
+            except ValueError as e:
+                st.error(str(e))
+                return
+            overlay = None
+            if overlay_path:
+                with open(overlay_path, "rb") as f:
+                    overlay = f.read()
+        result = st.session_state["sequence_result"] = {
+            "settings": settings, "rows": rows, "summary": summary, "overlay": overlay
+        }
+
+    summary = result["summary"]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Frames", summary["frames"])
+    col2.metric("Inferred", summary["inferred"], delta=f"-{summary['reused']} reused", delta_color="off")
+    col3.metric("Frames / s", f"{summary['frames_per_sec']:.1f}",
+                delta=f"{summary['realtime_factor']:.2f}x real time" if summary["realtime_factor"] else None,
+                delta_color="off")
+    st.line_chart({"water fraction": [row["water_fraction"] for row in result["rows"]]})
+    if result["overlay"] is not None:
+        stem = video_file.name.rsplit(".", 1)[0]
+        st.download_button("Download Overlay Video", data=result["overlay"], file_name=f"{stem}_overlay.mp4",
+                           mime="video/mp4", key="sequence_overlay")
+
+def history_section():
+    store = get_result_store()
+    if store is None:
+        st.info("The result history is disabled, set AQUASENSE_RESULT_STORE_DIR to a directory to enable it.")
+        return
+
+    col1, col2 = st.columns(2)
+    days = col1.number_input("Runs from the last days", 1, 3650, 30)
+    model_filter = col2.selectbox("Model", ["Any", "U-Net", "DeepLabV3+", ENSEMBLE_NAME])
+    col1, col2 = st.columns([3, 1])
+    area = col1.text_input("Area (min x, min y, max x, max y)",
+                           help="Only georeferenced runs intersecting this area are listed. Leave empty for all runs.")
+    area_crs = col2.text_input("Area CRS", placeholder="EPSG:32633",
+                               help="The CRS the area is given in; only runs stored in this CRS are matched.")
+    bounds = crs = None
+    if area.strip():
+        try:
+            bounds = [float(value) for value in area.split(",")]
+        except ValueError:
+            bounds = []
+        if len(bounds) != 4:
+            st.error("Enter the area as four comma-separated numbers.")
+            return
+        crs = area_crs.strip()
+        if not crs:
+            st.error("Enter the CRS the area is given in.")
+            return
+
+    runs = store.query(bounds=bounds, crs=crs, since=time.time() - days * DAY_S,
+                       model_name=None if model_filter == "Any" else model_filter, limit=500)
+    if not runs:
+        st.info("No saved runs match these filters.")
+        return
+    st.dataframe([{
+        "id": run["id"],
+        "time": datetime.fromtimestamp(run["created"]).strftime("%Y-%m-%d %H:%M"),
+        "file": run["file_name"],
+        "model": run["model"],
+        "backend": run["backend"],
+        "size": f"{run['scene_width']}x{run['scene_height']}",
+        "water %": round(run["water_fraction"] * 100, 2),
+        "water area": run["water_area"],
+        "crs": run["crs"]
+    } for run in runs], use_container_width=True, hide_index=True)
+
+    labels = {run["id"]: f"#{run['id']} {run['file_name'] or run['image_hash'][:12]} ({run['model']})" for run in runs}
+    run_id = st.selectbox("Show run", list(labels), format_func=labels.get)
+    run = next(run for run in runs if run["id"] == run_id)
+    threshold = st.slider("Water probability threshold", 0.05, 0.95, run["threshold"], step=0.05,
+                          key="history_threshold", disabled=run["kind"] != "probabilities")
+
+    # The stored array is memory-mapped; only the rows of the downsampled preview are read
+    array = store.load(run_id)
+    water = array if array.ndim == 2 else array[..., 0]
+    step = max(1, max(run["height"], run["width"]) // 1024)
+    preview = water[::step, ::step] > (threshold if run["kind"] == "probabilities" else 0)
+    colored = np.zeros((*preview.shape, 3), dtype=np.uint8)
+    colored[preview] = WATER_COLOR
+    st.image(colored, caption=f"Run #{run_id}: {np.count_nonzero(preview) / preview.size:.1%} water", width=512)
+
+    others = [other for other in labels if other != run_id]
+    compare_id = st.selectbox("Compare with", [None, *others], format_func=lambda i: "None" if i is None else labels[i])
+    if compare_id is not None:
+        try:
+            comparison = store.compare(compare_id, run_id)
+        except ValueError as e:
+            st.warning(str(e))
+        else:
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Water IoU", f"{comparison['iou']:.3f}")
+            col2.metric("Water gained (px)", comparison["gain_pixels"])
+            col3.metric("Water lost (px)", comparison["loss_pixels"])
+
+def display_result(file_name, image, prediction, threshold=0.5, opacity=0.3, key=0, disagreement=None,
+                   source=None, result_key=None, encoding=None, georef=None):
+    stem, extension = file_name.rsplit(".", 1) if "." in file_name else (file_name, "png")
+    encoding = encoding or {"codec": "png", "level": DEFAULT_PNG_LEVEL, "quality": DEFAULT_QUALITY}
+    codec = encoding["codec"]
+    overlay_extension, overlay_mime = IMAGE_CODECS[codec]
+
+    # PIL uploads are decoded already, rasters are read window by window
+    scene = to_rgb_array(image)
+    height, width = scene.shape[:2]
+    large = max(height, width) > LARGE_SCENE_PX
+    if large:
+        # Large scenes are shown as a downsampled preview; downloads and statistics stay full resolution
+        preview = resize_scene(scene, preview_size(height, width))
+        shown = prediction
+        if max(np.shape(prediction)[:2]) > PREVIEW_PX:
+            step = -(-max(height, width) // PREVIEW_PX)
+            shown = prediction[::step, ::step]
+    else:
+        preview, shown = np.asarray(scene[0:height, 0:width]), prediction
+
+    # Create visualizations in a single rendering pass
+    mask, colored_mask, overlay_image = render_results(preview, shown, threshold, opacity)
+
+    # Downloads are encoded on request only, then memoized per result and settings
+    memo_key = (result_key or file_name, threshold, opacity)
+    original_name = f"{stem}_original_image.{extension}"
+    mask_name = f"{stem}_segmentation_mask.png"
+    overlay_name = f"{stem}_overlay_result{overlay_extension}"
+    polygons_name = f"{stem}_water_polygons.geojson"
+
+    def scene_mask():
+        # Full-resolution water mask, packed 8 pixels per byte and memoized per result and threshold
+        return encoded_cache.get_or_encode(
+            (result_key or file_name, threshold, "scene_mask"),
+            lambda: PackedMask.from_strips((height, width), scene_mask_strips(prediction, (height, width), threshold))
+        )
+
+    def water_bodies():
+        # Per water body statistics, in map units for georeferenced uploads. Labelling the full-resolution
+        # mask is slow, so it runs on request only and is memoized per result and threshold
+        area_per_pixel = georef[2] if georef else None
+        return encoded_cache.get_or_encode(
+            (result_key or file_name, threshold, "bodies", area_per_pixel),
+            lambda: analyze_mask(scene_mask(), area_per_pixel=area_per_pixel)
+        )
+
+    def original_bytes():
+        # The upload is offered as-is, no need to re-encode it
+        if source is not None:
+            return source
+        return encoded_cache.get_or_encode((memo_key, "original"), lambda: encode_image(scene[0:height, 0:width]))
+
+    def full_overlay():
+        # Only the preview is rendered up front for large scenes, the download is rendered band by band
+        return render_overlay(scene, scene_mask().strips(), opacity) if large else overlay_image
+
+    def mask_bytes():
+        return encoded_cache.get_or_encode((memo_key, "mask", encoding["level"]),
+                                           lambda: encode_mask(scene_mask(), encoding["level"]))
+
+    def overlay_bytes():
+        return encoded_cache.get_or_encode((memo_key, "overlay", codec, encoding["level"], encoding["quality"]),
+                                           lambda: encode_image(full_overlay(), **encoding))
+
+    def polygons_bytes():
+        # Vector water bodies, in map coordinates when the upload is a GeoTIFF
+        geotransform, crs, _ = georef or (None, None, None)
+        return encoded_cache.get_or_encode(
+            (memo_key, "polygons"),
+            lambda: dumps(mask_to_geojson(scene_mask(), geotransform=geotransform, crs=crs)).encode("utf-8")
+        )
+
+    def bodies_bytes():
+        return encoded_cache.get_or_encode((memo_key, "bodies"), lambda: to_csv(water_bodies()).encode("utf-8"))
+
+    def bundle_bytes():
+        # The archive is streamed to the disk tier once per result and encoding, not rebuilt on every rerun
+        return encoded_cache.get_or_stream(
+            (memo_key, "bundle", codec, encoding["level"], encoding["quality"]),
+            lambda: stream_zip([
+                (original_name, original_bytes),
+                (mask_name, mask_bytes),
+                (overlay_name, overlay_bytes),
+                (polygons_name, polygons_bytes),
+                (f"{stem}_water_bodies.csv", bodies_bytes)
+            ])
+        )
+
+    prepared_key = f"downloads_{result_key or key}"
+    prepared = st.session_state.get(prepared_key, False)
+
+    # Display Original Image
+    st.markdown("**Original Image**")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.image(preview, width=350)
+    with col2:
+        st.download_button(
+            label="Download Original",
+            data=original_bytes(),
+            file_name=original_name if source is not None else f"{stem}_original_image.png",
+            key=f"original_{key}"
+        )
+
+    # Display Segmentation Mask
+    st.markdown("**Segmentation Mask**")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.image(colored_mask, width=350)
+    with col2:
+        if prepared:
+            st.download_button(
+                label="Download Mask",
+                data=mask_bytes(),
+                file_name=mask_name,
+                mime="image/png",
+                key=f"mask_{key}"
+            )
+        elif st.button("Prepare downloads", key=f"prepare_{key}"):
+            st.session_state[prepared_key] = True
+            st.rerun()
+
+    # Display Overlay Result
+    st.markdown("**Overlay Result**")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.image(overlay_image, width=350)
+    with col2:
+        if prepared:
+            st.download_button(
+                label="Download Overlay",
+                data=overlay_bytes(),
+                file_name=overlay_name,
+                mime=overlay_mime,
+                key=f"overlay_{key}"
+            )
+            st.download_button(
+                label="Download Polygons (GeoJSON)",
+                data=polygons_bytes(),
+                file_name=polygons_name,
+                mime="application/geo+json",
+                key=f"polygons_{key}"
+            )
+            st.download_button(
+                label="Download All (ZIP)",
+                data=bundle_bytes(),
+                file_name=f"{stem}_results.zip",
+                mime="application/zip",
+                key=f"bundle_{key}"
+            )
+
+    # Display Model Disagreement
+    if disagreement is not None:
+        st.markdown("**Model Disagreement**")
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.image(disagreement_visualization(disagreement, (preview.shape[1], preview.shape[0])), width=350)
+        with col2:
+            st.metric("Mean disagreement", f"{float(np.mean(disagreement)):.3f}")
+
+    # Large scenes get a zoomable viewer that only renders and sends the visible tiles,
+    # read from the raster window by window
+    if large:
+        with st.expander("Zoomable viewer"):
+            tile_viewer(TilePyramid(result_key or file_name, scene, prediction, threshold, opacity), key)
+
+    # Display Water Body Statistics, computed for the threshold they were requested at so
+    # threshold changes keep re-rendering from the cached probabilities only
+    bodies_key = f"bodies_{result_key or key}"
+    with st.expander("Water bodies"):
+        if st.session_state.get(bodies_key) != threshold:
+            if st.button("Analyze water bodies", key=f"analyze_{key}"):
+                st.session_state[bodies_key] = threshold
+                st.rerun()
+        else:
+            bodies = water_bodies()
+            summary = summarize(bodies)
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Water bodies", f"{summary['count']:,}")
+            col2.metric("Largest (px)", f"{summary['largest_area_px']:,}")
+            col3.metric("Total water (px)", f"{summary['total_area_px']:,}")
+            if bodies:
+                st.dataframe(bodies, hide_index=True)
                 st.download_button(
-                    label="Download Overlay",
-                    data=buffered.getvalue(),
-                    file_name="overlay_result.png",
-                    mime="image/png"
+                    label="Download Table (CSV)",
+                    data=bodies_bytes(),
+                    file_name=f"{stem}_water_bodies.csv",
+                    mime="text/csv",
+                    key=f"bodies_{key}"
                 )
 
+def tile_viewer(pyramid, key):
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        layer = st.radio("Layer", LAYERS, key=f"tile_layer_{key}")
+        zoom = st.slider("Zoom", 0, pyramid.max_zoom, min(2, pyramid.max_zoom), key=f"tile_zoom_{key}")
+        center_x = st.slider("Pan horizontally", 0.0, 1.0, 0.5, key=f"tile_x_{key}")
+        center_y = st.slider("Pan vertically", 0.0, 1.0, 0.5, key=f"tile_y_{key}")
+    with col2:
+        view = pyramid.viewport(layer, zoom, center_x, center_y, *VIEWER_SIZE)
+        st.image(view, output_format="JPEG")
+    columns, rows = pyramid.tile_count(zoom)
+    cache_stats = get_tile_cache().stats()
+    st.caption(f"Zoom {zoom} of {pyramid.max_zoom}: {columns}x{rows} tiles of {PYRAMID_TILE_SIZE}px; "
+               f"tile cache {cache_stats['tiles']} tiles, {cache_stats['size_mb']:.1f} MB")
+
+# Sidebar panel with the rolling per-stage timings of this process. Collection is
+# process-wide and shared by every session, so it is only switched on by the environment
+def diagnostics_panel():
+    with st.sidebar.expander("Diagnostics"):
+        if not metrics.enabled:
+            st.caption("Stage timings are off; set AQUASENSE_METRICS=1 or AQUASENSE_METRICS_PORT to collect them.")
+            return
+        summary = metrics.summary()
+        if summary:
+            st.table([
+                {
+                    "stage": name,
+                    "count": stats["count"],
+                    "p50 ms": round(stats["p50_ms"], 1),
+                    "p99 ms": round(stats["p99_ms"], 1),
+                    "max RSS +MB": round(stats["rss_delta_max_mb"], 1)
+                }
+                for name, stats in summary.items()
+            ])
+        else:
+            st.caption("No measurements yet.")
+        if st.button("Reset timings"):
+            metrics.reset()
+
 # Function for U-Net Model Description Page
 def unet_page():
     st.header("U-Net Model")
@@ -1,63 +1,124 @@
 import io
+import os
 import numpy as np
 import cv2
 from PIL import Image
-import tensorflow as tf
-from tensorflow.keras.models import load_model, Sequential
-from tensorflow.keras.layers import Conv2D, BatchNormalization, ReLU, Conv2DTranspose
+from instrumentation import stage, timed
 
 IMG_SIZE = 256
+BATCH_SIZE = 16
+
+MODEL_PATHS = {
+    "U-Net": './Model/unet.keras',
+    "DeepLabV3+": './Model/deeplabv3+.h5'
+}
+
+# Inference backends and the file suffix of their exported models (see export_models.py)
+BACKENDS = {
+    "keras": None,
+    "tflite": ".tflite",
+    "tflite-fp16": "_fp16.tflite",
+    "tflite-int8": "_int8.tflite",
+    "compiled": None,
+    "compiled-xla": None,
+    "compiled-bf16": None
+}
+# Keras backends run through backends.CompiledModel with these options
+COMPILED_BACKENDS = {
+    "compiled": {"jit_compile": False, "precision": "float32"},
+    "compiled-xla": {"jit_compile": True, "precision": "float32"},
+    # No jit_compile: XLA's CPU backend upcasts bfloat16 ops to float32, which made this the
+    # same computation as compiled-xla. As a plain tf.function the layers do run in bfloat16
+    "compiled-bf16": {"jit_compile": False, "precision": "bfloat16"}
+}
+DEFAULT_BACKEND = os.environ.get("AQUASENSE_BACKEND", "keras")
+
+# TensorFlow is only imported when a model is loaded, so pages without inference start fast
+
+def model_file(model_name, backend="keras"):
+    path = MODEL_PATHS[model_name]
+    if BACKENDS[backend] is None:
+        return path
+    return os.path.splitext(path)[0] + BACKENDS[backend]
+
+def available_backends(model_name):
+    return [backend for backend in BACKENDS if BACKENDS[backend] is None or os.path.exists(model_file(model_name, backend))]
+
+def load_keras_model(model_name, backend="keras"):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    if BACKENDS[backend] is not None:
+        from backends import TFLiteModel
+        try:
+            return TFLiteModel(model_file(model_name, backend))
+        except Exception as e:
+            raise RuntimeError(f"Error loading {backend} model: {str(e)}")
+
+    from tensorflow.keras.models import load_model
+    from custom_layers import ConvBlock
 
-class ConvBlock(tf.keras.layers.Layer):
-    def __init__(self, filters=512, kernel_size=3, dilation_rate=1, **kwargs):
-        super(ConvBlock, self).__init__(**kwargs)
-        self.filters = filters
-        self.kernel_size = kernel_size
-        self.dilation_rate = dilation_rate
-        self.net = Sequential([
-            Conv2D(filters, kernel_size, padding='same', dilation_rate=dilation_rate, activation=None, use_bias=False),
-            BatchNormalization(),
-            ReLU()
-        ])
-
-    def call(self, inputs):
-        return self.net(inputs)
-
-    def get_config(self):
-        config = super().get_config()
-        config.update({
-            'filters': self.filters,
-            'kernel_size': self.kernel_size,
-            'dilation_rate': self.dilation_rate
-        })
-        return config
-
-def load_keras_model(model_name):
     custom_objects = {"ConvBlock": ConvBlock}
     try:
         if model_name == "U-Net":
-            return load_model('./Model/unet.keras', compile=False)
+            model = load_model(MODEL_PATHS["U-Net"], compile=False)
         else:  # DeepLabV3+
-            return load_model('./Model/deeplabv3+.h5', custom_objects=custom_objects, compile=False)
+            model = load_model(MODEL_PATHS["DeepLabV3+"], custom_objects=custom_objects, compile=False)
     except Exception as e:
         raise RuntimeError(f"Error loading model: {str(e)}")
+    if backend in COMPILED_BACKENDS:
+        from backends import CompiledModel
+        return CompiledModel(model, **COMPILED_BACKENDS[backend])
+    return model
 
+@timed("preprocess")
 def preprocess_image(image):
     img_array = np.array(image)
     original_size = img_array.shape[:2]
     img_resized = cv2.resize(img_array, (IMG_SIZE, IMG_SIZE))
-    img_normalized = img_resized / 255.0
+    img_normalized = img_resized.astype(np.float32) * (1.0 / 255.0)
     img_batch = np.expand_dims(img_normalized, axis=0)
     return img_batch, original_size
 
-def postprocess_prediction(prediction, original_size):
-    threshold = 0.5
+@timed("preprocess")
+def preprocess_batch(images):
+    # Resize every image straight into one contiguous float32 batch
+    batch = np.empty((len(images), IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+    original_sizes = []
+    for i, image in enumerate(images):
+        img_array = np.asarray(image)
+        if img_array.ndim == 2:
+            img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
+        original_sizes.append(img_array.shape[:2])
+        batch[i] = cv2.resize(img_array[..., :3], (IMG_SIZE, IMG_SIZE))
+    batch *= 1.0 / 255.0
+    return batch, original_sizes
+
+def postprocess_batch(predictions, original_sizes):
+    return [postprocess_prediction(prediction, size) for prediction, size in zip(predictions, original_sizes)]
+
+def predict_probabilities_batch(model, images, batch_size=BATCH_SIZE):
+    # Single batched predict for N images, returns the raw probability maps
+    batch, original_sizes = preprocess_batch(images)
+    with stage("predict"):
+        predictions = model.predict(batch, batch_size=batch_size, verbose=0)
+    return predictions, original_sizes
+
+def predict_batch(model, images, batch_size=BATCH_SIZE):
+    # Returns one mask image per input
+    if len(images) == 0:
+        return []
+    predictions, original_sizes = predict_probabilities_batch(model, images, batch_size)
+    return postprocess_batch(predictions, original_sizes)
+
+@timed("postprocess")
+def postprocess_prediction(prediction, original_size, threshold=0.5):
     binary_mask = (prediction > threshold).astype(np.uint8)
     binary_mask = np.squeeze(binary_mask)
     mask_resized = cv2.resize(binary_mask, (original_size[1], original_size[0]))
     mask_image = Image.fromarray(mask_resized * 255)
     return mask_image
 
+@timed("overlay")
 def create_overlay(original_image, mask_image, opacity=0.3):
     original_array = np.array(original_image)
     mask_array = np.array(mask_image)
@@ -67,6 +128,7 @@ def create_overlay(original_image, mask_image, opacity=0.3):
     blended = cv2.addWeighted(original_array, 1-opacity, overlay, opacity, 0)
     return Image.fromarray(blended)
 
+@timed("mask_visualization")
 def create_mask_visualization(mask_image):
     mask_array = np.array(mask_image)
     colored_mask = np.zeros((*mask_array.shape, 3), dtype=np.uint8)
@@ -0,0 +1,199 @@
+import argparse
+import json
+import sys
+import numpy as np
+import cv2
+from instrumentation import stage
+
+# Simplification tolerance and filters, in pixels
+SIMPLIFY_TOLERANCE = 1.0
+MIN_ISLAND_AREA = 16
+MIN_HOLE_AREA = 16
+STRIP_ROWS = 1024
+
+
+def to_mask_array(mask, threshold=0.5):
+    # PIL masks, uint8 masks, PackedMasks and probability maps to a 0/1 uint8 array
+    if hasattr(mask, "to_array"):
+        return mask.to_array()
+    mask = np.asarray(mask)
+    if mask.dtype.kind == "f":
+        if mask.ndim == 3:
+            mask = mask[..., 0]  # multi-channel outputs carry the water probability first
+        return (mask > threshold).astype(np.uint8)
+    return (mask > 0).astype(np.uint8)
+
+
+def iter_mask_strips(mask, rows=STRIP_ROWS, threshold=0.5):
+    # Splits an in-memory mask into (row_offset, strip) pieces, the shape vectorize_strips consumes
+    if hasattr(mask, "strips"):
+        yield from mask.strips(rows)
+        return
+    mask = to_mask_array(mask, threshold)
+    for y in range(0, mask.shape[0], rows):
+        yield y, mask[y:y + rows]
+
+
+def _ring(contour, offset, geotransform, clockwise):
+    # Contour points are pixel indices; rings go through pixel centres
+    points = contour.reshape(-1, 2).astype(np.float64) + (offset[0] + 0.5, offset[1] + 0.5)
+    if geotransform is not None:
+        x0, dx, rx, y0, ry, dy = geotransform
+        points = np.column_stack((x0 + points[:, 0] * dx + points[:, 1] * rx,
+                                  y0 + points[:, 0] * ry + points[:, 1] * dy))
+    # GeoJSON wants counterclockwise outer rings and clockwise holes
+    x, y = points[:, 0], points[:, 1]
+    signed_area = np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))
+    if (signed_area < 0) != clockwise:
+        points = points[::-1]
+    points = np.vstack((points, points[:1]))
+    return points.tolist()
+
+
+def _polygons(mask, offset, tolerance, min_area, min_hole_area, geotransform):
+    # Outer boundaries with their holes; islands inside holes come back as separate outers
+    contours, hierarchy = cv2.findContours(mask, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    if hierarchy is None:
+        return []
+    hierarchy = hierarchy[0]
+    area_scale = abs(geotransform[1] * geotransform[5] - geotransform[2] * geotransform[4]) if geotransform else 1.0
+    features = []
+    for i, contour in enumerate(contours):
+        if hierarchy[i][3] != -1:
+            continue
+        area = cv2.contourArea(contour)
+        if area < min_area:
+            continue
+        outer = cv2.approxPolyDP(contour, tolerance, True) if tolerance > 0 else contour
+        if len(outer) < 3:
+            continue
+        rings = [_ring(outer, offset, geotransform, clockwise=False)]
+        child = hierarchy[i][2]
+        while child != -1:
+            hole_area = cv2.contourArea(contours[child])
+            hole = cv2.approxPolyDP(contours[child], tolerance, True) if tolerance > 0 else contours[child]
+            if hole_area >= min_hole_area and len(hole) >= 3:
+                rings.append(_ring(hole, offset, geotransform, clockwise=True))
+                area -= hole_area
+            child = hierarchy[child][0]
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": rings},
+            "properties": {"area": area * area_scale}
+        })
+    return features
+
+
+def vectorize_strips(strips, tolerance=SIMPLIFY_TOLERANCE, min_area=MIN_ISLAND_AREA,
+                     min_hole_area=MIN_HOLE_AREA, geotransform=None, threshold=0.5, min_rows=STRIP_ROWS):
+    """Yield GeoJSON polygon features for (row_offset, strip) pieces of a mask, top to bottom.
+
+    Water bodies that touch the bottom of the rows seen so far are carried into
+    the next step, so every polygon is traced once and whole, with no seams.
+    Memory holds only the rows spanned by water bodies that are still open.
+    """
+    carry = None
+    carry_top = 0
+    pending = []
+    pending_rows = 0
+    for y, strip in strips:
+        strip = to_mask_array(strip, threshold)
+        if carry is None:
+            carry, carry_top = strip[:0], y
+        pending.append(strip)
+        pending_rows += len(strip)
+        # Waiting for at least as many new rows as are carried keeps relabeling linear
+        # even when a river spans the whole scene
+        if pending_rows < max(min_rows, len(carry)):
+            continue
+        carry, carry_top = yield from _vectorize_step(np.vstack([carry, *pending]), carry_top, tolerance,
+                                                      min_area, min_hole_area, geotransform)
+        pending = []
+        pending_rows = 0
+
+    if carry is not None:
+        rows = np.vstack([carry, *pending])
+        if rows.size:
+            with stage("vectorize"):
+                yield from _polygons(rows, (0, carry_top), tolerance, min_area, min_hole_area, geotransform)
+
+
+def _vectorize_step(rows, top, tolerance, min_area, min_hole_area, geotransform):
+    # Emits the water bodies that end above the last row, returns the rows still open
+    with stage("vectorize"):
+        count, labels = cv2.connectedComponents(rows, connectivity=8)
+        # Lookup table from label to "touches the last row"
+        is_open = np.zeros(count, dtype=np.uint8)
+        is_open[labels[-1]] = 1
+        is_open[0] = 0
+        open_mask = is_open[labels]
+        closed = rows & (open_mask ^ 1)
+        features = _polygons(closed, (0, top), tolerance, min_area, min_hole_area, geotransform)
+    yield from features
+
+    open_rows = np.flatnonzero(open_mask.any(axis=1))
+    if not len(open_rows):
+        return rows[:0], top + len(rows)
+    keep_from = int(open_rows[0])
+    return open_mask[keep_from:], top + keep_from
+
+
+def mask_to_geojson(mask, tolerance=SIMPLIFY_TOLERANCE, min_area=MIN_ISLAND_AREA, min_hole_area=MIN_HOLE_AREA,
+                    geotransform=None, crs=None, threshold=0.5):
+    # Whole-mask convenience wrapper, returns the FeatureCollection as a dict
+    features = vectorize_strips(iter_mask_strips(mask, threshold=threshold), tolerance, min_area,
+                                min_hole_area, geotransform)
+    return feature_collection(features, crs if geotransform is not None else None)
+
+
+def feature_collection(features, crs=None):
+    collection = {"type": "FeatureCollection", "features": list(features)}
+    if crs:
+        # RFC 7946 assumes WGS 84; the legacy crs member keeps projected outputs readable by GIS tools
+        collection["crs"] = {"type": "name", "properties": {"name": crs}}
+    return collection
+
+
+def dumps(collection):
+    return json.dumps(collection, separators=(",", ":"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Segment a scene tile by tile and write water polygons as GeoJSON.")
+    parser.add_argument("input", help="Image or GeoTIFF scene")
+    parser.add_argument("output", help="GeoJSON file to write")
+    parser.add_argument("--model", default="U-Net")
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--tolerance", type=float, default=SIMPLIFY_TOLERANCE, help="Simplification tolerance in pixels")
+    parser.add_argument("--min-area", type=float, default=MIN_ISLAND_AREA, help="Drop water bodies smaller than this (pixels)")
+    parser.add_argument("--min-hole-area", type=float, default=MIN_HOLE_AREA, help="Fill holes smaller than this (pixels)")
+    parser.add_argument("--processes", type=int, default=0, help="Predict tiles in this many worker processes")
+    parser.add_argument("--cores-per-worker", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    from process_pool import CORES_PER_WORKER, load_model
+    from raster_io import open_raster
+    from tiling import iter_tiled_probabilities
+    from utils import DEFAULT_BACKEND
+
+    model, pool = load_model(args.model, args.backend or DEFAULT_BACKEND, args.processes,
+                             args.cores_per_worker or CORES_PER_WORKER)
+    try:
+        with open_raster(args.input) as raster:
+            # Probability strips stream straight into the vectorizer, the scene mask is never held whole
+            strips = iter_tiled_probabilities(model, raster)
+            features = vectorize_strips(strips, args.tolerance, args.min_area, args.min_hole_area,
+                                        raster.geotransform, args.threshold)
+            collection = feature_collection(features, raster.crs if raster.geotransform else None)
+    finally:
+        if pool is not None:
+            pool.close()
+    with open(args.output, "w") as f:
+        f.write(dumps(collection))
+    print(f"Wrote {len(collection['features'])} polygons to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+import argparse
+import csv
+import io
+import math
+import sys
+import numpy as np
+import cv2
+from instrumentation import stage
+from vectorize import iter_mask_strips, to_mask_array
+
+CSV_COLUMNS = ["id", "area_px", "perimeter_px", "x_min", "y_min", "x_max", "y_max", "centroid_x", "centroid_y"]
+
+
+def _boundary_edges(strip):
+    # Pixel edges between water and land; the strip border counts as land and is corrected at seams
+    neighbours = np.zeros(strip.shape, dtype=np.uint8)
+    neighbours[1:] += strip[:-1]
+    neighbours[:-1] += strip[1:]
+    neighbours[:, 1:] += strip[:, :-1]
+    neighbours[:, :-1] += strip[:, 1:]
+    return (4 - neighbours) * strip
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = [0]
+
+    def add(self, count):
+        start = len(self.parent)
+        self.parent.extend(range(start, start + count))
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+    def roots(self):
+        parent = np.asarray(self.parent)
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                return parent
+            parent = grand
+
+
+def analyze_strips(strips, area_per_pixel=None, min_area=1, threshold=0.5):
+    """Per water body statistics for a mask streamed as (row_offset, strip) pieces.
+
+    Each strip is labelled on its own; components touching across strip
+    borders (8-connectivity) are merged with union-find, so only one strip of
+    pixels is in memory at a time. Returns rows sorted by area, largest first.
+    """
+    forest = _UnionFind()
+    parts = []  # per strip: global ids and their partial statistics
+    corrections = []  # perimeter counted twice where water continues across a seam
+    previous_row = None
+
+    for y, strip in strips:
+        strip = to_mask_array(strip, threshold)
+        if not strip.size:
+            continue
+        with stage("water_bodies"):
+            count, labels, stats, centroids = cv2.connectedComponentsWithStats(strip, connectivity=8)
+            base = len(forest.parent) - 1
+            forest.add(count - 1)
+            perimeter = np.bincount(labels.ravel(), weights=_boundary_edges(strip).ravel(), minlength=count)
+            area = stats[1:, cv2.CC_STAT_AREA].astype(np.float64)
+            left, top = stats[1:, cv2.CC_STAT_LEFT], stats[1:, cv2.CC_STAT_TOP] + y
+            parts.append((
+                np.arange(base + 1, base + count), area, perimeter[1:],
+                left, top, left + stats[1:, cv2.CC_STAT_WIDTH] - 1, top + stats[1:, cv2.CC_STAT_HEIGHT] - 1,
+                centroids[1:, 0] * area, (centroids[1:, 1] + y) * area
+            ))
+
+            first_row = np.where(labels[0] > 0, labels[0] + base, 0)
+            if previous_row is not None:
+                for dx in (-1, 0, 1):
+                    above = previous_row[max(dx, 0):len(previous_row) + min(dx, 0)]
+                    below = first_row[max(-dx, 0):len(first_row) + min(-dx, 0)]
+                    touching = (above > 0) & (below > 0)
+                    pairs = np.unique(np.stack((above[touching], below[touching]), axis=1), axis=0)
+                    for a, b in pairs:
+                        forest.union(int(a), int(b))
+                    if dx == 0 and touching.any():
+                        corrections.append(above[touching])
+            previous_row = np.where(labels[-1] > 0, labels[-1] + base, 0)
+
+    if not parts:
+        return []
+
+    with stage("water_bodies"):
+        roots = forest.roots()
+        ids, area, perimeter, x_min, y_min, x_max, y_max, cx, cy = (np.concatenate(column) for column in zip(*parts))
+        owner = roots[ids]
+        size = len(roots)
+        total_area = np.bincount(owner, weights=area, minlength=size)
+        total_perimeter = np.bincount(owner, weights=perimeter, minlength=size)
+        if corrections:
+            seam = roots[np.concatenate(corrections)]
+            total_perimeter -= 2 * np.bincount(seam, minlength=size)
+        bounds = [np.full(size, np.iinfo(np.int64).max), np.full(size, np.iinfo(np.int64).max),
+                  np.full(size, -1), np.full(size, -1)]
+        np.minimum.at(bounds[0], owner, x_min)
+        np.minimum.at(bounds[1], owner, y_min)
+        np.maximum.at(bounds[2], owner, x_max)
+        np.maximum.at(bounds[3], owner, y_max)
+        centroid_x = np.bincount(owner, weights=cx, minlength=size)
+        centroid_y = np.bincount(owner, weights=cy, minlength=size)
+
+        bodies = np.flatnonzero(total_area >= max(min_area, 1))
+        bodies = bodies[np.argsort(-total_area[bodies], kind="stable")]
+        side = math.sqrt(area_per_pixel) if area_per_pixel else None
+        rows = []
+        for number, root in enumerate(bodies, start=1):
+            row = {
+                "id": number,
+                "area_px": int(total_area[root]),
+                "perimeter_px": int(total_perimeter[root]),
+                "x_min": int(bounds[0][root]),
+                "y_min": int(bounds[1][root]),
+                "x_max": int(bounds[2][root]),
+                "y_max": int(bounds[3][root]),
+                "centroid_x": float(centroid_x[root] / total_area[root]),
+                "centroid_y": float(centroid_y[root] / total_area[root])
+            }
+            if area_per_pixel:
+                # Map units of a georeferenced raster with square pixels
+                row["area"] = row["area_px"] * area_per_pixel
+                row["perimeter"] = row["perimeter_px"] * side
+            rows.append(row)
+    return rows
+
+
+def analyze_mask(mask, area_per_pixel=None, min_area=1, threshold=0.5):
+    return analyze_strips(iter_mask_strips(mask, threshold=threshold), area_per_pixel, min_area)
+
+
+def summarize(bodies):
+    if not bodies:
+        return {"count": 0, "total_area_px": 0, "largest_area_px": 0, "largest_id": None}
+    return {
+        "count": len(bodies),
+        "total_area_px": sum(body["area_px"] for body in bodies),
+        "largest_area_px": bodies[0]["area_px"],
+        "largest_id": bodies[0]["id"]
+    }
+
+
+def to_csv(bodies):
+    columns = CSV_COLUMNS + [name for name in ("area", "perimeter") if bodies and name in bodies[0]]
+    buffered = io.StringIO()
+    writer = csv.DictWriter(buffered, fieldnames=columns, lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(bodies)
+    return buffered.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Segment a scene tile by tile and write per water body statistics as CSV.")
+    parser.add_argument("input", help="Image or GeoTIFF scene")
+    parser.add_argument("output", help="CSV file to write")
+    parser.add_argument("--model", default="U-Net")
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--min-area", type=int, default=1, help="Ignore water bodies smaller than this (pixels)")
+    parser.add_argument("--processes", type=int, default=0, help="Predict tiles in this many worker processes")
+    parser.add_argument("--cores-per-worker", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    from change_detection import pixel_area
+    from process_pool import CORES_PER_WORKER, load_model
+    from raster_io import open_raster
+    from tiling import iter_tiled_probabilities
+    from utils import DEFAULT_BACKEND
+
+    model, pool = load_model(args.model, args.backend or DEFAULT_BACKEND, args.processes,
+                             args.cores_per_worker or CORES_PER_WORKER)
+    try:
+        with open_raster(args.input) as raster:
+            strips = iter_tiled_probabilities(model, raster)
+            bodies = analyze_strips(strips, pixel_area(raster), args.min_area, args.threshold)
+    finally:
+        if pool is not None:
+            pool.close()
+    with open(args.output, "w", newline="") as f:
+        f.write(to_csv(bodies))
+    summary = summarize(bodies)
+    print(f"{summary['count']} water bodies, largest {summary['largest_area_px']} px, written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())